@@ -48,6 +48,7 @@ import desisurvey.rules
 import desisurvey.plan
 import desisurvey.scheduler
 import desisurvey.etc
+import desisurvey.snapshot
 import desisurvey.utils
 import datetime
 
@@ -85,18 +86,16 @@ class NTS():
                   self.night)
         else:
             self.night = night
-        self.rules = desisurvey.rules.Rules()
+        self.rules = desisurvey.rules.Rules(write_cache=True)
         # should look for rules file in obsplan dir?
+        self.history = desisurvey.snapshot.SnapshotHistory()
         try:
-            nightstr = self.night.isoformat()
-            self.planner = desisurvey.plan.Planner(
-                self.rules,
-                restore='planner_afternoon_{}.fits'.format(nightstr))
-            self.scheduler = desisurvey.scheduler.Scheduler(
-                restore='scheduler_{}.fits'.format(nightstr))
-        except:
-            raise ValueError('Error restoring scheduler & planner files; '
+            restore = self.history.read(self.night)
+        except ValueError:
+            raise ValueError('Error restoring scheduler & planner state; '
                              'has afternoon planning been performed?')
+        self.planner = desisurvey.plan.Planner(self.rules, restore=restore)
+        self.scheduler = desisurvey.scheduler.Scheduler(restore=restore)
         self.scheduler.update_tiles(self.planner.tile_available,
                                     self.planner.tile_priority)
         self.scheduler.init_night(self.night, use_twilight=True)
@@ -184,7 +183,7 @@ class NTS():
         maxtime = self.ETC.MAX_EXPTIME
         self.scheduler.update_snr(
             tileid, snr2frac_start + min([exptime, maxtime])/texp_tot)
-        self.scheduler.save('scheduler_{}.fits'.format(self.night.isoformat()))
+        self.history.save(self.night, self.planner, self.scheduler)
         if program is None:
             maxtime = min([maxtime, mjd_program_end-maxtime])
 
@@ -201,32 +200,36 @@ class NTS():
         return selection
 
 
-def afternoon_plan(night=None, lastnight=None):
+def afternoon_plan(night=None, lastnight=None, fits=False):
     """
     Perform daily afternoon planning.
 
     Afternoon planning identifies tiles available for observation and assigns
     priorities.  It must be performed before the NTS can identify new tiles to
-    observe.
+    observe.  The resulting state is recorded for this night in the
+    :class:`desisurvey.snapshot.SnapshotHistory`, which the NTS restores from.
 
     Params
     ------
     night : str, ISO 8601.  The night to plan.  Default tonight.
 
     lastnight : str, ISO 8601.  The previous planned night.  Used for restoring
-        the previous completion status of all tiles.  Defaults to not
-        restoring status, i.e., all previous tile completion information is
-        ignored!
+        the previous completion status of all tiles from the snapshot history.
+        Defaults to not restoring status, i.e., all previous tile completion
+        information is ignored!
+
+    fits : bool.  Also write the legacy planner_afternoon_<night>.fits and
+        scheduler_<night>.fits files.  These are not used by the NTS.
     """
     if night is None:
         night = datetime.date.today().isoformat()
-    rules = desisurvey.rules.Rules()
+    rules = desisurvey.rules.Rules(write_cache=True)
     # should look for rules file in obsplan dir?
+    history = desisurvey.snapshot.SnapshotHistory()
     if lastnight is not None:
-        planner = desisurvey.plan.Planner(
-            rules, restore='planner_end_{}.fits' % lastnight)
-        scheduler = desisurvey.scheduler.Scheduler(
-            restore='scheduler_end_{}.fits')
+        restore = history.read(lastnight)
+        planner = desisurvey.plan.Planner(rules, restore=restore)
+        scheduler = desisurvey.scheduler.Scheduler(restore=restore)
     else:
         planner = desisurvey.plan.Planner(rules)
         scheduler = desisurvey.scheduler.Scheduler()
@@ -242,8 +245,10 @@ def afternoon_plan(night=None, lastnight=None):
     # eventually we want this to be ~totally different, so while this isn't
     # really the behavior we'd want on the mountain, I'm leaving it until
     # we have something much different.
-    planner.save('planner_afternoon_{}.fits'.format(night))
-    scheduler.save('scheduler_{}.fits'.format(night))
+    history.save(night, planner, scheduler)
+    if fits:
+        planner.save('planner_afternoon_{}.fits'.format(night))
+        scheduler.save('scheduler_{}.fits'.format(night))
 
 
 if __name__ == "__main__":
@@ -257,6 +262,8 @@ if __name__ == "__main__":
     parser.add_argument('--lastnight', type=str,
                         help='night to restore, default: start fresh.',
                         default=None)
+    parser.add_argument('--fits', action='store_true',
+                        help='also write legacy per-night FITS files')
 
-    parser.parse_args()
-    afternoon_plan(parser.night, parser.lastnight)
+    args = parser.parse_args()
+    afternoon_plan(args.night, args.lastnight, args.fits)
@@ -7,13 +7,21 @@ associated with each effect.
 The following effects are included: seeing, transparency, galactic dust
 extinction, airmass, scattered moonlight.  The following effects are not yet
 implemented: twilight sky brightness, clouds, variable OH sky brightness.
+
+The scattered moonlight model can optionally be evaluated by interpolating
+a precomputed grid, which is selected with the ``moon_model`` config
+parameter.
 """
 from __future__ import print_function, division
 
+import os.path
+
 import numpy as np
 from itertools import chain, combinations_with_replacement
 
 import astropy.units as u
+import astropy.io.fits
+import astropy.utils.data
 
 import specsim.atmosphere
 
@@ -45,15 +53,7 @@ def seeing_exposure_factor(seeing):
         Multiplicative factor(s) that exposure time should be adjusted based
         on the actual vs nominal seeing.
     """
-    seeing = np.asarray(seeing)
-    if np.any(seeing <= 0):
-        raise ValueError('Got invalid seeing value <= 0.')
-    a, b, c = 12.95475751, -7.10892892, 1.21068726
-    f_seeing =  (a + b * seeing + c * seeing ** 2) ** -2
-    config = desisurvey.config.Configuration()
-    nominal = config.nominal_conditions.seeing().to(u.arcsec).value
-    f_nominal = (a + b * nominal + c * nominal ** 2) ** -2
-    return f_seeing / f_nominal
+    return get_exposure_model().seeing_exposure_factor(seeing)
 
 
 def transparency_exposure_factor(transparency):
@@ -72,12 +72,7 @@ def transparency_exposure_factor(transparency):
         Multiplicative factor(s) that exposure time should be adjusted based
         on the actual vs nominal transparency.
     """
-    transparency = np.asarray(transparency)
-    if np.any(transparency <= 0):
-        raise ValueError('Got invalid transparency value <= 0.')
-    config = desisurvey.config.Configuration()
-    nominal = config.nominal_conditions.transparency()
-    return nominal / transparency
+    return get_exposure_model().transparency_exposure_factor(transparency)
 
 
 def dust_exposure_factor(EBV):
@@ -97,11 +92,7 @@ def dust_exposure_factor(EBV):
         Multiplicative factor(s) that exposure time should be adjusted based
         on the actual vs nominal dust extinction.
     """
-    EBV = np.asarray(EBV)
-    config = desisurvey.config.Configuration()
-    EBV0 = config.nominal_conditions.EBV()
-    Ag = 3.303 * (EBV - EBV0)
-    return np.power(10.0, (2.0 * Ag / 2.5))
+    return get_exposure_model().dust_exposure_factor(EBV)
 
 
 def airmass_exposure_factor(airmass):
@@ -121,12 +112,7 @@ def airmass_exposure_factor(airmass):
         Multiplicative factor(s) that exposure time should be adjusted based
         on the actual vs nominal airmass.
     """
-    X = np.asarray(airmass)
-    if np.any(X < 1):
-        raise ValueError('Got invalid airmass value < 1.')
-    config = desisurvey.config.Configuration()
-    X0 = config.nominal_conditions.airmass()
-    return np.power((X / X0), 1.25)
+    return get_exposure_model().airmass_exposure_factor(airmass)
 
 
 # Linear regression coefficients for converting scattered moon V-band
@@ -140,7 +126,153 @@ _moonCoefficients = np.array([
 _vband_extinction = 0.15154
 
 
-def moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass):
+# Axes of the tabulated scattered moon model as (name, lo, hi, n) with
+# angles in degrees.  Grids are uniformly spaced between lo and hi.
+_moon_grid_axes = (
+    ('PHASE', 0., 1., 11), ('MOONZEN', 0., 90., 19),
+    ('SEP', 0., 180., 37), ('OBSZEN', 0., 90., 19))
+
+# Tabulated scattered moon model, loaded on demand by load_moon_grid.
+_moon_grid = None
+
+
+def tabulate_moon_grid(save_name=None):
+    """Tabulate the scattered moon V-band brightness on a regular grid.
+
+    The grid covers moon phase, moon zenith angle, moon separation and
+    observing zenith angle, using the ranges and sizes in ``_moon_grid_axes``,
+    and is calculated with :func:`specsim.atmosphere.krisciunas_schaefer`.
+
+    Parameters
+    ----------
+    save_name : str or None
+        Name of the FITS file where the grid should be saved, or do not
+        save the grid when None.
+
+    Returns
+    -------
+    array
+        4D array of tabulated V-band surface brightness in mag/arcsec2.
+    """
+    grids = [np.linspace(lo, hi, n) for (_, lo, hi, n) in _moon_grid_axes]
+    phase, moon_zenith, separation, obs_zenith = np.meshgrid(*grids, indexing='ij')
+    V = specsim.atmosphere.krisciunas_schaefer(
+        obs_zenith * u.deg, moon_zenith * u.deg, separation * u.deg,
+        phase, _vband_extinction).value.astype(np.float32)
+    if save_name is not None:
+        hdr = astropy.io.fits.Header()
+        for i, (name, lo, hi, n) in enumerate(_moon_grid_axes):
+            hdr['AXIS{}'.format(i)] = name
+            hdr['LO{}'.format(i)] = lo
+            hdr['HI{}'.format(i)] = hi
+        hdr['EXTINCT'] = _vband_extinction
+        astropy.io.fits.PrimaryHDU(V, header=hdr).writeto(save_name, overwrite=True)
+    return V
+
+
+def load_moon_grid(name='moon_grid.fits'):
+    """Load the tabulated scattered moon model.
+
+    The grid is only read once and then cached in memory.  Use
+    :func:`tabulate_moon_grid` to create a new grid file.
+
+    Parameters
+    ----------
+    name : str
+        Name of the FITS file to read. A relative path is assumed to
+        refer to our package data directory.
+
+    Returns
+    -------
+    tuple
+        Tuple (V, lo, hi) where V is the 4D grid of tabulated V-band
+        surface brightness and lo, hi are arrays of the corresponding
+        axis limits.
+    """
+    global _moon_grid
+    if _moon_grid is None:
+        if not os.path.isabs(name):
+            name = astropy.utils.data._find_pkg_data_path(os.path.join('data', name))
+        with astropy.io.fits.open(name, memmap=False) as hdus:
+            hdr = hdus[0].header
+            V = hdus[0].data.astype(np.float32)
+        naxes = len(_moon_grid_axes)
+        if (V.ndim != naxes or
+            [hdr['AXIS{}'.format(i)] for i in range(naxes)] !=
+            [axis[0] for axis in _moon_grid_axes]):
+            raise RuntimeError('Invalid moon grid in "{}".'.format(name))
+        if hdr['EXTINCT'] != _vband_extinction:
+            raise RuntimeError('Moon grid uses wrong V-band extinction.')
+        lo = np.array([hdr['LO{}'.format(i)] for i in range(naxes)])
+        hi = np.array([hdr['HI{}'.format(i)] for i in range(naxes)])
+        _moon_grid = V, lo, hi
+    return _moon_grid
+
+
+def interpolate_grid(grid, lo, hi, *coords, **kwargs):
+    """Multilinear interpolation on a regular grid.
+
+    Coordinates outside the grid are clipped to its boundary.
+
+    Parameters
+    ----------
+    grid : array
+        N-dimensional array of values tabulated on a uniform grid.
+    lo : array
+        1D array of N coordinates corresponding to ``grid[0, 0, ...]``.
+    hi : array
+        1D array of N coordinates corresponding to ``grid[-1, -1, ...]``.
+    coords : arrays
+        N arrays of coordinates to interpolate, which are broadcast against
+        each other.
+    chunk_size : int
+        Number of points to interpolate at once, chosen so that temporary
+        arrays fit in the processor cache.
+
+    Returns
+    -------
+    array
+        Array of interpolated values with the broadcast shape of the inputs.
+    """
+    chunk_size = kwargs.get('chunk_size', 8192)
+    coords = np.broadcast_arrays(*[np.asarray(c, float) for c in coords])
+    shape = grid.shape
+    if len(coords) != len(shape):
+        raise ValueError('Expected {} coordinate arrays.'.format(len(shape)))
+    flat = grid.ravel()
+    # Calculate the flat index offset of each corner of a grid cell, ordered
+    # so that corners differing only along the first axis are in the
+    # first and second halves.
+    offsets = np.zeros((1,), int)
+    for n in shape:
+        offsets = (n * offsets[:, np.newaxis] + np.array([0, 1])).ravel()
+    offsets = offsets[:, np.newaxis]
+    out_shape = coords[0].shape
+    coords = [c.ravel() for c in coords]
+    result = np.empty(len(coords[0]))
+    for start in range(0, len(result), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        # Find the flat index of the lower corner of each enclosing grid cell
+        # and the fractional position within the cell along each axis.
+        base = 0
+        weights = []
+        for c, x0, x1, n in zip(coords, lo, hi, shape):
+            t = np.clip((c[chunk] - x0) * ((n - 1) / (x1 - x0)), 0, n - 1)
+            i = np.minimum(t.astype(int), n - 2)
+            base = base * n + i
+            weights.append(t - i)
+        # Gather the values at each corner and interpolate along each axis
+        # in turn.  Corners are along the first axis so that each step
+        # operates on contiguous memory.
+        values = flat[offsets + base]
+        for w in weights:
+            values = values.reshape(2, -1, len(base))
+            values = values[0] + (values[1] - values[0]) * w
+        result[chunk] = values[0]
+    return result.reshape(out_shape)
+
+
+def moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass, tabulated=None):
     """Calculate exposure time factor due to scattered moonlight.
 
     The returned factor is relative to dark conditions when the moon is
@@ -158,56 +290,80 @@ def moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass):
     For details, see the jupyter notebook doc/nb/ScatteredMoon.ipynb in
     this package.
 
+    All inputs are broadcast against each other, so this function can be
+    used to evaluate many tiles and/or times with a single call.
+
     Parameters
     ----------
-    moon_frac : float
+    moon_frac : float or array
         Illuminated fraction of the moon, in the range [0,1].
-    moon_sep : float
+    moon_sep : float or array
         Separation angle between field center and moon in degrees, in the
         range [0,180].
-    moon_alt : float
+    moon_alt : float or array
         Altitude angle of the moon above the horizon in degrees, in the
         range [-90,90].
-    airmass : float
+    airmass : float or array
         Airmass used for observing this tile, must be >= 1.
+    tabulated : bool or None
+        Use the fast tabulated scattered moon model of :func:`load_moon_grid`
+        instead of the exact model when True.  When None, use the tabulated
+        model if the optional ``moon_model`` config parameter is
+        ``tabulated``.
 
     Returns
     -------
-    float
-        Dimensionless factor that exposure time should be increased to
+    float or array
+        Dimensionless factor(s) that exposure time should be increased to
         account for increased sky brightness due to scattered moonlight.
-        Will be 1 when the moon is below the horizon.
+        Will be 1 when the moon is below the horizon. The result is a
+        scalar when all inputs are scalars.
     """
-    if (moon_frac < 0) or (moon_frac > 1):
+    moon_frac, moon_sep, moon_alt, airmass = np.broadcast_arrays(
+        np.asarray(moon_frac, float), np.asarray(moon_sep, float),
+        np.asarray(moon_alt, float), np.asarray(airmass, float))
+    if np.any((moon_frac < 0) | (moon_frac > 1)):
         raise ValueError('Got invalid moon_frac outside [0,1].')
-    if (moon_sep < 0) or (moon_sep > 180):
+    if np.any((moon_sep < 0) | (moon_sep > 180)):
         raise ValueError('Got invalid moon_sep outside [0,180].')
-    if (moon_alt < -90) or (moon_alt > 90):
+    if np.any((moon_alt < -90) | (moon_alt > 90)):
         raise ValueError('Got invalid moon_alt outside [-90,+90].')
-    if airmass < 1:
+    if np.any(airmass < 1):
         raise ValueError('Got invalid airmass < 1.')
 
     # No exposure penalty when moon is below the horizon.
-    if moon_alt < 0:
-        return 1.
-
-    # Convert input parameters to those used in the specim moon model.
-    moon_phase = np.arccos(2 * moon_frac - 1) / np.pi
-    separation_angle = moon_sep * u.deg
-    moon_zenith = (90 - moon_alt) * u.deg
-
-    # Estimate the zenith angle corresponding to this observing airmass.
-    # We invert eqn.3 of KS1991 for this (instead of eqn.14).
-    obs_zenith = np.arcsin(np.sqrt((1 - airmass ** -2) / 0.96)) * u.rad
-
-    # Calculate scattered moon V-band brightness at each pixel.
-    V = specsim.atmosphere.krisciunas_schaefer(
-        obs_zenith, moon_zenith, separation_angle,
-        moon_phase, _vband_extinction).value
+    f_moon = np.ones(moon_alt.shape)
+    up = moon_alt >= 0
+    if np.any(up):
+        moon_frac, moon_sep, moon_alt, airmass = (
+            moon_frac[up], moon_sep[up], moon_alt[up], airmass[up])
+
+        if tabulated is None:
+            config = desisurvey.config.Configuration()
+            moon_model = getattr(config, 'moon_model', None)
+            tabulated = moon_model is not None and moon_model() == 'tabulated'
+
+        # Convert input parameters to those used in the specim moon model.
+        moon_phase = np.arccos(2 * moon_frac - 1) / np.pi
+        moon_zenith = 90 - moon_alt
+
+        # Estimate the zenith angle corresponding to this observing airmass.
+        # We invert eqn.3 of KS1991 for this (instead of eqn.14).
+        obs_zenith = np.degrees(np.arcsin(np.sqrt((1 - airmass ** -2) / 0.96)))
+
+        # Calculate scattered moon V-band brightness for all inputs at once.
+        if tabulated:
+            V = interpolate_grid(
+                *load_moon_grid(), moon_phase, moon_zenith, moon_sep, obs_zenith)
+        else:
+            V = specsim.atmosphere.krisciunas_schaefer(
+                obs_zenith * u.deg, moon_zenith * u.deg, moon_sep * u.deg,
+                moon_phase, _vband_extinction).value
 
-    # Evaluate the linear regression model.
-    X = np.array((1, np.exp(-V), 1/V, 1/V**2, 1/V**3))
-    return _moonCoefficients.dot(X)
+        # Evaluate the linear regression model.
+        X = np.array((np.ones_like(V), np.exp(-V), 1/V, 1/V**2, 1/V**3))
+        f_moon[up] = _moonCoefficients.dot(X)
+    return f_moon if f_moon.ndim else f_moon[()]
 
 
 def bright_exposure_factor(airmass, moon_frac, moon_sep, moon_alt, sun_sep, sun_alt):
@@ -287,6 +443,162 @@ _notwiCoefficients = np.array([ 0.00000000e+00, -3.25370591e-02,  3.24502646e-01
        -7.95325622e-06, -6.57333165e-06, -5.42867923e-07])
 
 
+def _compile_polynomial(nvar, degree):
+    """Compile the monomials of a polynomial into index tables.
+
+    Monomials are ordered by increasing degree, then as generated by
+    :func:`itertools.combinations_with_replacement`, matching the feature
+    order of a sklearn ``PolynomialFeatures`` transform.  Each monomial of
+    degree d > 0 is the product of a monomial of degree d - 1 (its parent)
+    and a single variable, which reproduces the order of multiplications in
+    ``np.prod`` so that results are bitwise identical.
+
+    Parameters
+    ----------
+    nvar : int
+        Number of input variables.
+    degree : int
+        Maximum polynomial degree.
+
+    Returns
+    -------
+    list
+        List of (parent, var) index arrays for each degree 1, 2, ...,
+        where parent indexes the monomials of the previous degree.
+    """
+    tables = []
+    previous = {(): 0}
+    for d in range(1, degree + 1):
+        combs = list(combinations_with_replacement(range(nvar), d))
+        parent = np.array([previous[comb[:-1]] for comb in combs])
+        var = np.array([comb[-1] for comb in combs])
+        tables.append((parent, var))
+        previous = {comb: i for i, comb in enumerate(combs)}
+    return tables
+
+
+# Precompiled monomials of the cubic polynomial in 4 variables (35 terms)
+# used by _bright_exposure_factor_notwi.
+_notwiMonomials = _compile_polynomial(4, 3)
+
+_notwiIntercept = 3.0493419627360243
+
+# linear regression coefficients of (airmass, sun_sep, sun_alt) for the
+# twilight contribution to the bright sky exposure factor.
+_twiCoefficients = np.array([1.1139712, -0.00431072, 0.16183842])
+_twiIntercept = 2.3278959318651733
+
+
+def _compile_reduced_polynomial():
+    """Compile the reduction of the non-twilight polynomial for fixed moon parameters.
+
+    For fixed moon_frac and moon_alt, the cubic polynomial in (airmass,
+    moon_frac, moon_sep, moon_alt) reduces to a cubic polynomial in
+    (airmass, moon_sep) with 10 terms.
+
+    Returns
+    -------
+    tuple
+        Tuple (reduce, frac_power, alt_power) of arrays, where reduce is a
+        (35, 10) matrix that sums the 35 original terms into the 10 reduced
+        terms, and frac_power, alt_power are the powers of moon_frac and
+        moon_alt in each original term.
+    """
+    free = (0, 2)
+    reduced = list(chain.from_iterable(
+        combinations_with_replacement(free, d) for d in range(4)))
+    combs = list(chain.from_iterable(
+        combinations_with_replacement(range(4), d) for d in range(4)))
+    reduce = np.zeros((len(combs), len(reduced)))
+    frac_power = np.zeros(len(combs))
+    alt_power = np.zeros(len(combs))
+    for i, comb in enumerate(combs):
+        reduce[i, reduced.index(tuple(v for v in comb if v in free))] = 1.
+        frac_power[i] = comb.count(1)
+        alt_power[i] = comb.count(3)
+    return reduce, frac_power, alt_power
+
+_notwiReduced = _compile_reduced_polynomial()
+
+
+def bright_sky_terms(moon_frac, moon_alt, sun_alt):
+    """Calculate the tile-independent terms of the bright-sky exposure factor.
+
+    The moon and sun parameters vary slowly during a night and are the same
+    for all tiles, so they can be evaluated once and then combined with
+    the tile-dependent airmass and separations using
+    :func:`bright_exposure_factor_from_terms`.
+
+    Parameters
+    ----------
+    moon_frac : float or array
+        Illuminated fraction of the moon within range [0,1].
+    moon_alt : float or array
+        Altitude angle of the moon above the horizon in degrees.
+    sun_alt : float or array
+        Altitude angle of the sun in degrees.
+
+    Returns
+    -------
+    array
+        Array of 13 coefficients for each broadcast input, with shape
+        (..., 13).  The first 10 coefficients multiply the monomials of
+        (airmass, moon_sep) in the non-twilight model, and the last 3 are the
+        airmass, sun_sep and constant coefficients of the twilight model.
+    """
+    moon_frac, moon_alt, sun_alt = np.broadcast_arrays(
+        np.asarray(moon_frac, float), np.asarray(moon_alt, float),
+        np.asarray(sun_alt, float))
+    reduce, frac_power, alt_power = _notwiReduced
+    terms = np.zeros(moon_frac.shape + (13,))
+    scale = (moon_frac[..., np.newaxis] ** frac_power *
+             moon_alt[..., np.newaxis] ** alt_power)
+    terms[..., :10] = np.dot(scale * _notwiCoefficients, reduce)
+    terms[..., 0] += _notwiIntercept
+    twilight = sun_alt >= -20.
+    terms[twilight, 10:12] = _twiCoefficients[:2]
+    terms[twilight, 12] = _twiIntercept + _twiCoefficients[2] * sun_alt[twilight]
+    # The exposure factor is one when the moon is down outside of twilight.
+    dark = (moon_alt < 0) & ~twilight
+    terms[dark] = 0.
+    terms[dark, 0] = 1.
+    return terms
+
+
+def bright_exposure_factor_from_terms(terms, airmass, moon_sep, sun_sep):
+    """Calculate the bright-sky exposure factor using precomputed terms.
+
+    Equivalent to :func:`bright_exposure_factor`, up to rounding errors,
+    but only evaluates the tile-dependent parts of the model, and does
+    not validate its inputs.
+
+    Parameters
+    ----------
+    terms : array
+        Array of shape (..., 13) calculated with :func:`bright_sky_terms`.
+        The leading dimensions must broadcast with the remaining inputs.
+    airmass : float or array
+        Airmass value(s) >= 1.
+    moon_sep : float or array
+        Separation angle(s) between field center(s) and moon in degrees.
+    sun_sep : float or array
+        Separation angle(s) between field center(s) and sun in degrees.
+
+    Returns
+    -------
+    array
+        Dimensionless exposure factor(s) >= 1.
+    """
+    X = np.asarray(airmass, float)
+    S = np.asarray(moon_sep, float)
+    c = [terms[..., k] for k in range(13)]
+    X2, S2 = X * X, S * S
+    fexp = (c[0] + X * (c[1] + c[10]) + S * c[2] + X2 * c[3] + X * S * c[4] + S2 * c[5] +
+            X2 * X * c[6] + X2 * S * c[7] + X * S2 * c[8] + S2 * S * c[9] +
+            np.asarray(sun_sep, float) * c[11] + c[12])
+    return np.clip(fexp, 1., None)
+
+
 def _bright_exposure_factor_notwi(airmass, moon_frac, moon_sep, moon_alt): 
     ''' third degree polynomial regression fit to exposure factor of  
     non-twilight bright sky given airmass and moon_conditions. Exposure factor
@@ -296,6 +608,9 @@ def _bright_exposure_factor_notwi(airmass, moon_frac, moon_sep, moon_alt):
     https://github.com/changhoonhahn/feasiBGS/blob/97524545ad98df34c934d777f98761c5aea6a4c5/notebook/cmx/exposure_factor_refit.ipynb
     for details. 
 
+    The polynomial is evaluated using the monomial tables precompiled
+    in ``_notwiMonomials``.
+
     :param airmass: 
         array of airmasses
     :param moon_frac: 
@@ -307,15 +622,19 @@ def _bright_exposure_factor_notwi(airmass, moon_frac, moon_sep, moon_alt):
     :return fexp: 
         exposure factor for non-twlight bright sky 
     '''
-    _notwiIntercept = 3.0493419627360243
-    
-    theta = np.atleast_2d(np.array([airmass, moon_frac, moon_sep, moon_alt]).T)
-
-    combs = chain.from_iterable(combinations_with_replacement(range(4), i) for i in range(0, 4))
-
-    theta_transform = np.empty((theta.shape[0], len(_notwiCoefficients)))
-    for i, comb in enumerate(combs):
-        theta_transform[:, i] = theta[:, comb].prod(1)
+    theta = np.array([airmass, moon_frac, moon_sep, moon_alt], float).reshape(4, -1)
+
+    # Build the monomials of each degree from those of the previous degree,
+    # with one row per monomial so that each step uses contiguous memory.
+    monomials = np.empty((len(_notwiCoefficients), theta.shape[1]))
+    monomials[0] = 1.
+    previous = slice(1, 1 + len(theta))
+    monomials[previous] = theta
+    for parent, var in _notwiMonomials[1:]:
+        current = slice(previous.stop, previous.stop + len(parent))
+        monomials[current] = monomials[previous][parent] * theta[var]
+        previous = current
+    theta_transform = np.ascontiguousarray(monomials.T)
 
     fexp = np.dot(theta_transform, _notwiCoefficients.T) + _notwiIntercept
     return fexp
@@ -337,23 +656,39 @@ def _bright_exposure_factor_twi(airmass, sun_sep, sun_alt):
         exposure factor twilight correction
     '''
     theta = np.atleast_2d(np.array([airmass, sun_sep, sun_alt]).T)
-        
-    _twiCoefficients = np.array([1.1139712, -0.00431072, 0.16183842]) 
-    _twiIntercept = 2.3278959318651733
 
     return np.dot(theta, _twiCoefficients.T) + _twiIntercept
 
 
 def exposure_factor(airmass, moon_frac, moon_sep, moon_alt, sun_sep, sun_alt): 
-    """Calculate the exposure factor for specified observing conditions
+    """Calculate the exposure factor for specified observing conditions.
+
+    Combines the airmass and bright-sky exposure factors.  All inputs are
+    broadcast against each other, so the moon and sun parameters can vary
+    along with the airmass and separations.
+
+    Parameters
+    ----------
+    airmass : float or array
+        Airmass value(s) >= 1.
+    moon_frac : float or array
+        Illuminated fraction of the moon, between 0-1.
+    moon_sep : float or array
+        Separation angle(s) between field center(s) and moon in degrees.
+    moon_alt : float or array
+        Altitude angle of the moon above the horizon in degrees.
+    sun_sep : float or array
+        Separation angle(s) between field center(s) and sun in degrees.
+    sun_alt : float or array
+        Altitude angle of the sun above the horizon in degrees.
+
+    Returns
+    -------
+    array
+        Dimensionless exposure factor(s) with the broadcast shape of the inputs.
     """
-    # airmass exposure factor
-    f_airmass = airmass_exposure_factor(airmass)
-    
-    # bright time exposure factor
-    f_bright = bright_exposure_factor(airmass, moon_frac, moon_sep, moon_alt,
-            sun_sep, sun_alt) 
-    return f_airmass * f_bright
+    return get_exposure_model().exposure_factor(
+        airmass, moon_frac, moon_sep, moon_alt, sun_sep, sun_alt)
 
 
 def exposure_time(program, seeing, transparency, airmass, EBV,
@@ -370,6 +705,11 @@ def exposure_time(program, seeing, transparency, airmass, EBV,
     for adjusting this value when some signal has already been acummulated
     with previous exposures of a tile.
 
+    All array inputs are broadcast against each other, so many tiles and/or
+    times can be evaluated with a single call.  Use
+    :meth:`ExposureModel.exposure_time` to avoid looking up the nominal
+    conditions with each call.
+
     Parameters
     ----------
     program : 'DARK', 'BRIGHT' or 'GRAY'
@@ -380,13 +720,13 @@ def exposure_time(program, seeing, transparency, airmass, EBV,
         Dimensionless transparency value(s) in the range [0-1].
     EBV : float or array
         Median dust extinction value(s) E(B-V) for the tile area.
-    airmass : float
+    airmass : float or array
         Airmass used for observing this tile.
-    moon_frac : float
+    moon_frac : float or array
         Illuminated fraction of the moon, between 0-1.
-    moon_sep : float
+    moon_sep : float or array
         Separation angle between field center and moon in degrees.
-    moon_alt : float
+    moon_alt : float or array
         Altitude angle of the moon above the horizon in degrees.
 
     Returns
@@ -394,23 +734,333 @@ def exposure_time(program, seeing, transparency, airmass, EBV,
     astropy.unit.Quantity
         Estimated exposure time(s) with time units.
     """
-    # Lookup the nominal exposure time for this program.
+    return get_exposure_model().exposure_time(
+        program, seeing, transparency, airmass, EBV, moon_frac, moon_sep, moon_alt)
+
+
+class ExposureModel(object):
+    """Exposure-time model for fixed nominal conditions.
+
+    All nominal conditions and exposure times are looked up in the
+    configuration and converted to plain floats once, when the model is
+    created.  Methods are vectorized and implement the module-level functions
+    of the same name, which all use the shared model returned by
+    :func:`get_exposure_model`.
+
+    Attributes
+    ----------
+    seeing : float
+        Nominal FWHM seeing in arcseconds.
+    transparency : float
+        Nominal transparency.
+    EBV : float
+        Nominal dust extinction E(B-V).
+    airmass : float
+        Nominal airmass.
+    nominal_exposure_time : dict
+        Nominal exposure time in seconds for each program.
+    tabulated_moon : bool
+        Use the tabulated scattered moon model when True.
+    """
+    # Coefficients of the seeing model.
+    SEEING_COEFS = (12.95475751, -7.10892892, 1.21068726)
+
+    def __init__(self):
+        config = desisurvey.config.Configuration()
+        self.config = config
+        nominal = config.nominal_conditions
+        self.seeing = nominal.seeing().to(u.arcsec).value
+        self.transparency = float(nominal.transparency())
+        self.EBV = float(nominal.EBV())
+        self.airmass = float(nominal.airmass())
+        self.nominal_exposure_time = {}
+        for program in desisurvey.tiles.Tiles.PROGRAMS:
+            self.nominal_exposure_time[program] = getattr(
+                config.nominal_exposure_time, program)().to(u.s).value
+        moon_model = getattr(config, 'moon_model', None)
+        self.tabulated_moon = moon_model is not None and moon_model() == 'tabulated'
+        a, b, c = self.SEEING_COEFS
+        self._f_seeing_nominal = (a + b * self.seeing + c * self.seeing ** 2) ** -2
+
+    def seeing_exposure_factor(self, seeing):
+        """See :func:`seeing_exposure_factor`.
+        """
+        seeing = np.asarray(seeing)
+        if np.any(seeing <= 0):
+            raise ValueError('Got invalid seeing value <= 0.')
+        a, b, c = self.SEEING_COEFS
+        f_seeing =  (a + b * seeing + c * seeing ** 2) ** -2
+        return f_seeing / self._f_seeing_nominal
+
+    def transparency_exposure_factor(self, transparency):
+        """See :func:`transparency_exposure_factor`.
+        """
+        transparency = np.asarray(transparency)
+        if np.any(transparency <= 0):
+            raise ValueError('Got invalid transparency value <= 0.')
+        return self.transparency / transparency
+
+    def dust_exposure_factor(self, EBV):
+        """See :func:`dust_exposure_factor`.
+        """
+        EBV = np.asarray(EBV)
+        Ag = 3.303 * (EBV - self.EBV)
+        return np.power(10.0, (2.0 * Ag / 2.5))
+
+    def airmass_exposure_factor(self, airmass):
+        """See :func:`airmass_exposure_factor`.
+        """
+        X = np.asarray(airmass)
+        if np.any(X < 1):
+            raise ValueError('Got invalid airmass value < 1.')
+        return np.power((X / self.airmass), 1.25)
+
+    def moon_exposure_factor(self, moon_frac, moon_sep, moon_alt, airmass):
+        """See :func:`moon_exposure_factor`.
+        """
+        return moon_exposure_factor(
+            moon_frac, moon_sep, moon_alt, airmass, tabulated=self.tabulated_moon)
+
+    def exposure_factor(self, airmass, moon_frac, moon_sep, moon_alt, sun_sep, sun_alt):
+        """See :func:`exposure_factor`.
+
+        The bright-sky factor is evaluated with :func:`bright_sky_terms`,
+        so all inputs broadcast, unlike :func:`bright_exposure_factor`.
+        """
+        moon_frac, moon_sep, moon_alt = (
+            np.asarray(moon_frac), np.asarray(moon_sep), np.asarray(moon_alt))
+        if np.any((moon_frac < 0) | (moon_frac > 1)):
+            raise ValueError('Got invalid moon_frac outside [0,1].')
+        if np.any((moon_alt < -90) | (moon_alt > 90)):
+            raise ValueError('Got invalid moon_alt outside [-90,+90].')
+        if np.any((moon_sep < 0) | (moon_sep > 180)):
+            raise ValueError('Got invalid moon_sep outside [0,180].')
+        f_airmass = self.airmass_exposure_factor(airmass)
+        terms = bright_sky_terms(moon_frac, moon_alt, sun_alt)
+        f_bright = bright_exposure_factor_from_terms(terms, airmass, moon_sep, sun_sep)
+        return f_airmass * f_bright
+
+    def exposure_time(self, program, seeing, transparency, airmass, EBV,
+                      moon_frac, moon_sep, moon_alt):
+        """See :func:`exposure_time`.
+        """
+        # Calculate actual / nominal factors.
+        f_seeing = self.seeing_exposure_factor(seeing)
+        f_transparency = self.transparency_exposure_factor(transparency)
+        f_dust = self.dust_exposure_factor(EBV)
+        f_airmass = self.airmass_exposure_factor(airmass)
+        f_moon = self.moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass)
+
+        # Calculate the exposure time required at the specified condtions.
+        actual_time = self.nominal_exposure_time[program] * (
+            f_seeing * f_transparency * f_dust * f_airmass * f_moon)
+        assert np.all(actual_time > 0)
+
+        return actual_time * u.s
+
+
+_exposure_model = None
+
+def get_exposure_model(use_cache=True, write_cache=True):
+    """Return a shared exposure-time model.
+
+    The cached model is rebuilt if the configuration has been reset since it
+    was created, but changes to nominal conditions made with
+    :meth:`desisurvey.config.Node.set_value` are only seen by a new model.
+
+    Parameters
+    ----------
+    use_cache : bool
+        Use a model previously cached in memory when True.
+        Otherwise, create a new model.
+    write_cache : bool
+        If a new model is created with this call, save it in a memory
+        cache for future calls.
+
+    Returns
+    -------
+    ExposureModel
+        Exposure-time model for the current configuration.
+    """
+    global _exposure_model
     config = desisurvey.config.Configuration()
-    nominal_time = getattr(config.nominal_exposure_time, program)()
+    if use_cache and _exposure_model is not None and _exposure_model.config is config:
+        model = _exposure_model
+    else:
+        model = ExposureModel()
+        if write_cache:
+            _exposure_model = model
+    return model
 
-    # Calculate actual / nominal factors.
-    f_seeing = seeing_exposure_factor(seeing)
-    f_transparency = transparency_exposure_factor(transparency)
-    f_dust = dust_exposure_factor(EBV)
-    f_airmass = airmass_exposure_factor(airmass)
-    f_moon = moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass)
 
-    # Calculate the exposure time required at the specified condtions.
-    actual_time = nominal_time * (
-        f_seeing * f_transparency * f_dust * f_airmass * f_moon)
-    assert actual_time > 0 * u.s
+class HistoryBuffer(object):
+    """Preallocated ring buffer for recording the history of named values.
 
-    return actual_time
+    Each name is recorded in its own preallocated array, whose capacity is
+    doubled when it fills up, up to an optional maximum size.  Once the
+    maximum size is reached, each new row overwrites the oldest row.
+
+    Use :meth:`append` to record one row, or :meth:`next_row` and
+    :attr:`writers` to write each value directly at its row index, which
+    avoids building an intermediate row in time-critical loops::
+
+        row = buffer.next_row()
+        a, b = buffer.writers
+        a[row] = 1.
+        b[row] = 2.
+
+    Parameters
+    ----------
+    names : list
+        Names of the values recorded in each row.
+    shape : tuple
+        Shape of each recorded value, e.g. () for scalars.
+    size : int
+        Initial number of rows to allocate.
+    max_size : int or None
+        Maximum number of rows to keep, or None for no limit.
+    """
+    def __init__(self, names, shape=(), size=1024, max_size=None):
+        if size <= 0 or (max_size is not None and max_size <= 0):
+            raise ValueError('Expected history sizes > 0.')
+        self.names = tuple(names)
+        self.shape = tuple(shape)
+        self.max_size = max_size
+        self._column = {name: i for i, name in enumerate(self.names)}
+        self._allocate(size if max_size is None else min(size, max_size))
+        self._start = 0
+        self._size = 0
+
+    def _allocate(self, capacity):
+        """Allocate storage for the specified capacity.
+        """
+        self._capacity = capacity
+        self._arrays = [np.empty((capacity,) + self.shape) for name in self.names]
+        # Item assignment to a memoryview is faster than to a 1D array.
+        self.writers = tuple(
+            memoryview(array) if not self.shape else array for array in self._arrays)
+
+    def _grow(self, size):
+        """Grow our capacity to hold at least size rows, if allowed.
+        """
+        capacity = self._capacity
+        while capacity < size:
+            capacity *= 2
+        if self.max_size is not None:
+            capacity = min(capacity, self.max_size)
+        if capacity > self._capacity:
+            old = [self.view(name) for name in self.names]
+            self._allocate(capacity)
+            for array, values in zip(self._arrays, old):
+                array[:len(values)] = values
+            self._start = 0
+
+    def __len__(self):
+        return self._size
+
+    def next_row(self):
+        """Reserve the next row and return its index.
+
+        The caller must then write every value of the row using
+        :attr:`writers`, which might have been reallocated by this call.
+
+        Returns
+        -------
+        int
+            Index of the reserved row in each of :attr:`writers`.
+        """
+        if self._size == self._capacity:
+            self._grow(self._size + 1)
+        if self._size < self._capacity:
+            # Rows always start at zero until the buffer wraps around.
+            row = self._size
+            self._size += 1
+        else:
+            # Overwrite the oldest row.
+            row = self._start
+            self._start = (row + 1) % self._capacity
+        return row
+
+    def append(self, *values):
+        """Append one row.
+
+        Parameters
+        ----------
+        values
+            Value for each name, in order, with the shape specified
+            for this buffer.
+        """
+        row = self.next_row()
+        for writer, value in zip(self.writers, values):
+            writer[row] = value
+
+    def extend(self, *values):
+        """Append several rows.
+
+        Parameters
+        ----------
+        values
+            Array of values for each name, in order, with shape
+            (nrows,) + shape.
+        """
+        nrows = len(values[0])
+        if nrows == 0:
+            return
+        self._grow(self._size + nrows)
+        capacity = self._capacity
+        first = 0
+        if self._size < capacity:
+            n = min(nrows, capacity - self._size)
+            for array, value in zip(self._arrays, values):
+                array[self._size:self._size + n] = value[:n]
+            self._size += n
+            first = n
+        if nrows - first > capacity:
+            # Only the newest rows are kept.
+            first = nrows - capacity
+            self._start = 0
+        n = nrows - first
+        if n > 0:
+            # Write new rows over the oldest rows, wrapping around the ring.
+            positions = (self._start + np.arange(n)) % capacity
+            for array, value in zip(self._arrays, values):
+                array[positions] = value[first:]
+            self._start = (self._start + n) % capacity
+
+    def view(self, name=None, copy=False):
+        """Return the recorded rows in chronological order.
+
+        The values of a single name are a zero-copy view until the buffer
+        wraps around, which only happens when ``max_size`` is set, and a
+        copy afterwards.  A view is only valid until the next call to
+        :meth:`next_row`, :meth:`append` or :meth:`extend`, which might
+        overwrite or reallocate its values.
+
+        Parameters
+        ----------
+        name : str or None
+            Name of the values to view, or None to copy all values.
+        copy : bool
+            Always return a copy when True.
+
+        Returns
+        -------
+        array
+            Array with shape (nrows,) + shape for a single name, or
+            (nrows, len(names)) + shape for all names.
+        """
+        if name is None:
+            return np.stack([self.view(name) for name in self.names], axis=1)
+        array = self._arrays[self._column[name]]
+        if self._start == 0:
+            rows = array[:self._size]
+            return rows.copy() if copy else rows
+        return np.concatenate((array[self._start:], array[:self._start]))
+
+    def as_dict(self, copy=False):
+        """Return a dictionary of :meth:`view` results for each name.
+        """
+        return {name: self.view(name, copy) for name in self.names}
 
 
 class ExposureTimeCalculator(object):
@@ -435,9 +1085,18 @@ class ExposureTimeCalculator(object):
     ----------
     save_history : bool
         When True, records the history of internal calculations during an
-        exposure, for debugging and plotting.
+        exposure, for debugging and plotting.  Use :attr:`history` to access
+        the recorded values.
+    history_size : int
+        Initial number of history rows to preallocate. The history buffers
+        are doubled in size when they fill up.
+    max_history : int or None
+        Maximum number of history rows to keep, or None for no limit. When
+        the limit is reached, the oldest rows are discarded.
     """
-    def __init__(self, save_history=False):
+    HISTORY_NAMES = ('mjd', 'signal', 'background', 'snr2frac')
+
+    def __init__(self, save_history=False, history_size=1024, max_history=None):
         self._snr2frac = 0.
         self._exptime = 0.
         self._active = False
@@ -462,7 +1121,8 @@ class ExposureTimeCalculator(object):
         # Initialize optional history tracking.
         self.save_history = save_history
         if save_history:
-            self.history = dict(mjd=[], signal=[], background=[], snr2frac=[])
+            self._history = HistoryBuffer(
+                self.HISTORY_NAMES, size=history_size, max_size=max_history)
 
     def weather_factor(self, seeing, transp):
         """Return the relative SNR2 accumulation rate for specified conditions.
@@ -593,10 +1253,7 @@ class ExposureTimeCalculator(object):
         self.last_snr2frac = 0.
         self.should_abort = False
         if self.save_history:
-            self.history['mjd'].append(mjd_now)
-            self.history['signal'].append(0.)
-            self.history['background'].append(0.)
-            self.history['snr2frac'].append(snr2frac)
+            self._history.append(mjd_now, 0., 0., snr2frac)
     
     def update(self, mjd_now, seeing, transp, sky):
         """Track changing conditions during an exposure.
@@ -631,16 +1288,78 @@ class ExposureTimeCalculator(object):
         self.background += dt * brate / self.brate0
         self._snr2frac = self._snr2frac_start + self.signal ** 2 / self.background / self.texp_total            
         if self.save_history:
-            self.history['mjd'].append(mjd_now)
-            self.history['signal'].append(self.signal)
-            self.history['background'].append(self.background)
-            self.history['snr2frac'].append(self._snr2frac)
+            row = self._history.next_row()
+            mjd, signal, background, snr2frac = self._history.writers
+            mjd[row] = mjd_now
+            signal[row] = self.signal
+            background[row] = self.background
+            snr2frac[row] = self._snr2frac
         need_more_snr = self._snr2frac < self.snr2frac_target
         # Give up on this tile if SNR progress has dropped significantly since we started.
         self.should_abort = (self._snr2frac - self.last_snr2frac) / dt < 0.25 / self.texp_total
         self.last_snr2frac = self._snr2frac
         return need_more_snr and not self.should_abort
 
+    def integrate(self, mjd, seeing, transp, sky):
+        """Track a time series of conditions during an exposure.
+
+        Equivalent to calling :meth:`update` for each sample in turn until
+        it returns False, with identical results, but uses cumulative sums
+        to process all samples at once.  Must call :meth:`start` first
+        to start tracking an exposure.
+
+        Parameters
+        ----------
+        mjd : array
+            1D array of increasing MJD timestamps for each sample.
+        seeing : float or array
+            Estimate of average atmospheric seeing in arcseconds
+            since the previous sample (or last update or start).
+        transp : float or array
+            Estimate of average atmospheric transparency
+            since the previous sample (or last update or start).
+        sky : float or array
+            Estimate of average sky background level
+            since the previous sample (or last update or start).
+
+        Returns
+        -------
+        tuple
+            Tuple (nused, more) where nused is the number of samples
+            that were used and more is the value returned by :meth:`update`
+            for the last sample used.  When more is False, the exposure should
+            be stopped at ``mjd[nused - 1]``.
+        """
+        mjd = np.asarray(mjd, float)
+        if mjd.ndim != 1 or len(mjd) == 0:
+            raise ValueError('Expected a non-empty 1D array of MJD values.')
+        dt = np.diff(mjd, prepend=self.mjd_last)
+        srate = self.weather_factor(seeing, transp)
+        brate = sky
+        # Accumulate in the same order as repeated calls to update().
+        signal = np.cumsum(np.hstack((self.signal, dt * srate / self.srate0)))[1:]
+        background = np.cumsum(np.hstack((self.background, dt * brate / self.brate0)))[1:]
+        snr2frac = self._snr2frac_start + signal ** 2 / background / self.texp_total
+        last_snr2frac = np.hstack((self.last_snr2frac, snr2frac[:-1]))
+        should_abort = (snr2frac - last_snr2frac) / dt < 0.25 / self.texp_total
+        # Find the first sample that reaches the target SNR2, using its running maximum.
+        nused = np.searchsorted(
+            np.maximum.accumulate(snr2frac), self.snr2frac_target, side='left') + 1
+        if np.any(should_abort[:nused]):
+            nused = np.argmax(should_abort) + 1
+        nused = int(min(nused, len(mjd)))
+        last = nused - 1
+        self.mjd_last = mjd[last]
+        self.signal = signal[last]
+        self.background = background[last]
+        self._snr2frac = self.last_snr2frac = snr2frac[last]
+        self.should_abort = should_abort[last]
+        if self.save_history:
+            self._history.extend(
+                mjd[:nused], signal[:nused], background[:nused], snr2frac[:nused])
+        need_more_snr = self._snr2frac < self.snr2frac_target
+        return nused, bool(need_more_snr and not self.should_abort)
+
     def stop(self, mjd_now):
         """Stop tracking an exposure.
 
@@ -664,6 +1383,30 @@ class ExposureTimeCalculator(object):
         self._active = False
         return self._snr2frac >= 1 or self.should_abort
 
+    @property
+    def history(self):
+        """Dictionary of recorded history arrays, in chronological order.
+
+        Values are zero-copy views, as returned by :meth:`HistoryBuffer.view`,
+        that are only valid until the next recorded update.  Use
+        :meth:`history_copy` for arrays that are not changed by later updates.
+        """
+        if not self.save_history:
+            raise RuntimeError('History is not being saved.')
+        return self._history.as_dict()
+
+    def history_copy(self):
+        """Return a dictionary of copies of the recorded history arrays.
+
+        Returns
+        -------
+        dict
+            Copies of the arrays in :attr:`history`, indexed by name.
+        """
+        if not self.save_history:
+            raise RuntimeError('History is not being saved.')
+        return self._history.as_dict(copy=True)
+
     @property
     def snr2frac(self):
         """Integrated fractional SNR2 of tile currently being exposed.
@@ -686,3 +1429,249 @@ class ExposureTimeCalculator(object):
         Set True by :meth:`start` and False by :meth:`stop`.
         """
         return self._active
+
+
+class BatchExposureTimeCalculator(ExposureTimeCalculator):
+    """Online Exposure Time Calculator for many simultaneous exposures.
+
+    Tracks ``nexp`` independent exposures, e.g., the same exposure in many
+    weather realizations, with the same :meth:`start`, :meth:`update` and
+    :meth:`stop` semantics as :class:`ExposureTimeCalculator`, but with
+    all state stored in arrays so that every active exposure is advanced
+    by a single vectorized call.
+
+    Each method accepts an optional boolean ``mask`` that selects which
+    exposures it applies to, so that exposures can start and stop at
+    different times.  Per-exposure inputs can be scalars or arrays that
+    broadcast to ``nexp``.
+
+    Parameters
+    ----------
+    nexp : int
+        Number of exposures to track.
+    save_history : bool
+        When True, records the history of internal calculations during
+        exposures, for debugging and plotting. Each call to :meth:`start` or
+        :meth:`update` records one row, with NaN for exposures that it did
+        not apply to.
+    history_size : int
+        Initial number of history rows to preallocate.  The buffers are
+        doubled in size when they fill up.
+    max_history : int or None
+        Maximum number of history rows to keep, or None for no limit.
+    """
+    def __init__(self, nexp, save_history=False, history_size=1024, max_history=None):
+        super(BatchExposureTimeCalculator, self).__init__(save_history=False)
+        self.nexp = nexp
+        self._snr2frac = np.zeros(nexp)
+        self._snr2frac_start = np.zeros(nexp)
+        self._exptime = np.zeros(nexp)
+        self._active = np.zeros(nexp, bool)
+        self.tileid = np.full(nexp, -1, int)
+        self.tile_nexp = np.zeros(nexp, int)
+        self.mjd_start = np.zeros(nexp)
+        self.mjd_last = np.zeros(nexp)
+        self.texp_total = np.ones(nexp)
+        self.snr2frac_target = np.zeros(nexp)
+        self.srate0 = np.ones(nexp)
+        self.brate0 = np.ones(nexp)
+        self.signal = np.zeros(nexp)
+        self.background = np.zeros(nexp)
+        self.last_snr2frac = np.zeros(nexp)
+        self.should_abort = np.zeros(nexp, bool)
+        # Initialize optional history tracking.
+        self.save_history = save_history
+        if save_history:
+            self._history = HistoryBuffer(
+                self.HISTORY_NAMES, shape=(nexp,), size=history_size, max_size=max_history)
+
+    def _select(self, mask):
+        """Return the indices of the exposures selected by a mask.
+        """
+        if mask is None:
+            return np.arange(self.nexp)
+        mask = np.asarray(mask)
+        if mask.shape != (self.nexp,) or mask.dtype != bool:
+            raise ValueError('Expected a boolean mask of length {}.'.format(self.nexp))
+        return np.flatnonzero(mask)
+
+    def _broadcast(self, value, idx):
+        """Broadcast a per-exposure input to all exposures then select some.
+        """
+        return np.broadcast_to(value, (self.nexp,))[idx]
+
+    def _record(self, idx, mjd, signal, background, snr2frac):
+        """Record one row of history for the selected exposures.
+        """
+        row = self._history.next_row()
+        for writer, values in zip(self._history.writers, (mjd, signal, background, snr2frac)):
+            writer[row] = np.nan
+            writer[row, idx] = values
+
+    def start(self, mjd_now, tileid, program, snr2frac, exposure_factor, seeing, transp, sky,
+              mask=None):
+        """Start tracking exposures.
+
+        Must be called before using :meth:`update` to track changing conditions
+        during the exposures.
+
+        Parameters
+        ----------
+        mjd_now : float or array
+            MJD timestamp when each exposure starts.
+        tileid : int or array
+            ID of the tile being exposed. This is only used to recognize consecutive
+            exposures of the same tile.
+        program : str or array
+            Name of the program the exposed tile belongs to.
+        snr2frac : float or array
+            Previous accumulated fractional SNR2 of the exposed tile.
+        exposure_factor : float or array
+            Exposure factor of the tile when each exposure starts, based on the
+            current conditions specified by the remaining parameters.
+        seeing : float or array
+            Initial atmospheric seeing in arcseconds.
+        transp : float or array
+            Initial atmospheric transparency (0,1).
+        sky : float or array
+            Initial sky background level.
+        mask : array or None
+            Boolean mask of exposures to start, or None to start all of them.
+        """
+        idx = self._select(mask)
+        mjd_now = self._broadcast(mjd_now, idx)
+        tileid = self._broadcast(tileid, idx)
+        snr2frac = self._broadcast(snr2frac, idx)
+        self.mjd_start[idx] = mjd_now
+        self.mjd_last[idx] = mjd_now
+        self._snr2frac[idx] = self._snr2frac_start[idx] = snr2frac
+        self._active[idx] = True
+        same = tileid == self.tileid[idx]
+        self.tile_nexp[idx] = np.where(same, self.tile_nexp[idx] + 1, 1)
+        self.tileid[idx] = tileid
+        if isinstance(program, str):
+            texp_nominal = self.TEXP_TOTAL[program]
+        else:
+            texp_nominal = np.array([
+                self.TEXP_TOTAL[p] for p in self._broadcast(program, idx)])
+        # Use the same logic as estimate_exposure with per-exposure nominal times.
+        texp_total = texp_nominal * self._broadcast(exposure_factor, idx)
+        texp_remaining = texp_total * (1 - snr2frac)
+        nexp = np.ceil(texp_remaining / self.MAX_EXPTIME).astype(int)
+        nexp = np.maximum(nexp, self.MIN_NEXP - (self.tile_nexp[idx] - 1))
+        self.texp_total[idx] = texp_total
+        # Estimate SNR2 to integrate in the next exposure.
+        self.snr2frac_target[idx] = snr2frac + (texp_remaining / nexp) / texp_total
+        # Initialize signal and background rate factors.
+        self.srate0[idx] = self.weather_factor(
+            self._broadcast(seeing, idx), self._broadcast(transp, idx))
+        self.brate0[idx] = self._broadcast(sky, idx)
+        self.signal[idx] = 0.
+        self.background[idx] = 0.
+        self.last_snr2frac[idx] = 0.
+        self.should_abort[idx] = False
+        if self.save_history:
+            self._record(idx, mjd_now, 0., 0., snr2frac)
+
+    def update(self, mjd_now, seeing, transp, sky):
+        """Track changing conditions during active exposures.
+
+        Must call :meth:`start` first to start tracking exposures.
+        Exposures that are not active are not changed.
+
+        Parameters
+        ----------
+        mjd_now : float or array
+            Current MJD timestamp.
+        seeing : float or array
+            Estimate of average atmospheric seeing in arcseconds
+            since last update (or start).
+        transp : float or array
+            Estimate of average atmospheric transparency
+            since last update (or start).
+        sky : float or array
+            Estimate of average sky background level
+            since last update (or start).
+
+        Returns
+        -------
+        array
+            1D array of booleans indicating which exposures should continue
+            integrating. Always False for exposures that are not active.
+        """
+        idx = np.flatnonzero(self._active)
+        mjd_now = self._broadcast(mjd_now, idx)
+        dt = mjd_now - self.mjd_last[idx]
+        self.mjd_last[idx] = mjd_now
+        srate = self.weather_factor(self._broadcast(seeing, idx), self._broadcast(transp, idx))
+        brate = self._broadcast(sky, idx)
+        signal = self.signal[idx] + dt * srate / self.srate0[idx]
+        background = self.background[idx] + dt * brate / self.brate0[idx]
+        texp_total = self.texp_total[idx]
+        snr2frac = self._snr2frac_start[idx] + signal ** 2 / background / texp_total
+        self.signal[idx] = signal
+        self.background[idx] = background
+        self._snr2frac[idx] = snr2frac
+        if self.save_history:
+            self._record(idx, mjd_now, signal, background, snr2frac)
+        need_more_snr = snr2frac < self.snr2frac_target[idx]
+        # Give up on a tile if SNR progress has dropped significantly since we started.
+        should_abort = (snr2frac - self.last_snr2frac[idx]) / dt < 0.25 / texp_total
+        self.should_abort[idx] = should_abort
+        self.last_snr2frac[idx] = snr2frac
+        more = np.zeros(self.nexp, bool)
+        more[idx] = need_more_snr & ~should_abort
+        return more
+
+    def stop(self, mjd_now, mask=None):
+        """Stop tracking exposures.
+
+        After calling this method, use :attr:`exptime` to look up the exposure times.
+
+        Parameters
+        ----------
+        mjd_now : float or array
+            MJD timestamp when each exposure was stopped.
+        mask : array or None
+            Boolean mask of exposures to stop, or None to stop all active exposures.
+
+        Returns
+        -------
+        array
+            1D array of booleans indicating which exposures are "done", with the
+            same meaning as :meth:`ExposureTimeCalculator.stop`. Always False for
+            exposures that were not stopped.
+        """
+        if mask is None:
+            idx = np.flatnonzero(self._active)
+        else:
+            idx = self._select(mask)
+            idx = idx[self._active[idx]]
+        self._exptime[idx] = self._broadcast(mjd_now, idx) - self.mjd_start[idx]
+        self._active[idx] = False
+        done = np.zeros(self.nexp, bool)
+        done[idx] = (self._snr2frac[idx] >= 1) | self.should_abort[idx]
+        return done
+
+    @property
+    def snr2frac(self):
+        """Integrated fractional SNR2 of the tiles being exposed.
+
+        Includes signal accumulated in previous exposures. Initialized by
+        :meth:`start`, updated by :meth:`update` and frozen by :meth:`stop`.
+        """
+        return self._snr2frac
+
+    @property
+    def exptime(self):
+        """Exposure times in days recorded by the last call to :meth:`stop`.
+        """
+        return self._exptime
+
+    @property
+    def active(self):
+        """Which exposures are we tracking?
+
+        Set True by :meth:`start` and False by :meth:`stop`.
+        """
+        return self._active
@@ -7,7 +7,6 @@ import collections
 import numpy as np
 
 import astropy.table
-import astropy.units as u
 
 import desimodel.io
 
@@ -82,7 +81,8 @@ class Forecast(object):
             raise ValueError('Array design_hourangle has wrong shape.')
         # Compute airmass at design hour angles.
         self.airmass = tiles.airmass(self.design_hourangle)
-        airmass_factor = desisurvey.etc.airmass_exposure_factor(self.airmass)
+        exposure_model = desisurvey.etc.get_exposure_model()
+        airmass_factor = exposure_model.airmass_exposure_factor(self.airmass)
         # Load ephemerides.
         ephem = desisurvey.ephem.get_ephem()
         # Compute the expected available and scheduled hours per program.
@@ -100,7 +100,7 @@ class Forecast(object):
             openfrac.append(available[progindx].sum() / scheduled_sum)
             dust.append(tiles.dust_factor[tile_sel].mean())
             airmass.append(airmass_factor[tile_sel].mean())
-            nominal.append(getattr(config.nominal_exposure_time, program)().to(u.s).value)
+            nominal.append(exposure_model.nominal_exposure_time[program])
         # Build a table of all forecasting parameters.
         df = collections.OrderedDict()
         self.df = df
@@ -5,7 +5,10 @@ from __future__ import print_function, division
 import pkg_resources
 
 import numpy as np
+import scipy.optimize
 import scipy.special
+import scipy.sparse
+import scipy.spatial
 
 import astropy.table
 import astropy.coordinates
@@ -14,6 +17,7 @@ import astropy.units as u
 import desiutil.log
 
 import desisurvey.config
+import desisurvey.etc
 
 
 def wrap(angle, offset):
@@ -61,6 +65,9 @@ class Optimizer(object):
         have a big effect on the results so can be approximate.
     smoothing_radius : :class:`astropy.units.Quantity`
         Gaussian sigma for calculating smoothing weights with angular units.
+    smoothing_cutoff : float
+        Smoothing weights are truncated to zero for tiles separated by more
+        than this number of Gaussian sigmas.
     center : float or None
         Used by the 'flat' initialization method to specify the starting
         DEC for the CDF balancing algorithm. When None, the 'flat' method
@@ -78,7 +85,7 @@ class Optimizer(object):
     """
     def __init__(self, program, lst_edges, lst_hist, subset=None, start=None, stop=None,
                  init='flat', initial_ha=None, stretch=1.0, smoothing_radius=10,
-                 center=None, seed=123, weights=[5, 4, 3, 2, 1]):
+                 smoothing_cutoff=4., center=None, seed=123, weights=[5, 4, 3, 2, 1]):
 
         tiles = desisurvey.tiles.get_tiles()
         if program not in tiles.PROGRAMS:
@@ -105,6 +112,10 @@ class Optimizer(object):
 
         self.lst_hist = np.asarray(lst_hist)
         self.lst_hist_sum = self.lst_hist.sum()
+        self.lst_hist_sumsq = self.lst_hist.dot(self.lst_hist)
+        # Empty bins are excluded from the scale metric by giving them an
+        # infinite denominator.
+        self._scale_denom = np.where(self.lst_hist > 0, self.lst_hist, np.inf)
         self.nbins = len(lst_hist)
         self.lst_edges = np.asarray(lst_edges)
         if self.lst_edges.shape != (self.nbins + 1,):
@@ -117,13 +128,13 @@ class Optimizer(object):
         # converted to LST equivalent in degrees.
         texp_nom = getattr(config.nominal_exposure_time, program)()
         self.dlst_nom = 360 * texp_nom.to(u.day).value / 0.99726956583
+        self.exposure_model = desisurvey.etc.get_exposure_model()
 
         # Select the tiles to plan.
         if subset is not None:
             idx = tiles.index(subset)
             # Check that all tiles in the subset belong to program.
-            passes = np.unique(tiles.passnum[idx])
-            if np.any(tiles.pass_program[passes] != program):
+            if not np.all(tiles.program_mask[program][idx]):
                 raise ValueError('Subset contains non-{} tiles.'.format(program))
             tile_sel = np.zeros(tiles.ntiles, bool)
             tile_sel[idx] = True
@@ -151,7 +162,7 @@ class Optimizer(object):
         self.dust_factor = tiles.dust_factor[tile_sel]
 
         # Initialize smoothing weights.
-        self.init_smoothing(smoothing_radius)
+        self.init_smoothing(smoothing_radius, smoothing_cutoff)
 
         self.log.info(
             '{0}: {1:.1f}h for {2} tiles (texp_nom {3:.1f}).'
@@ -169,7 +180,7 @@ class Optimizer(object):
 
         # Calculate schedule plan with HA=0 asignments to establish
         # the smallest possible total exposure time.
-        self.plan_tiles = self.get_plan(np.zeros(self.ntiles))
+        self.plan_first, self.plan_weights = self.get_plan(np.zeros(self.ntiles))
         self.use_plan(save_history=False)
         self.min_total_time = self.plan_hist.sum()
 
@@ -219,7 +230,7 @@ class Optimizer(object):
                 # Clip tiles to their airmass limits.
                 ha = np.clip(ha, -self.max_abs_ha, +self.max_abs_ha)
                 # Calculate the score for this HA assignment.
-                self.plan_tiles = self.get_plan(ha)
+                self.plan_first, self.plan_weights = self.get_plan(ha)
                 self.use_plan(save_history=False)
                 scores.append(self.eval_score(self.plan_hist))
                 # Keep track of the best score found so far.
@@ -245,7 +256,7 @@ class Optimizer(object):
             self.ha = ha_clipped
 
         # Calculate schedule plan with initial HA asignments.
-        self.plan_tiles = self.get_plan(self.ha)
+        self.plan_first, self.plan_weights = self.get_plan(self.ha)
         self.use_plan()
         self.ha_initial = self.ha.copy()
         self.num_adjustments = np.zeros(self.ntiles, int)
@@ -278,13 +289,18 @@ class Optimizer(object):
         # in degrees for the specified HA assignments.
         tiles = desisurvey.tiles.get_tiles()
         X = tiles.airmass(ha, self.idx[subset])
-        exptime = (self.dlst_nom * desisurvey.etc.airmass_exposure_factor(X) *
+        exptime = (self.dlst_nom * self.exposure_model.airmass_exposure_factor(X) *
                    self.dust_factor[subset]) * self.stretch
         return exptime, subset
 
     def get_plan(self, ha, subset=None):
         """Calculate an LST usage plan for specified hour angle assignments.
 
+        Each exposure only overlaps a few consecutive LST bins, so the plan
+        is returned as a band of ``width`` bins for each tile, which starts
+        at bin ``first`` and wraps around at the last bin.  Use
+        :meth:`expand_plan` to convert a banded plan to a dense array.
+
         Parameters
         ----------
         ha : array
@@ -296,10 +312,12 @@ class Optimizer(object):
 
         Returns
         -------
-        array
-            Array of shape (ntiles, nbins) giving the exposure time in hours
-            that each tile needs in each LST bin. When a subset is specified,
-            ntiles only indexes tiles in the subset.
+        tuple
+            Tuple (first, weights) where first is an integer array of shape
+            (ntiles,) and weights is an array of shape (ntiles, width) giving
+            the exposure time in hours that each tile needs in each LST bin
+            of its band. When a subset is specified, ntiles only indexes
+            tiles in the subset.
         """
         exptime, subset = self.get_exptime(ha, subset)
         # Calculate LST windows for each tile's exposure.
@@ -312,16 +330,109 @@ class Optimizer(object):
             lst_mid + 0.5 * exptime - self.origin + 360, 360) + self.origin
         ##assert np.all(lst_max >= self.origin)
         ##assert np.all(lst_max < self.origin + 360)
-        # Calculate each exposure's overlap with each LST bin.
+        # Find the band of bins that covers each exposure, starting from
+        # the bin containing lst_min.
+        width = min(int(np.max(exptime, initial=0.) // self.binsize) + 2, self.nbins)
+        first = np.clip(
+            np.searchsorted(self.lst_edges, lst_min, side='right') - 1, 0, self.nbins - 1)
+        bins = self.get_plan_bins(first, width)
+        # Calculate each exposure's overlap with each LST bin of its band.
         lo = np.clip(
-            self.lst_edges[1:] - lst_min[:, np.newaxis], 0, self.binsize)
+            self.lst_edges[1:][bins] - lst_min[:, np.newaxis], 0, self.binsize)
         hi = np.clip(
-            lst_max[:, np.newaxis] - self.lst_edges[:-1], 0, self.binsize)
+            lst_max[:, np.newaxis] - self.lst_edges[:-1][bins], 0, self.binsize)
         plan = lo + hi
         plan[lst_max > lst_min] -= self.binsize
         ##assert np.allclose(plan.sum(axis=1), exptime)
         # Convert from degrees to sidereal hours.
-        return plan * 24. / 360.
+        return first, plan * 24. / 360.
+
+    def get_plan_bins(self, first, width):
+        """Calculate the LST bin indices of banded plans.
+
+        Parameters
+        ----------
+        first : array
+            Array of shape (ntiles,) with the first bin of each band.
+        width : int
+            Number of bins in each band.
+
+        Returns
+        -------
+        array
+            Integer array of shape (ntiles, width).
+        """
+        return (np.asarray(first)[..., np.newaxis] + np.arange(width)) % self.nbins
+
+    def expand_plan(self, first, weights):
+        """Expand a banded plan to a dense array.
+
+        Parameters
+        ----------
+        first : array
+            Array of shape (ntiles,) with the first bin of each band.
+        weights : array
+            Array of shape (ntiles, width) with the exposure time in hours
+            for each bin of each band.
+
+        Returns
+        -------
+        array
+            Array of shape (ntiles, nbins) giving the exposure time in hours
+            that each tile needs in each LST bin.
+        """
+        weights = np.asarray(weights)
+        plan = np.zeros(weights.shape[:-1] + (self.nbins,))
+        np.put_along_axis(plan, self.get_plan_bins(first, weights.shape[-1]), weights, axis=-1)
+        return plan
+
+    def get_plan_hist(self, first, weights):
+        """Calculate the histogram of planned LST usage for banded plans.
+
+        Parameters
+        ----------
+        first : array
+            Array of shape (ntiles,) with the first bin of each band.
+        weights : array
+            Array of shape (ntiles, width) with the exposure time in hours
+            for each bin of each band.
+
+        Returns
+        -------
+        array
+            Array of shape (nbins,) giving the total exposure time in hours
+            planned in each LST bin.
+        """
+        bins = self.get_plan_bins(first, weights.shape[1])
+        return np.bincount(bins.reshape(-1), weights=weights.reshape(-1), minlength=self.nbins)
+
+    @property
+    def plan_tiles(self):
+        """Dense array of shape (ntiles, nbins) of the current plan.
+
+        This is expanded from the banded plan each time it is accessed, so
+        should only be used for diagnostics.
+        """
+        return self.expand_plan(self.plan_first, self.plan_weights)
+
+    def plan_in_bin(self, ibin):
+        """Lookup the planned exposure time of each tile in one LST bin.
+
+        Parameters
+        ----------
+        ibin : int
+            Index of the LST bin.
+
+        Returns
+        -------
+        array
+            Array of shape (ntiles,) giving the exposure time in hours.
+        """
+        offset = (ibin - self.plan_first) % self.nbins
+        inside = offset < self.plan_weights.shape[1]
+        result = np.zeros(self.ntiles)
+        result[inside] = self.plan_weights[inside, offset[inside]]
+        return result
 
     def eval_score(self, plan_hist):
         """Evaluate the score that improve() tries to minimize.
@@ -331,17 +442,73 @@ class Optimizer(object):
         Parameters
         ----------
         plan_hist : array
-            Histogram of planned LST usage for all tiles.
+            Histogram of planned LST usage for all tiles, or an array of
+            shape (..., nbins) of histograms to evaluate at once.
 
         Returns
         -------
-        float
-            Score value.
+        float or array
+            Score value(s).
         """
         return (
             100 * self.eval_RMSE(plan_hist) +
             100 * self.eval_loss(plan_hist))
 
+    def eval_move_scores(self, subset, first, weights):
+        """Evaluate the scores obtained by changing the plan of single tiles.
+
+        Equivalent to calling :meth:`eval_score` for each plan obtained by
+        replacing the banded plan of one tile in subset, up to rounding
+        errors, but only visits the LST bins used by the old or new band of
+        each tile.  The residuals r' of each new plan are expanded as::
+
+            r' = r + D - delta * lst_hist
+
+        where r are the residuals of the current plan, D is the change in
+        planned LST usage and delta is the change in the RMSE scale factor,
+        so that |r'|^2 only needs sums over the bins where D is non-zero.
+
+        Parameters
+        ----------
+        subset : array
+            Array of tile indices to change.
+        first : array
+            First LST bin of the new band for each tile in subset.
+        weights : array
+            Array of shape (len(subset), width) of new banded plans.
+
+        Returns
+        -------
+        array
+            Array of score values for each tile in subset.
+        """
+        nsel = len(subset)
+        old_weights = self.plan_weights[subset]
+        # Merge the bins of the old and new bands for each tile.
+        rows = np.repeat(np.arange(nsel), old_weights.shape[1] + weights.shape[1])
+        bins = np.hstack((
+            self.get_plan_bins(self.plan_first[subset], old_weights.shape[1]),
+            self.get_plan_bins(first, weights.shape[1]))).reshape(-1)
+        keys, inverse = np.unique(rows * self.nbins + bins, return_inverse=True)
+        delta_plan = np.bincount(
+            inverse.reshape(-1), weights=np.hstack((-old_weights, weights)).reshape(-1))
+        rows, bins = keys // self.nbins, keys % self.nbins
+        # Calculate the residuals of the current plan.
+        plan_sum = self.plan_hist.sum()
+        residuals = self.plan_hist - (plan_sum / self.lst_hist_sum) * self.lst_hist
+        # Expand the residuals of each new plan.
+        delta_sum = np.bincount(rows, weights=delta_plan, minlength=nsel)
+        delta_scale = delta_sum / self.lst_hist_sum
+        RSS = (residuals.dot(residuals) +
+               np.bincount(rows, weights=delta_plan * (2 * residuals[bins] + delta_plan), minlength=nsel) -
+               2 * delta_scale * (residuals.dot(self.lst_hist) +
+               np.bincount(rows, weights=delta_plan * self.lst_hist[bins], minlength=nsel)) +
+               delta_scale ** 2 * self.lst_hist_sumsq)
+        new_sum = plan_sum + delta_sum
+        RMSE = np.sqrt(np.maximum(RSS, 0.) * self.nbins) / new_sum
+        loss = new_sum / self.min_total_time - 1.0
+        return 100 * RMSE + 100 * loss
+
     def eval_RMSE(self, plan_hist):
         """Evaluate the mean-squared error metric for the specified plan.
 
@@ -359,18 +526,21 @@ class Optimizer(object):
         Parameters
         ----------
         plan_hist : array
-            Histogram of planned LST usage for all tiles.
+            Histogram of planned LST usage for all tiles, or an array of
+            shape (..., nbins) of histograms to evaluate at once.
 
         Returns
         -------
-        float
-            Mean squared error value.
+        float or array
+            Mean squared error value(s).
         """
         # Rescale the available LST total time to the plan total time.
-        plan_sum = plan_hist.sum()
+        plan_sum = plan_hist.sum(axis=-1)
         scale = plan_sum / self.lst_hist_sum
-        residuals = plan_hist - scale * self.lst_hist
-        return np.sqrt(residuals.dot(residuals) * self.nbins) / plan_sum
+        residuals = plan_hist - np.multiply.outer(scale, self.lst_hist)
+        if residuals.ndim == 1:
+            return np.sqrt(residuals.dot(residuals) * self.nbins) / plan_sum
+        return np.sqrt(np.einsum('...i,...i', residuals, residuals) * self.nbins) / plan_sum
 
     def eval_loss(self, plan_hist):
         """Evaluate relative loss of current plan relative to HA=0 plan.
@@ -381,14 +551,15 @@ class Optimizer(object):
         Parameters
         ----------
         plan_hist : array
-            Histogram of planned LST usage for all tiles.
+            Histogram of planned LST usage for all tiles, or an array of
+            shape (..., nbins) of histograms to evaluate at once.
 
         Returns
         -------
-        float
-            Loss factor.
+        float or array
+            Loss factor(s).
         """
-        return plan_hist.sum() / self.min_total_time - 1.0
+        return plan_hist.sum(axis=-1) / self.min_total_time - 1.0
 
     def eval_scale(self, plan_hist):
         """Evaluate the efficiency of the specified plan.
@@ -420,19 +591,170 @@ class Optimizer(object):
         nonzero = self.lst_hist > 0
         return (plan_hist[nonzero] / self.lst_hist[nonzero]).max()
 
+    resync_interval = 1000
+    """Number of calls to :meth:`update_plan` between full recalculations."""
+
     def use_plan(self, save_history=True):
         """Use the current plan and update internal arrays.
 
-        Calculates the `plan_hist` arrays from the per-tile `plan_tiles` array,
-        and records the current values of the RMSE and scale metrics.
+        Calculates the `plan_hist` arrays from the per-tile banded plan arrays
+        `plan_first` and `plan_weights`, initializes the running sums and
+        maximum used by :meth:`update_plan`, and records the current values
+        of the RMSE and scale metrics.
         """
-        self.plan_hist = self.plan_tiles.sum(axis=0)
-        if not np.all(np.isfinite(self.plan_hist)):
-            raise RuntimeError('Found invalid plan_tiles in use_plan().')
+        if not np.all(np.isfinite(self.plan_weights)):
+            raise RuntimeError('Found invalid plan_weights in use_plan().')
+        self.plan_hist = self.get_plan_hist(self.plan_first, self.plan_weights)
+        self.plan_sum = self.plan_hist.sum()
+        self.plan_sumsq = self.plan_hist.dot(self.plan_hist)
+        self.plan_dot = self.plan_hist.dot(self.lst_hist)
+        self._init_scale()
+        self.nupdates = 0
         if save_history:
-            self.scale_history.append(self.eval_scale(self.plan_hist))
-            self.loss_history.append(self.eval_loss(self.plan_hist))
-            self.RMSE_history.append(self.eval_RMSE(self.plan_hist))
+            self.save_metrics()
+
+    def _init_scale(self):
+        """Initialize the running maximum used for the scale metric.
+
+        Gives the same value as :meth:`eval_scale` for the current plan.
+        """
+        ratio = self.plan_hist / self._scale_denom
+        self.plan_scale_bin = np.argmax(ratio)
+        self.plan_scale = ratio[self.plan_scale_bin]
+
+    def update_plan(self, itile, first, weights, save_history=True):
+        """Replace the plan for one tile and update internal arrays.
+
+        Only the LST bins used by the old or new plan of this tile are
+        updated, together with running sums that give the RMSE and loss
+        metrics, and a running maximum that gives the scale metric, without
+        a pass over all bins.  The maximum is only recalculated from all
+        bins when the bin holding it decreases.  Every ``resync_interval``
+        calls, everything is recalculated with :meth:`use_plan` instead,
+        to limit the accumulation of rounding errors.
+
+        Parameters
+        ----------
+        itile : int
+            Index of the tile to update.
+        first : int
+            First LST bin of the new band for this tile.
+        weights : array
+            New exposure time in hours that this tile needs in each LST bin
+            of its band.
+        save_history : bool
+            Record the updated metrics when True.
+        """
+        if not np.all(np.isfinite(weights)):
+            raise RuntimeError('Found invalid plan in update_plan().')
+        width = self.plan_weights.shape[1]
+        if len(weights) > width:
+            # Widen the bands of all tiles.
+            self.plan_weights = np.pad(self.plan_weights, ((0, 0), (0, len(weights) - width)))
+            width = len(weights)
+        old_bins = self.get_plan_bins(self.plan_first[itile], width)
+        new_bins = self.get_plan_bins(first, len(weights))
+        old_weights = self.plan_weights[itile].copy()
+        self.plan_first[itile] = first
+        self.plan_weights[itile] = 0.
+        self.plan_weights[itile, :len(weights)] = weights
+        self.nupdates += 1
+        if self.nupdates >= self.resync_interval:
+            self.use_plan(save_history)
+            return
+        changed = np.union1d(old_bins, new_bins)
+        old = self.plan_hist[changed]
+        self.plan_hist[old_bins] -= old_weights
+        self.plan_hist[new_bins] += weights
+        new = self.plan_hist[changed]
+        delta = new - old
+        self.plan_sum += delta.sum()
+        self.plan_sumsq += delta.dot(new + old)
+        self.plan_dot += delta.dot(self.lst_hist[changed])
+        ratio = new / self._scale_denom[changed]
+        imax = np.argmax(ratio)
+        if ratio[imax] >= self.plan_scale:
+            self.plan_scale_bin = changed[imax]
+            self.plan_scale = ratio[imax]
+        elif self.plan_scale_bin in changed:
+            self._init_scale()
+        if save_history:
+            self.save_metrics()
+
+    def save_metrics(self):
+        """Record the scale, loss and RMSE metrics of the current plan.
+
+        The loss and RMSE are calculated from the running sums maintained
+        by :meth:`use_plan` and :meth:`update_plan`, so agree with
+        :meth:`eval_loss` and :meth:`eval_RMSE` up to rounding errors.
+        The scale is the running maximum maintained by the same methods.
+        """
+        scale = self.plan_sum / self.lst_hist_sum
+        # Expand the residual sum of squares of (plan_hist - scale * lst_hist).
+        RSS = (self.plan_sumsq - 2 * scale * self.plan_dot +
+               scale ** 2 * self.lst_hist_sumsq)
+        self.scale_history.append(self.plan_scale)
+        self.loss_history.append(self.plan_sum / self.min_total_time - 1.0)
+        self.RMSE_history.append(np.sqrt(max(RSS, 0.) * self.nbins) / self.plan_sum)
+
+    def get_state(self):
+        """Get the internal state that changes during optimization.
+
+        Includes the HA assignments, the plan and its running sums, the
+        metric histories, the counters used by :meth:`improve` and the
+        state of the random number generator, so that optimization can
+        continue bit-for-bit after :meth:`set_state`.
+
+        Returns
+        -------
+        dict
+            Dictionary of numpy arrays, suitable for saving with
+            :func:`numpy.savez`.
+        """
+        name, keys, pos, has_gauss, cached_gaussian = self.gen.get_state()
+        return dict(
+            TILEID=self.tid, NBINS=np.array(self.nbins),
+            HA=self.ha, HA_INITIAL=self.ha_initial, NUM_ADJUSTMENTS=self.num_adjustments,
+            PLAN_FIRST=self.plan_first, PLAN_WEIGHTS=self.plan_weights,
+            PLAN_HIST=self.plan_hist, PLAN_SUM=np.array(self.plan_sum),
+            PLAN_SUMSQ=np.array(self.plan_sumsq), PLAN_DOT=np.array(self.plan_dot),
+            NUPDATES=np.array(self.nupdates), SCALE_HISTORY=np.array(self.scale_history),
+            LOSS_HISTORY=np.array(self.loss_history), RMSE_HISTORY=np.array(self.RMSE_history),
+            COUNTERS=np.array([self.nslow, self.nimprove, self.nsmooth]),
+            RNG_KEYS=keys, RNG_STATE=np.array([pos, has_gauss]),
+            RNG_GAUSSIAN=np.array(cached_gaussian))
+
+    def set_state(self, state):
+        """Restore the internal state saved with :meth:`get_state`.
+
+        Parameters
+        ----------
+        state : dict
+            Dictionary of arrays returned by :meth:`get_state`.
+        """
+        if int(state['NBINS']) != self.nbins:
+            raise RuntimeError('Saved state uses {} LST bins, not {}.'
+                               .format(int(state['NBINS']), self.nbins))
+        if not np.array_equal(state['TILEID'], self.tid):
+            raise RuntimeError('Saved state has different tile IDs.')
+        self.ha = np.array(state['HA'])
+        self.ha_initial = np.array(state['HA_INITIAL'])
+        self.num_adjustments = np.array(state['NUM_ADJUSTMENTS'])
+        self.plan_first = np.array(state['PLAN_FIRST'])
+        self.plan_weights = np.array(state['PLAN_WEIGHTS'])
+        self.plan_hist = np.array(state['PLAN_HIST'])
+        self.plan_sum = state['PLAN_SUM'][()]
+        self.plan_sumsq = state['PLAN_SUMSQ'][()]
+        self.plan_dot = state['PLAN_DOT'][()]
+        self.nupdates = int(state['NUPDATES'])
+        self._init_scale()
+        self.scale_history = list(state['SCALE_HISTORY'])
+        self.loss_history = list(state['LOSS_HISTORY'])
+        self.RMSE_history = list(state['RMSE_HISTORY'])
+        self.nslow, self.nimprove, self.nsmooth = (int(n) for n in state['COUNTERS'])
+        pos, has_gauss = (int(n) for n in state['RNG_STATE'])
+        self.gen.set_state(
+            ('MT19937', state['RNG_KEYS'], pos, has_gauss, float(state['RNG_GAUSSIAN'])))
 
     def next_bin(self):
         """Select which LST bin to adjust next.
@@ -508,12 +830,17 @@ class Optimizer(object):
         for method in 'next_bin', 'any_bin':
             if method == 'next_bin':
                 # Select which bin to move a tile from and in which direction.
-                ibin, dha_sign = self.next_bin()
+                try:
+                    ibin, dha_sign = self.next_bin()
+                except RuntimeError:
+                    # No move between adjacent bins reduces the RMSE, which
+                    # can happen with coarse LST bins.
+                    continue
                 # Find tiles using more time in this LST bin than in the
                 # adjacent bin they would be moving away from.
                 ibin_from = (ibin - dha_sign + self.nbins) % self.nbins
-                sel = (self.plan_tiles[:, ibin] > 0) & (
-                    self.plan_tiles[:, ibin] >= self.plan_tiles[:, ibin_from])
+                plan_ibin = self.plan_in_bin(ibin)
+                sel = (plan_ibin > 0) & (plan_ibin >= self.plan_in_bin(ibin_from))
             else:
                 # Try a 20% random subset of all tiles.
                 self.nslow += 1
@@ -541,13 +868,9 @@ class Optimizer(object):
                 nsel = np.count_nonzero(sel)
             subset = np.where(sel)[0]
             # Calculate how the plan changes by moving each selected tile.
-            scenario = self.get_plan(self.ha[subset] + dha, subset)
-            new_score = np.zeros(nsel)
-            for i, itile in enumerate(subset):
-                # Calculate the (downsampled) plan when this tile is moved.
-                new_plan_hist = (
-                    self.plan_hist - self.plan_tiles[itile] + scenario[i])
-                new_score[i]= self.eval_score(new_plan_hist)
+            first, weights = self.get_plan(self.ha[subset] + dha, subset)
+            # Score the (downsampled) plans obtained by moving each tile.
+            new_score = self.eval_move_scores(subset, first, weights)
             i = np.argmin(new_score)
             if new_score[i] > initial_score:
                 # All candidate adjustments give a worse score.
@@ -558,13 +881,127 @@ class Optimizer(object):
             # Update the plan.
             self.ha[itile] = self.ha[itile] + dha
             assert np.abs(self.ha[itile]) < self.max_abs_ha[itile]
-            self.plan_tiles[itile] = scenario[i]
+            self.update_plan(itile, first[i], weights[i])
             # No need to try additional methods.
             break
-        self.use_plan()
+        else:
+            # The plan is unchanged.
+            self.save_metrics()
         self.nimprove += 1
 
-    def init_smoothing(self, radius):
+    def eval_score_gradient(self, ha, dha=1e-3):
+        """Evaluate the score and its gradient with respect to HA assignments.
+
+        The planned LST usage of each tile is a continuous, piecewise-linear
+        function of its HA, so the score is differentiable almost everywhere.
+        Shifting a tile's HA only moves the ends of its exposure window, so
+        its gradient only involves the LST bins containing these ends.  The
+        change of exposure time with airmass is included in the window ends
+        and in the loss term of the score.
+
+        Parameters
+        ----------
+        ha : array
+            Array of hour angle assignments in degrees for all tiles.
+        dha : float
+            Step in degrees used to estimate the derivative of each exposure
+            time with respect to its HA.
+
+        Returns
+        -------
+        tuple
+            Tuple (score, gradient) where gradient is an array of shape
+            (ntiles,) in units of score per degree of HA.
+        """
+        plan_hist = self.get_plan_hist(*self.get_plan(ha))
+        score = self.eval_score(plan_hist)
+        # Calculate the gradient of the score with respect to plan_hist.
+        plan_sum = plan_hist.sum()
+        residuals = plan_hist - plan_sum / self.lst_hist_sum * self.lst_hist
+        norm = np.sqrt(residuals.dot(residuals))
+        dscore = 100 / self.min_total_time
+        if norm > 0:
+            dscore = dscore + 100 * np.sqrt(self.nbins) / plan_sum * (
+                (residuals - residuals.dot(self.lst_hist) / self.lst_hist_sum) / norm -
+                norm / plan_sum)
+        else:
+            dscore = np.full(self.nbins, dscore)
+        # Find the LST bins containing the ends of each exposure window.
+        exptime, _ = self.get_exptime(ha)
+        dexptime = (self.get_exptime(ha + dha)[0] - self.get_exptime(ha - dha)[0]) / (2 * dha)
+        lst_mid = self.ra + ha
+        ends = []
+        for sign in (-1, +1):
+            lst = np.fmod(lst_mid + sign * 0.5 * exptime - self.origin + 360, 360) + self.origin
+            ends.append(np.clip(
+                np.searchsorted(self.lst_edges, lst, side='right') - 1, 0, self.nbins - 1))
+        gradient = 24. / 360. * (
+            dscore[ends[1]] * (1 + 0.5 * dexptime) -
+            dscore[ends[0]] * (1 - 0.5 * dexptime))
+        return score, gradient
+
+    def minimize(self, smoothing=0.1, maxiter=500, tol=1e-6):
+        """Optimize the HA assignments with a deterministic gradient method.
+
+        This is an alternative to repeated calls of :meth:`improve` and
+        :meth:`smooth`.  The score is minimized over all HA assignments at
+        once with the L-BFGS-B method of :func:`scipy.optimize.minimize`,
+        using :meth:`eval_score_gradient` and keeping each \|HA\| within its
+        airmass limit.  The current HA assignments are used as the starting
+        point and the plan is updated with the result.
+
+        Instead of smoothing between steps, a penalty is added to the score::
+
+            smoothing * mean((HA - HA[avg]) ** 2)
+
+        where HA[avg] is the weighted average of other tile HA assignments
+        used by :meth:`smooth`, in degrees.
+
+        Parameters
+        ----------
+        smoothing : float
+            Weight of the smoothing penalty, in units of score per square
+            degree.
+        maxiter : int
+            Maximum number of L-BFGS-B iterations.
+        tol : float
+            Stop when the relative change in the penalized score is below
+            this value.
+
+        Returns
+        -------
+        scipy.optimize.OptimizeResult
+            Summary of the minimization.
+        """
+        # Tiles without neighbors are not smoothed.
+        has_neighbors = self.smoothing_sums > 0
+        inv_sums = np.divide(1, self.smoothing_sums, out=np.zeros(self.ntiles), where=has_neighbors)
+        weights = scipy.sparse.diags(inv_sums).dot(self.smoothing_weights)
+
+        def objective(ha):
+            score, gradient = self.eval_score_gradient(ha)
+            if smoothing > 0:
+                # Residuals relative to the smoothed HA assignments.
+                residuals = ha - weights.dot(ha)
+                residuals[~has_neighbors] = 0
+                score += smoothing * residuals.dot(residuals) / self.ntiles
+                gradient += 2 * smoothing / self.ntiles * (
+                    residuals - weights.T.dot(residuals))
+            return score, gradient
+
+        # Stay strictly inside the limits enforced by improve().
+        limit = np.nextafter(self.max_abs_ha, 0)
+        result = scipy.optimize.minimize(
+            objective, np.clip(self.ha, -limit, limit), jac=True,
+            method='L-BFGS-B', bounds=np.stack((-limit, limit), axis=1),
+            options=dict(maxiter=maxiter, ftol=tol))
+        self.log.debug('L-BFGS-B: {} after {} iterations.'.format(result.message, result.nit))
+        self.ha = np.clip(result.x, -limit, limit)
+        self.plan_first, self.plan_weights = self.get_plan(self.ha)
+        self.use_plan()
+        return result
+
+    def init_smoothing(self, radius, cutoff=4.):
         """Calculate and save smoothing weights.
 
         Weights for each pair of tiles [i,j] are calculated as::
@@ -572,21 +1009,31 @@ class Optimizer(object):
             wgt[i,j] = exp(-0.5 * (sep[i,j]/radius) ** 2)
 
         where sep[i,j] is the separation angle between the tile centers.
+        Weights are zero for sep[i,j] > cutoff * radius and i == j, and are
+        saved as a sparse matrix.  Pairs of nearby tiles are found with a
+        KD-tree, so memory and time scale with the number of pairs.
 
         Parameters
         ----------
         radius : astropy.units.Quantity
             Gaussian sigma for calculating weights with angular units.
+        cutoff : float
+            Maximum separation of tiles with non-zero weight, in units of radius.
         """
-        separations = desisurvey.utils.separation_matrix(
-            self.ra, self.dec, self.ra, self.dec)
-        ratio = separations / radius.to(u.deg).value
-        self.smoothing_weights = np.exp(-0.5 * ratio ** 2)
-        # Set self weight to zero.
-        self_weights = np.diag(self.smoothing_weights)
-        assert np.allclose(self_weights, 1.)
-        self.smoothing_weights -= np.diag(self_weights)
-        self.smoothing_sums = self.smoothing_weights.sum(axis=1)
+        radius = radius.to(u.rad).value
+        # Find pairs of tiles whose unit vectors are within the cutoff chord length.
+        ra, dec = np.radians(self.ra), np.radians(self.dec)
+        xyz = np.stack((np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)), axis=1)
+        max_chord = 2 * np.sin(0.5 * min(cutoff * radius, np.pi))
+        pairs = scipy.spatial.cKDTree(xyz).query_pairs(max_chord, output_type='ndarray')
+        i, j = pairs[:, 0], pairs[:, 1]
+        chord = np.sqrt(np.sum((xyz[i] - xyz[j]) ** 2, axis=1))
+        ratio = 2 * np.arcsin(np.minimum(0.5 * chord, 1.)) / radius
+        wgt = np.exp(-0.5 * ratio ** 2)
+        self.smoothing_weights = scipy.sparse.csr_matrix(
+            (np.concatenate((wgt, wgt)), (np.concatenate((i, j)), np.concatenate((j, i)))),
+            shape=(self.ntiles, self.ntiles))
+        self.smoothing_sums = np.asarray(self.smoothing_weights.sum(axis=1)).reshape(-1)
 
     def smooth(self, alpha=0.1):
         """Smooth the current HA assignments.
@@ -596,10 +1043,12 @@ class Optimizer(object):
             (1-alpha) * HA + alpha * HA[avg]
 
         where HA[avg] is the weighted average of all other tile HA assignments.
+        Tiles without any neighbors within the smoothing cutoff are unchanged.
         """
-        avg_ha = self.smoothing_weights.dot(self.ha) / self.smoothing_sums
+        avg_ha = np.divide(self.smoothing_weights.dot(self.ha), self.smoothing_sums,
+                           out=self.ha.copy(), where=self.smoothing_sums > 0)
         self.ha = (1 - alpha) * self.ha + alpha * avg_ha
-        self.plan_tiles = self.get_plan(self.ha)
+        self.plan_first, self.plan_weights = self.get_plan(self.ha)
         self.use_plan()
 
     def plot(self, save=None, relative=True):
@@ -16,6 +16,7 @@ import desiutil.log
 import desimodel.io
 
 import desisurvey.utils
+import desisurvey.snapshot
 
 
 def load_design_hourangle(name='surveyinit.fits'):
@@ -110,13 +111,16 @@ class Planner(object):
     rules : object or None
         Object with an ``apply`` method that is used to implement survey strategy by updating
         tile priorities each afternoon.  When None, all tiles have equal priority.
-    restore : str or None
+    restore : str, tuple or None
         Restore internal state from the snapshot saved to this filename,
         or initialize a new planner when None. Use :meth:`save` to
         save a snapshot to be restored later. Filename is relative to
         the configured output path unless an absolute path is
         provided. Raise a RuntimeError if the saved tile IDs do not
-        match the current tiles_file values.
+        match the current tiles_file values. Snapshots can be FITS
+        files or binary ``.npz`` snapshots. A tuple (arrays, meta), as
+        returned by :meth:`desisurvey.snapshot.SnapshotHistory.read`,
+        is also accepted.
     """
     def __init__(self, rules=None, restore=None):
         self.log = desiutil.log.get_logger()
@@ -129,21 +133,41 @@ class Planner(object):
         self.ephem = desisurvey.ephem.get_ephem()
         if restore is not None:
             # Restore the plan for a survey in progress.
-            fullname = config.get_path(restore)
-            if not os.path.exists(fullname):
-                raise RuntimeError('Cannot restore planner from non-existent "{}".'.format(fullname))
-            t = astropy.table.Table.read(fullname, hdu='PLAN')
-            if t.meta['CADENCE'] != self.fiberassign_cadence:
-                raise ValueError('Fiberassign cadence mismatch.')
-            first, last = t.meta['FIRST'], t.meta['LAST']
+            if isinstance(restore, tuple):
+                # Restore from (arrays, meta) already read from a snapshot.
+                arrays, meta = restore
+                fullname = 'snapshot arrays'
+            else:
+                fullname = config.get_path(restore)
+                if not os.path.exists(fullname):
+                    raise RuntimeError('Cannot restore planner from non-existent "{}".'.format(fullname))
+            if isinstance(restore, tuple) or desisurvey.snapshot.is_snapshot(fullname):
+                if not isinstance(restore, tuple):
+                    arrays, meta = desisurvey.snapshot.read_snapshot(fullname)
+                if not np.array_equal(arrays['TILEID'], self.tiles.tileID):
+                    raise RuntimeError('Saved tile IDs do not match current tiles_file.')
+                if 'PLAN_PRIORITY' not in arrays:
+                    raise RuntimeError('No planner state saved in "{}".'.format(fullname))
+                if meta['CADENCE'] != self.fiberassign_cadence:
+                    raise ValueError('Fiberassign cadence mismatch.')
+                first, last = meta['FIRST'], meta['LAST']
+                self.tile_covered = arrays['PLAN_COVERED']
+                self.tile_countdown = arrays['PLAN_COUNTDOWN']
+                self.tile_available = arrays['PLAN_AVAILABLE']
+                self.tile_priority = arrays['PLAN_PRIORITY']
+            else:
+                t = astropy.table.Table.read(fullname, hdu='PLAN')
+                if t.meta['CADENCE'] != self.fiberassign_cadence:
+                    raise ValueError('Fiberassign cadence mismatch.')
+                first, last = t.meta['FIRST'], t.meta['LAST']
+                if not np.array_equal(t['TILEID'].data, self.tiles.tileID):
+                    raise RuntimeError('Saved tile IDs do not match current tiles_file.')
+                self.tile_covered = t['COVERED'].data.copy()
+                self.tile_countdown = t['COUNTDOWN'].data.copy()
+                self.tile_available = t['AVAILABLE'].data.copy()
+                self.tile_priority = t['PRIORITY'].data.copy()
             self.first_night = desisurvey.utils.get_date(first) if first else None
             self.last_night = desisurvey.utils.get_date(last) if last else None
-            if not np.array_equal(t['TILEID'].data, self.tiles.tileID):
-                raise RuntimeError('Saved tile IDs do not match current tiles_file.')
-            self.tile_covered = t['COVERED'].data.copy()
-            self.tile_countdown = t['COUNTDOWN'].data.copy()
-            self.tile_available = t['AVAILABLE'].data.copy()
-            self.tile_priority = t['PRIORITY'].data.copy()
             self.log.debug(
                 'Restored plan with {} ({}) / {} tiles covered (available) from "{}".'
                 .format(np.count_nonzero(self.tile_covered),
@@ -182,29 +206,35 @@ class Planner(object):
         TILEID, COVERED, COUNTDOWN, AVAILABLE and PRIORITY and header keywords
         CADENCE, FIRST, LAST. The saved file size is about 400Kb.
 
+        A name with the ``.npz`` extension saves a faster binary snapshot
+        instead, using :func:`desisurvey.snapshot.write_snapshot`.
+
         Parameters
         ----------
         name : str
-            Name of FITS file where the snapshot will be saved. The file will
+            Name of FITS or npz file where the snapshot will be saved. The file will
             be saved under our configuration's output path unless name is
             already an absolute path.  Pass the same name to the constructor's
             ``restore`` argument to restore this snapshot.
         """
         config = desisurvey.config.Configuration()
         fullname = config.get_path(name)
-        t = astropy.table.Table(meta={
-            'CADENCE': self.fiberassign_cadence,
-            'FIRST': self.first_night.isoformat() if self.first_night else '',
-            'LAST': self.last_night.isoformat() if self.last_night else '',
-            'EXTNAME': 'PLAN'
-            })
-        t['TILEID'] = self.tiles.tileID
-        t['COVERED'] = self.tile_covered
-        t['COUNTDOWN'] = self.tile_countdown
-        t['AVAILABLE'] = self.tile_available
-        t['PRIORITY'] = self.tile_priority
-        t.write(fullname+'.tmp', overwrite=True, format='fits')
-        os.rename(fullname+'.tmp', fullname)
+        if desisurvey.snapshot.is_snapshot(fullname):
+            desisurvey.snapshot.write_snapshot(fullname, planner=self)
+        else:
+            t = astropy.table.Table(meta={
+                'CADENCE': self.fiberassign_cadence,
+                'FIRST': self.first_night.isoformat() if self.first_night else '',
+                'LAST': self.last_night.isoformat() if self.last_night else '',
+                'EXTNAME': 'PLAN'
+                })
+            t['TILEID'] = self.tiles.tileID
+            t['COVERED'] = self.tile_covered
+            t['COUNTDOWN'] = self.tile_countdown
+            t['AVAILABLE'] = self.tile_available
+            t['PRIORITY'] = self.tile_priority
+            t.write(fullname+'.tmp', overwrite=True, format='fits')
+            os.rename(fullname+'.tmp', fullname)
         self.log.debug(
             'Saved plan with {} ({}) / {} tiles covered (available) to "{}".'
             .format(np.count_nonzero(self.tile_covered),
@@ -4,6 +4,8 @@ from __future__ import print_function, division
 
 import os
 import re
+import hashlib
+import zipfile
 import collections
 
 import yaml
@@ -44,23 +46,29 @@ class Rules(object):
     Read tile group definitions and observing rules from the specified
     YAML file.
 
+    Parsing the rules and building the tile selections for each group is
+    relatively slow, so the results are cached in a binary file under our
+    configured output path, keyed on the contents of the YAML file and
+    the tiles being scheduled, when write_cache is True.  Subsequent
+    constructions with the same inputs read this file instead of parsing
+    the YAML file again.
+
     Parameters
     ----------
     file_name : str
         Name of YAML file containing the rules to use. A relative path refers
         to our configured output path.
+    use_cache : bool
+        Restore previously compiled rules from disk when possible if True.
+    write_cache : bool
+        Save newly compiled rules to disk for future constructions if True.
+        Otherwise, constructing rules has no side effects on disk.
     """
-    def __init__(self, file_name='rules.yaml'):
+    def __init__(self, file_name='rules.yaml', use_cache=True, write_cache=False):
         self.log = desiutil.log.get_logger()
         config = desisurvey.config.Configuration()
         tile_radius = config.tile_radius().to(u.deg).value
-
         tiles = desisurvey.tiles.get_tiles()
-        NGC = (tiles.tileRA > 75.0) & (tiles.tileRA < 300.0)
-        SGC = ~NGC
-
-        # Initialize regexp for parsing "GROUP_NAME(PASS)"
-        parser = re.compile('([^\(]+)\(([0-99]+)\)$')
 
         # Get the full path of the YAML file to read.
         if os.path.isabs(file_name):
@@ -70,6 +78,38 @@ class Rules(object):
             full_path = astropy.utils.data._find_pkg_data_path(
                 os.path.join('data', file_name))
 
+        # Calculate the key identifying compiled versions of these rules.
+        digest = hashlib.sha1()
+        with open(full_path, 'rb') as f:
+            digest.update(f.read())
+        for array in tiles.tileID, tiles.passnum, tiles.tileRA, tiles.tileDEC:
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(repr(tile_radius).encode())
+        cache_key = digest.hexdigest()
+        stem = os.path.splitext(os.path.basename(full_path))[0]
+        cache_name = config.get_path('{}-compiled.npz'.format(stem))
+
+        if use_cache and os.path.exists(cache_name):
+            if self._restore(cache_name, cache_key):
+                self.log.debug('Restored compiled rules from "{}".'.format(cache_name))
+                self._compile()
+                return
+
+        self._parse(full_path, tiles, tile_radius)
+        self._compile()
+        if write_cache:
+            self._save(cache_name, cache_key)
+            self.log.debug('Saved compiled rules to "{}".'.format(cache_name))
+
+    def _parse(self, full_path, tiles, tile_radius):
+        """Parse a YAML rules file and build the tile selection for each group.
+        """
+        NGC = (tiles.tileRA > 75.0) & (tiles.tileRA < 300.0)
+        SGC = ~NGC
+
+        # Initialize regexp for parsing "GROUP_NAME(PASS)"
+        parser = re.compile('([^\(]+)\(([0-99]+)\)$')
+
         # Read the YAML file into memory.
         with open(full_path) as f:
             rules_dict = _ordered_load(f, yaml.SafeLoader)
@@ -211,9 +251,104 @@ class Rules(object):
         self.dec_priority = dec_priority
         self.group_max_orphans = group_max_orphans
 
+    def _save(self, name, cache_key):
+        """Save our parsed rules to a binary file.
+        """
+        targets, triggers, weights = [], [], []
+        for i, gname in enumerate(self.group_names):
+            for trigger, weight in self.group_rules[gname].items():
+                targets.append(i)
+                triggers.append(-1 if trigger == 'START' else self.group_names.index(trigger))
+                weights.append(weight)
+        with open(name + '.tmp', 'wb') as f:
+            np.savez(
+                f, key=np.array(cache_key), group_names=np.array(self.group_names),
+                group_ids=self.group_ids, dec_priority=self.dec_priority,
+                max_orphans=np.array([self.group_max_orphans[gname] for gname in self.group_names]),
+                rule_target=np.array(targets, int), rule_trigger=np.array(triggers, int),
+                rule_weight=np.array(weights, float))
+        os.rename(name + '.tmp', name)
+
+    def _restore(self, name, cache_key):
+        """Restore parsed rules saved by :meth:`_save`.
+
+        Returns False if the saved rules do not match the specified key or
+        cannot be read, so that the rules are parsed again.
+        """
+        try:
+            with np.load(name) as data:
+                if str(data['key']) != cache_key:
+                    self.log.debug('Ignoring stale compiled rules in "{}".'.format(name))
+                    return False
+                group_names = [str(gname) for gname in data['group_names']]
+                group_rules = {gname: {} for gname in group_names}
+                for i, j, weight in zip(data['rule_target'], data['rule_trigger'], data['rule_weight']):
+                    trigger = 'START' if j < 0 else group_names[j]
+                    group_rules[group_names[i]][trigger] = float(weight)
+                group_ids = data['group_ids']
+                dec_priority = data['dec_priority']
+                group_max_orphans = dict(zip(group_names, data['max_orphans'].tolist()))
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            self.log.warning('Ignoring unreadable compiled rules in "{}": {}'.format(name, e))
+            return False
+        self.group_names = group_names
+        self.group_ids = group_ids
+        self.group_rules = group_rules
+        self.dec_priority = dec_priority
+        self.group_max_orphans = group_max_orphans
+        return True
+
+    def _compile(self):
+        """Compile our rules into a dependency graph of subgroups.
+
+        Each subgroup is a node of the graph, with an edge from every
+        trigger subgroup to each subgroup whose rules refer to it. Since
+        triggers only depend on tile completion status, the graph has no
+        cycles and a change in completion status only needs to be propagated
+        one level, to the dependents of subgroups containing the changed tiles.
+        """
+        ngroups = len(self.group_names)
+        self.group_index = {name: i for i, name in enumerate(self.group_names)}
+        # Build the (sorted) array of tile indices belonging to each subgroup.
+        # All group_ids are >= 1, which is checked in our constructor.
+        self.group_ntiles = np.bincount(self.group_ids, minlength=ngroups + 1)[1:]
+        order = np.argsort(self.group_ids, kind='stable')
+        self.group_tiles = np.split(order, np.cumsum(self.group_ntiles)[:-1])
+        self.group_orphans = np.array(
+            [self.group_max_orphans[name] for name in self.group_names], int)
+        # Compile each subgroup's rules into (trigger_index, weight) pairs,
+        # using trigger_index = -1 for START.
+        self.group_triggers = []
+        self.group_dependents = [[] for name in self.group_names]
+        for i, name in enumerate(self.group_names):
+            triggers = []
+            for condition, value in self.group_rules[name].items():
+                if condition == 'START':
+                    triggers.append((-1, value))
+                else:
+                    j = self.group_index[condition]
+                    triggers.append((j, value))
+                    if i not in self.group_dependents[j]:
+                        self.group_dependents[j].append(i)
+            self.group_triggers.append(triggers)
+        # Incremental state is initialized by apply().
+        self._completed = None
+        self._priorities = None
+
+    def _evaluate_group(self, i, triggered):
+        """Calculate the priority of one subgroup given trigger states.
+        """
+        priority = 0
+        for j, value in self.group_triggers[i]:
+            if j < 0 or triggered[j]:
+                priority = max(priority, value)
+        return priority
+
     def apply(self, completed):
         """Apply rules to determine tile priorites based on those completed so far.
 
+        This call also resets the state used by :meth:`apply_incremental`.
+
         Parameters
         ----------
         completed : array
@@ -224,24 +359,89 @@ class Rules(object):
         array
             Array of per-tile observing priorities.
         """
-        # First pass through groups to check trigger conditions.
-        triggered = {'START': True}
-        for i, name in enumerate(self.group_names):
-            gid = i+1
-            group_sel = self.group_ids == gid
-            if not np.any(group_sel):
-                self.log.error('No tiles covered by rule {}'.format(name))
-            ngroup = np.count_nonzero(group_sel)
-            ndone = np.count_nonzero(completed[group_sel])
-            max_orphans = self.group_max_orphans[name]
-            triggered[name] = (ndone + max_orphans >= ngroup)
-        # Second pass through groups to apply rules.
+        completed = np.asarray(completed, bool)
+        ngroups = len(self.group_names)
+        # Check trigger conditions for all groups at once.
+        ndone = np.bincount(self.group_ids[completed], minlength=ngroups + 1)[1:]
+        for i in np.where(self.group_ntiles == 0)[0]:
+            self.log.error('No tiles covered by rule {}'.format(self.group_names[i]))
+        triggered = ndone + self.group_orphans >= self.group_ntiles
+        # Apply rules to each group.
+        group_priority = np.zeros(ngroups)
         priorities = np.zeros_like(self.dec_priority)
-        for gid, name in zip(np.unique(self.group_ids), self.group_names):
-            priority = 0
-            for condition, value in self.group_rules[name].items():
-                if triggered[condition]:
-                    priority = max(priority, value)
-            sel = self.group_ids == gid
-            priorities[sel] = priority * self.dec_priority[sel]
-        return priorities
+        for i, sel in enumerate(self.group_tiles):
+            group_priority[i] = self._evaluate_group(i, triggered)
+            priorities[sel] = group_priority[i] * self.dec_priority[sel]
+        # Save our state for subsequent incremental updates.
+        self._completed = completed.copy()
+        self._ndone = ndone
+        self._triggered = triggered
+        self._group_priority = group_priority
+        self._priorities = priorities
+        return priorities.copy()
+
+    def apply_incremental(self, newly_completed):
+        """Update tile priorities for newly completed tiles.
+
+        Only subgroups containing newly completed tiles are checked for
+        changes in their trigger condition, and only the dependents of a
+        subgroup whose trigger condition has changed are re-evaluated.
+        The results are identical to calling :meth:`apply` with the
+        cumulative completion status. If :meth:`apply` has not been
+        called yet, no tiles are assumed to be previously completed.
+
+        Parameters
+        ----------
+        newly_completed : array
+            Boolean array of per-tile completion status or array of
+            tile indices. Tiles that were already completed are ignored.
+
+        Returns
+        -------
+        array
+            1D array of tile indices whose priority has changed. Use
+            :attr:`priorities` to look up the new values.
+        """
+        if self._completed is None:
+            self.apply(np.zeros(len(self.group_ids), bool))
+        newly_completed = np.asarray(newly_completed)
+        if newly_completed.dtype == bool:
+            newly_completed = np.where(newly_completed)[0]
+        new_idx = newly_completed[~self._completed[newly_completed]]
+        if len(new_idx) == 0:
+            return np.zeros(0, int)
+        self._completed[new_idx] = True
+        ngroups = len(self.group_names)
+        # Update completion counts of groups containing new tiles.
+        dndone = np.bincount(self.group_ids[new_idx], minlength=ngroups + 1)[1:]
+        self._ndone += dndone
+        # Find groups whose trigger condition changes.
+        touched = np.where(dndone > 0)[0]
+        triggered = self._ndone[touched] + self.group_orphans[touched] >= self.group_ntiles[touched]
+        flipped = touched[triggered != self._triggered[touched]]
+        if len(flipped) == 0:
+            return np.zeros(0, int)
+        self._triggered[flipped] = ~self._triggered[flipped]
+        # Propagate to dependent groups.
+        dependents = set()
+        for j in flipped:
+            dependents.update(self.group_dependents[j])
+        changed = []
+        for i in sorted(dependents):
+            priority = self._evaluate_group(i, self._triggered)
+            if priority != self._group_priority[i]:
+                self._group_priority[i] = priority
+                sel = self.group_tiles[i]
+                self._priorities[sel] = priority * self.dec_priority[sel]
+                changed.append(sel)
+        if not changed:
+            return np.zeros(0, int)
+        return np.sort(np.concatenate(changed))
+
+    @property
+    def priorities(self):
+        """Per-tile priorities from the last :meth:`apply` or :meth:`apply_incremental`.
+
+        This array is updated in place and should not be modified.
+        """
+        return self._priorities
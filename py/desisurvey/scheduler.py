@@ -18,6 +18,7 @@ import desisurvey.utils
 import desisurvey.etc
 import desisurvey.tiles
 import desisurvey.ephem
+import desisurvey.snapshot
 
 
 class Scheduler(object):
@@ -41,12 +42,13 @@ class Scheduler(object):
 
     Parameters
     ----------
-    restore : str or None
+    restore : str, tuple or None
         Restore internal state from the snapshot saved to this filename,
         or initialize a new scheduler when None. Use :meth:`save` to
         save a snapshot to be restored later. Filename is relative to
         the configured output path unless an absolute path is
-        provided.
+        provided. A tuple (arrays, meta), as returned by
+        :meth:`desisurvey.snapshot.SnapshotHistory.read`, is also accepted.
     design_hourangles : array or None
         1D array of design hour angles to use in degrees, or use
         :func:`desisurvey.plan.load_design_hourangle` when None.
@@ -75,11 +77,25 @@ class Scheduler(object):
         # Initialize snr2frac, which is our only internal state.
         if restore is not None:
             # Restore the snr2frac array for a survey in progress.
-            fullname = config.get_path(restore)
-            if not os.path.exists(fullname):
-                raise RuntimeError('Cannot restore scheduler from non-existent "{}".'.format(fullname))
-            with astropy.io.fits.open(fullname, memmap=False) as hdus:
-                self.snr2frac = hdus[0].data.copy()
+            if isinstance(restore, tuple):
+                # Restore from (arrays, meta) already read from a snapshot.
+                arrays, meta = restore
+                fullname = 'snapshot arrays'
+            else:
+                fullname = config.get_path(restore)
+                if not os.path.exists(fullname):
+                    raise RuntimeError('Cannot restore scheduler from non-existent "{}".'.format(fullname))
+            if isinstance(restore, tuple) or desisurvey.snapshot.is_snapshot(fullname):
+                if not isinstance(restore, tuple):
+                    arrays, meta = desisurvey.snapshot.read_snapshot(fullname)
+                if not np.array_equal(arrays['TILEID'], self.tiles.tileID):
+                    raise RuntimeError('Saved tile IDs do not match current tiles_file.')
+                if 'SCHED_SNR2FRAC' not in arrays:
+                    raise RuntimeError('No scheduler state saved in "{}".'.format(fullname))
+                self.snr2frac = arrays['SCHED_SNR2FRAC']
+            else:
+                with astropy.io.fits.open(fullname, memmap=False) as hdus:
+                    self.snr2frac = hdus[0].data.copy()
             if self.snr2frac.shape != (ntiles,):
                 raise ValueError('Invalid snr2frac array shape.')
             self.log.debug('Restored scheduler snapshot from "{}".'.format(fullname))
@@ -102,13 +118,19 @@ class Scheduler(object):
         self.tile_sel = np.zeros(ntiles, bool)
         self.LST = 0.
         self.night = None
-        # Load the ephemerides to use.
+        self.cube_mjd = None
+        self.tile_xyz = _unit_vector(self.tiles.tileRA, self.tiles.tileDEC)
+        # Load the ephemerides and exposure-time model to use.
         self.ephem = desisurvey.ephem.get_ephem()
+        self.exposure_model = desisurvey.etc.get_exposure_model()
         # Initialize tile availability and priority.
         # No tiles will be scheduled until these are updated using update_tiles().
         self.tile_available = np.zeros(self.tiles.ntiles, bool)
         self.tile_planned = np.zeros(self.tiles.ntiles, bool)
         self.tile_priority = np.zeros(self.tiles.ntiles, float)
+        self.log_priority = np.full(self.tiles.ntiles, -np.inf)
+        self.num_schedulable = 0
+        self.planet_positions = {}
         # Lookup avoidance cone angles.
         self.avoid_bodies = {}
         for body in config.avoid_bodies.keys:
@@ -120,35 +142,45 @@ class Scheduler(object):
         The only internal state required to restore a Scheduler is the array
         of snr2frac values per tile.
 
-        The snapshot file size is about 130Kb.
+        The snapshot file size is about 130Kb. A name with the ``.npz``
+        extension saves a faster binary snapshot instead, using
+        :func:`desisurvey.snapshot.write_snapshot`.
 
         Parameters
         ----------
         name : str
-            Name of FITS file where the snapshot will be saved. The file will
+            Name of FITS or npz file where the snapshot will be saved. The file will
             be saved under our configuration's output path unless name is
             already an absolute path.  Pass the same name to the constructor's
             ``restore`` argument to restore this snapshot.
         """
         config = desisurvey.config.Configuration()
         fullname = config.get_path(name)
-        hdr = astropy.io.fits.Header()
-        # Record the last night this scheduler was initialized for.
-        hdr['NIGHT'] = self.night.isoformat() if self.night else ''
-        # Record the number of completed tiles.
-        hdr['NDONE'] = self.completed_by_pass.sum()
-        # Save a copy of our snr2frac array.
-        astropy.io.fits.PrimaryHDU(self.snr2frac, header=hdr).writeto(fullname+'.tmp', overwrite=True)
-        os.rename(fullname+'.tmp', fullname)
+        if desisurvey.snapshot.is_snapshot(fullname):
+            desisurvey.snapshot.write_snapshot(fullname, scheduler=self)
+        else:
+            hdr = astropy.io.fits.Header()
+            # Record the last night this scheduler was initialized for.
+            hdr['NIGHT'] = self.night.isoformat() if self.night else ''
+            # Record the number of completed tiles.
+            hdr['NDONE'] = self.completed_by_pass.sum()
+            # Save a copy of our snr2frac array.
+            astropy.io.fits.PrimaryHDU(self.snr2frac, header=hdr).writeto(fullname+'.tmp', overwrite=True)
+            os.rename(fullname+'.tmp', fullname)
         self.log.debug('Saved scheduler snapshot to "{}".'.format(fullname))
 
-    def update_tiles(self, tile_available, tile_priority):
+    def update_tiles(self, tile_available, tile_priority, changed=None):
         """Update tile availability and priority.
 
         A valid update must have some tiles available with priority > 0.
         Once a tile has been "planned", i.e., assigned priority > 0, it can
         not be later un-planned, i.e., assigned zero priority.
 
+        Only the tiles whose availability or priority has changed are updated,
+        so this method can be called during a night, e.g. to apply priority
+        changes requested by an operator.  Any newly available and planned
+        tiles are added to the pool of tiles that can be observed tonight.
+
         Parameters
         ----------
         tile_available : array
@@ -156,6 +188,13 @@ class Scheduler(object):
             and so are available to schedule.
         tile_priority : array
             1D array of per-tile priority values >= 0 used to implement survey strategy.
+        changed : array or None
+            1D array of tile indices whose availability or priority might have
+            changed since the last update, e.g., from
+            :meth:`desisurvey.rules.Rules.apply_incremental`.  Tiles not included
+            are assumed unchanged.  When None, the changed tiles are identified
+            by comparing the inputs with our current state.  Repeated indices
+            are only counted once.
 
         Returns
         -------
@@ -163,37 +202,76 @@ class Scheduler(object):
             Tuple (new_available, new_planned) of 1D arrays of tile indices that
             identify any tiles are newly available or "planned" (assigned priority > 0).
         """
-        new_available = tile_available & ~self.tile_available
-        new_unavailable = ~tile_available & self.tile_available
-        if np.any(new_unavailable):
+        if changed is None:
+            changed = np.where(
+                (tile_available != self.tile_available) |
+                (tile_priority != self.tile_priority))[0]
+        else:
+            # Repeated indices would be counted more than once below.
+            changed = np.unique(np.asarray(changed, int))
+        available = tile_available[changed]
+        was_available = self.tile_available[changed]
+        if np.any(was_available & ~available):
             raise RuntimeError('Some previously available tiles now unavailable.')
-        self.tile_available[new_available] = True
 
-        assert np.all(self.tile_priority >= 0)
-        if np.any(tile_priority < 0):
+        priority = tile_priority[changed]
+        if np.any(priority < 0):
             raise ValueError('All tile priorities must be >= 0.')
-        tile_planned = tile_priority > 0
-        new_planned = tile_planned & ~self.tile_planned
-        new_unplanned = ~tile_planned & self.tile_planned
-        if np.any(new_unplanned):
+        planned = priority > 0
+        was_planned = self.tile_planned[changed]
+        if np.any(was_planned & ~planned):
             raise RuntimeError('Some previously planned tiles now have zero priority.')
+
+        new_available = changed[available & ~was_available]
+        new_planned = changed[planned & ~was_planned]
+        self.tile_available[new_available] = True
         self.tile_planned[new_planned] = True
-        # Tile priorities can change after they become > 0, so copy all planned priorities,
-        # not just the newly planned priorities.
-        self.tile_priority[self.tile_planned] = tile_priority[self.tile_planned]
+        # Tile priorities can change after they become > 0, so copy all changed
+        # planned priorities, not just the newly planned priorities.
         # Precompute log(priority) since that is what we use for scheduling.
-        # Ignore harmless warnings about log(0) = -inf.
-        with np.errstate(divide='ignore'):
-            self.log_priority = np.log(self.tile_priority)
-
-        if not np.any(self.tile_available & self.tile_planned):
+        self.tile_priority[changed[planned]] = priority[planned]
+        self.log_priority[changed[planned]] = np.log(priority[planned])
+        # Keep track of how many tiles could be scheduled.
+        schedulable = available & planned
+        self.num_schedulable += (
+            np.count_nonzero(schedulable) - np.count_nonzero(was_available & was_planned))
+
+        if self.num_schedulable == 0:
             raise ValueError('No available tiles with priority > 0 to schedule.')
-        new_available, new_planned = np.where(new_available)[0], np.where(new_planned)[0]
+        if self.night is not None:
+            # Add any newly schedulable tiles to tonight's pool.
+            add = changed[schedulable & ~self.completed[changed] & ~self.in_night_pool[changed]]
+            add = add[~self.too_close_to_planet(add)]
+            self.in_night_pool[add] = True
         self.log.debug('{} new available tiles, {} new planned tiles.'.format(
             len(new_available), len(new_planned)))
         return new_available, new_planned
 
-    def init_night(self, night, use_twilight=False):
+    def too_close_to_planet(self, idx):
+        """Identify tiles that are too close to a planet tonight.
+
+        Uses the planet positions at midnight calculated by :meth:`init_night`.
+
+        Parameters
+        ----------
+        idx : array
+            1D array of tile indices to check.
+
+        Returns
+        -------
+        array
+            1D array of booleans for each input index.
+        """
+        too_close = np.zeros(len(idx), bool)
+        if len(idx) == 0:
+            return too_close
+        for body, (bodyRA, bodyDEC) in self.planet_positions.items():
+            too_close |= desisurvey.utils.separation_matrix(
+                [bodyRA], [bodyDEC], self.tiles.tileRA[idx], self.tiles.tileDEC[idx],
+                self.avoid_bodies[body])[0]
+        return too_close
+
+    def init_night(self, night, use_twilight=False, cube_interval=None):
         """Initialize scheduling for the specified night.
 
         Must be called before calls to :meth:`next_tile` and
@@ -206,11 +284,16 @@ class Scheduler(object):
          - Have not already reached their target SNR (aka "completed").
          - Are not too close to a planet during this night.
 
-        Tile availability and priority is assumed fixed during the night.
+        Tiles that become available and planned during the night, via
+        :meth:`update_tiles`, are added to this pool.
         When the moon is up, tiles are also vetoed if they are too
         close to the moon. The angles that define "too close" to a
         planet or the moon are specified in config.avoid_bodies.
 
+        When ``cube_interval`` is set, exposure factors and observability
+        are also precomputed for the initial pool of tiles on a grid of
+        times covering the night.  See :meth:`init_night_cube` for details.
+
         Parameters
         ----------
         night : str
@@ -218,8 +301,9 @@ class Scheduler(object):
         use_twilight : bool
             Include twilight when calculating the scheduled program changes
             during this night when True.
-        verbose : bool
-            Generate verbose logging output when True.
+        cube_interval : float or None
+            Maximum spacing in minutes of the time grid used to precompute
+            exposure factors, or do not precompute them when None.
         """
         self.log.debug('Initializing scheduler for {}'.format(night))
         if self.tile_available is None or self.tile_priority is None:
@@ -247,12 +331,14 @@ class Scheduler(object):
         poolRA = self.tiles.tileRA[self.in_night_pool]
         poolDEC = self.tiles.tileDEC[self.in_night_pool]
         avoid_idx = []
+        self.planet_positions = {}
         for body in self.avoid_bodies:
             if body == 'moon':
                 continue
             # Get body (RA,DEC) at midnight.
             bodyDEC, bodyRA = desisurvey.ephem.get_object_interpolator(
                 self.night_ephem, body, altaz=False)(midnight)
+            self.planet_positions[body] = (bodyRA, bodyDEC)
             too_close = desisurvey.utils.separation_matrix(
                 [bodyRA], [bodyDEC], poolRA, poolDEC, self.avoid_bodies[body])[0]
             if np.any(too_close):
@@ -268,6 +354,190 @@ class Scheduler(object):
         # Initialize sun tracking during this night.
         self.sun_DECRA = desisurvey.ephem.get_object_interpolator(self.night_ephem, 'sun', altaz=False) 
         self.sun_ALTAZ = desisurvey.ephem.get_object_interpolator(self.night_ephem, 'sun', altaz=True) 
+        # Cache the sun, moon and tile-independent bright-sky terms during this night.
+        self.init_night_sky()
+        # Precompute exposure factors during this night.
+        if cube_interval is not None:
+            self.init_night_cube(cube_interval)
+        else:
+            self.cube_mjd = None
+
+    sky_interval = 1.
+    """Spacing in minutes of the grid used to cache the sun and moon each night."""
+
+    def init_night_sky(self):
+        """Cache the sun and moon on a fine grid of times for this night.
+
+        Called by :meth:`init_night` to tabulate the sun and moon unit
+        vectors and the tile-independent terms of the bright-sky exposure
+        factor, calculated with :func:`desisurvey.etc.bright_sky_terms`,
+        every ``sky_interval`` minutes from bright dusk to bright dawn.
+        Use :meth:`night_sky` to interpolate these values.
+        """
+        MJD1 = self.night_ephem['brightdawn']
+        ntimes = int(np.ceil((MJD1 - self.MJD0) * 24 * 60 / self.sky_interval)) + 1
+        mjd = np.linspace(self.MJD0, MJD1, ntimes)
+        moonDEC, moonRA = self.moon_DECRA(mjd)
+        moonALT, _ = self.moon_ALTAZ(mjd)
+        sunDEC, sunRA = self.sun_DECRA(mjd)
+        sunALT, _ = self.sun_ALTAZ(mjd)
+        self.sky_mjd = mjd
+        self.sky_moon_xyz = _unit_vector(moonRA, moonDEC)
+        self.sky_sun_xyz = _unit_vector(sunRA, sunDEC)
+        self.sky_alt = np.stack((moonALT, sunALT), axis=-1)
+        self.sky_terms = desisurvey.etc.bright_sky_terms(
+            self.night_ephem['moon_illum_frac'], moonALT, sunALT)
+        # The bright-sky model switches discontinuously when the moon rises or
+        # sets and when twilight starts or ends, so flag grid intervals where the
+        # terms should be recalculated instead of interpolated.
+        regime = (moonALT >= 0) + 2 * (sunALT >= -20.)
+        self.sky_switch = regime[1:] != regime[:-1]
+
+    def night_sky(self, mjd):
+        """Interpolate the cached sun and moon for this night.
+
+        Times outside the cached grid are clipped to its endpoints.
+
+        Parameters
+        ----------
+        mjd : float or array
+            MJD value(s) to interpolate.
+
+        Returns
+        -------
+        tuple
+            Tuple (moon_xyz, sun_xyz, terms) of moon and sun unit vectors
+            with shape (...,3) and bright-sky terms with shape (...,13),
+            where ... is the shape of the input mjd.
+        """
+        t = (np.clip(mjd, self.sky_mjd[0], self.sky_mjd[-1]) - self.sky_mjd[0]) / (
+            self.sky_mjd[1] - self.sky_mjd[0])
+        i = np.minimum(np.asarray(t).astype(int), len(self.sky_mjd) - 2)
+        w = np.asarray(t - i)[..., np.newaxis]
+        moon_xyz, sun_xyz, terms = [
+            (1 - w) * table[i] + w * table[i + 1]
+            for table in (self.sky_moon_xyz, self.sky_sun_xyz, self.sky_terms)]
+        switch = self.sky_switch[i]
+        if np.any(switch):
+            alt = (1 - w[switch]) * self.sky_alt[i[switch]] + w[switch] * self.sky_alt[i[switch] + 1]
+            terms[switch] = desisurvey.etc.bright_sky_terms(
+                self.night_ephem['moon_illum_frac'], alt[..., 0], alt[..., 1])
+        moon_xyz /= np.sqrt(np.sum(moon_xyz ** 2, axis=-1, keepdims=True))
+        sun_xyz /= np.sqrt(np.sum(sun_xyz ** 2, axis=-1, keepdims=True))
+        return moon_xyz, sun_xyz, terms
+
+    def init_night_cube(self, interval):
+        """Precompute exposure factors on a time x tile grid for this night.
+
+        Called by :meth:`init_night` when its ``cube_interval`` is set, and
+        covers the tiles in the night pool when it is called.  The following
+        arrays with shape (ntimes, ntiles) are calculated on a uniform grid of
+        times ``cube_mjd`` spanning bright dusk to bright dawn:
+
+         - cube_airmass_factor: airmass exposure factor.
+         - cube_sky_factor: bright-sky (moon and twilight) exposure factor,
+           excluding the airmass factor.
+         - cube_observable: True if the tile passes the airmass, hour angle
+           and moon avoidance cuts used by :meth:`next_tile`.
+
+        The corresponding tile indices are ``cube_tiles``.  Use
+        :meth:`forecast_exposure_factor` to forecast exposure factors
+        for the rest of the night.
+
+        Parameters
+        ----------
+        interval : float
+            Maximum spacing of the time grid in minutes.
+        """
+        if self.night is None:
+            raise ValueError('Must call init_night() before init_night_cube().')
+        if interval <= 0:
+            raise ValueError('Expected cube interval > 0.')
+        MJD1 = self.night_ephem['brightdawn']
+        ntimes = int(np.ceil((MJD1 - self.MJD0) * 24 * 60 / interval)) + 1
+        mjd = np.linspace(self.MJD0, MJD1, ntimes)
+        idx = np.where(self.in_night_pool)[0]
+        tileRA = self.tiles.tileRA[idx]
+        # Calculate the hour angle and airmass on the grid.
+        LST = self.LST0 + self.dLST * (mjd - self.MJD0)
+        hourangle = LST[:, np.newaxis] - tileRA
+        airmass = self.tiles.airmass(hourangle, idx)
+        absha = np.abs(((hourangle + 180) % 360) - 180)
+        observable = (airmass < self.max_airmass) & (absha < self.max_ha)
+        airmass = np.minimum(airmass, self.max_airmass)
+        # Interpolate the cached moon and sun on the grid.
+        moon_xyz, sun_xyz, terms = self.night_sky(mjd)
+        moonSEP = _separation(moon_xyz, self.tile_xyz[idx])
+        sunSEP = _separation(sun_xyz, self.tile_xyz[idx])
+        # Apply the moon avoidance veto while the moon is up.
+        moon_is_up = (mjd > self.night_ephem['moonrise']) & (mjd < self.night_ephem['moonset'])
+        observable &= ~(moon_is_up[:, np.newaxis] & (moonSEP <= self.avoid_bodies['moon']))
+        # Calculate the exposure factors on the grid.
+        sky_factor = desisurvey.etc.bright_exposure_factor_from_terms(
+            terms[:, np.newaxis], airmass, moonSEP, sunSEP)
+        self.cube_mjd = mjd
+        self.cube_tiles = idx
+        self.cube_airmass_factor = self.exposure_model.airmass_exposure_factor(airmass)
+        self.cube_sky_factor = sky_factor
+        self.cube_observable = observable
+        self.cube_index = np.full(self.tiles.ntiles, -1, int)
+        self.cube_index[idx] = np.arange(len(idx))
+        self.log.debug('  Precomputed exposure factors for {} tiles at {} times.'.format(
+            len(idx), ntimes))
+
+    def interpolate_cube(self, mjd, cube, idx):
+        """Linearly interpolate precomputed values in time.
+
+        Parameters
+        ----------
+        mjd : float
+            Time to interpolate to, which is clipped to the cube time grid.
+        cube : array
+            Array of precomputed values with shape (ntimes, ntiles).
+        idx : array
+            1D array of cube tile indices to interpolate.
+
+        Returns
+        -------
+        array
+            1D array of interpolated values for each tile index.
+        """
+        mjd = np.clip(mjd, self.cube_mjd[0], self.cube_mjd[-1])
+        i = min(np.searchsorted(self.cube_mjd, mjd, side='right') - 1, len(self.cube_mjd) - 2)
+        w = (mjd - self.cube_mjd[i]) / (self.cube_mjd[i + 1] - self.cube_mjd[i])
+        return (1 - w) * cube[i, idx] + w * cube[i + 1, idx]
+
+    def forecast_exposure_factor(self, mjd_now):
+        """Forecast exposure factors for the rest of the night.
+
+        Uses the exposure factors precomputed by :meth:`init_night_cube`, so
+        the forecast only covers tiles that were in the night pool when the
+        night was initialized and have not since been removed.  Weather
+        factors are not included.
+
+        Parameters
+        ----------
+        mjd_now : float
+            Time when the forecast is being made.
+
+        Returns
+        -------
+        tuple
+            Tuple (mjd, tileID, factor) where mjd is a 1D array of grid times
+            after ``mjd_now``, tileID is a 1D array of forecast tile IDs and
+            factor is a 2D array of exposure factors with shape
+            (len(mjd), len(tileID)), including dust, airmass and bright-sky
+            factors. Factors are infinite when a tile is not observable.
+        """
+        if self.cube_mjd is None:
+            raise RuntimeError('Must call init_night() with cube_interval set first.')
+        later = self.cube_mjd > mjd_now
+        keep = self.in_night_pool[self.cube_tiles]
+        idx = self.cube_tiles[keep]
+        factor = (self.cube_airmass_factor[later][:, keep] *
+                  self.cube_sky_factor[later][:, keep] * self.tiles.dust_factor[idx])
+        factor[~self.cube_observable[later][:, keep]] = np.inf
+        return self.cube_mjd[later], self.tiles.tileID[idx], factor
 
     def next_tile(self, mjd_now, ETC, seeing, transp, skylevel, HA_sigma=15.,
             greediness=0., use_brightsky=False, program=None):
@@ -398,12 +668,26 @@ class Scheduler(object):
         # Estimate exposure factors for all available tiles.
         self.exposure_factor[:] = 1e8
         self.exposure_factor[self.tile_sel] = self.tiles.dust_factor[self.tile_sel]
-        if use_brightsky: 
+        if use_brightsky and self.cube_mjd is not None:
+            # Interpolate the precomputed bright-sky factors where available.
+            sel = np.where(self.tile_sel)[0]
+            cube_idx = self.cube_index[sel]
+            in_cube = cube_idx >= 0
+            fexp = np.empty(len(sel))
+            fexp[in_cube] = self.exposure_model.airmass_exposure_factor(
+                self.airmass[sel[in_cube]]) * self.interpolate_cube(
+                    mjd_now, self.cube_sky_factor, cube_idx[in_cube])
+            if not np.all(in_cube):
+                # Tiles added to the pool after init_night are not precomputed.
+                fexp[~in_cube] = self.update_exposure_factor(
+                    mjd_now, self.tiles.tileID[sel[~in_cube]])
+            self.exposure_factor[sel] *= fexp
+        elif use_brightsky:
             self.exposure_factor[self.tile_sel] *= \
                     self.update_exposure_factor(mjd_now, self.tiles.tileID[self.tile_sel])
         else: 
             self.exposure_factor[self.tile_sel] *= \
-                    desisurvey.etc.airmass_exposure_factor(self.airmass[self.tile_sel])
+                    self.exposure_model.airmass_exposure_factor(self.airmass[self.tile_sel])
         # Apply global weather factors that are the same for all tiles.
         self.exposure_factor[self.tile_sel] /= ETC.weather_factor(seeing, transp)
 
@@ -458,33 +742,41 @@ class Scheduler(object):
         """
         return self.completed_by_pass.sum() == self.tiles.ntiles
     
-    def update_exposure_factor(self, mjd, tileid): 
-        """ get updated exposure factor on this night given mjd, and tile ID.
+    def update_exposure_factor(self, mjd, tileid):
+        """Calculate the airmass and bright-sky exposure factors for tiles.
+
+        Uses the sun and moon cached by :meth:`init_night_sky`, so only the
+        tile-dependent airmass and separation angles are evaluated here.
+
+        Parameters
+        ----------
+        mjd : float
+            MJD value when the tiles would be observed.
+        tileid : int or array
+            ID(s) of the tiles to calculate.
+
+        Returns
+        -------
+        array
+            Array of exposure factors for each tile.
         """
-        # get tile index 
-        idx = [] 
-        for _id in np.atleast_1d(tileid): 
-            idx.append(np.where(self.tiles.tileID == _id)[0])
-        idx = np.array(idx).flatten() 
-        assert len(idx) > 0  
-
-        # (RA,DEC) of the moon and sun at mjd
-        moonDEC, moonRA = self.moon_DECRA(mjd)
-        moonALT, moonAZ = self.moon_ALTAZ(mjd) 
-        sunDEC, sunRA = self.sun_DECRA(mjd)
-        sunALT, sunAZ = self.sun_ALTAZ(mjd) 
-
-        # moon illumination 
-        moonILL = self.night_ephem['moon_illum_frac']
-
-        # calculate moon and sun separation 
-        moonSEP = desisurvey.utils.separation_matrix(
-            [moonRA], [moonDEC],
-            self.tiles.tileRA[idx], self.tiles.tileDEC[idx])
-        sunSEP = desisurvey.utils.separation_matrix(
-            [sunRA], [sunDEC],
-            self.tiles.tileRA[idx], self.tiles.tileDEC[idx])
-
-        fexp = desisurvey.etc.exposure_factor(
-                self.airmass[idx], moonILL, moonSEP, moonALT, sunSEP, sunALT)
-        return fexp
+        idx = self.tiles.index(np.atleast_1d(tileid))
+        moon_xyz, sun_xyz, terms = self.night_sky(mjd)
+        moonSEP = _separation(moon_xyz, self.tile_xyz[idx])
+        sunSEP = _separation(sun_xyz, self.tile_xyz[idx])
+        airmass = self.airmass[idx]
+        return self.exposure_model.airmass_exposure_factor(airmass) * \
+            desisurvey.etc.bright_exposure_factor_from_terms(terms, airmass, moonSEP, sunSEP)
+
+
+def _unit_vector(ra, dec):
+    """Convert (ra,dec) in degrees to unit vectors with shape (...,3).
+    """
+    ra, dec = np.deg2rad(ra), np.deg2rad(dec)
+    return np.stack((np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)), axis=-1)
+
+
+def _separation(xyz1, xyz2):
+    """Calculate the separation matrix in degrees between unit vectors.
+    """
+    return np.rad2deg(np.arccos(np.clip(np.dot(xyz1, xyz2.T), -1., 1.)))
@@ -0,0 +1,615 @@
+"""Script wrapper for benchmarking performance-critical survey operations.
+
+Each benchmark times alternative implementations of the same operation
+and prints the results, in order to validate performance optimizations
+in this package.  Benchmarks that create a
+:class:`desisurvey.plan.Planner` or :class:`desisurvey.scheduler.Scheduler`
+use the tabulated ephemerides, which are calculated the first time they
+are needed.
+
+To run this script from the command line, use the ``surveybench`` entry point
+that is created when this package is installed, and should be in your shell
+command search path.
+"""
+from __future__ import print_function, division, absolute_import
+
+import os
+import argparse
+import datetime
+import timeit
+from itertools import chain, combinations_with_replacement
+
+import numpy as np
+
+import astropy.units as u
+
+import desiutil.log
+
+import desimodel.weather
+
+import desisurvey.config
+import desisurvey.tiles
+import desisurvey.plan
+import desisurvey.optimize
+import desisurvey.scheduler
+import desisurvey.snapshot
+import desisurvey.etc
+import desisurvey.utils
+import desisurvey.weather
+
+
+def parse(options=None):
+    """Parse command-line options for running benchmarks.
+    """
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        'benchmarks', nargs='*', metavar='NAME', default=sorted(BENCHMARKS),
+        help='benchmarks to run from: {}'.format(', '.join(sorted(BENCHMARKS))))
+    parser.add_argument(
+        '--verbose', action='store_true',
+        help='display log messages with severity >= info')
+    parser.add_argument(
+        '--debug', action='store_true',
+        help='display log messages with severity >= debug (implies verbose)')
+    parser.add_argument(
+        '--repeat', type=int, default=5, metavar='N',
+        help='number of times to repeat each timing measurement')
+    parser.add_argument(
+        '--seed', type=int, default=123, metavar='N',
+        help='random number seed to use for generating inputs')
+    parser.add_argument(
+        '--output-path', default=None, metavar='PATH',
+        help='output path to use instead of config.output_path')
+    parser.add_argument(
+        '--tiles-file', default=None, metavar='TILES',
+        help='name of tiles file to use instead of config.tiles_file')
+    parser.add_argument(
+        '--config-file', default='config.yaml', metavar='CONFIG',
+        help='input configuration file')
+
+    if options is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(options)
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('Invalid benchmark name: "{}".'.format(name))
+
+    return args
+
+
+def time_call(func, repeat, number=1):
+    """Time a function call.
+
+    Parameters
+    ----------
+    func : callable
+        Function to call with no arguments.
+    repeat : int
+        Number of timing measurements to make.
+    number : int
+        Number of calls per timing measurement.
+
+    Returns
+    -------
+    float
+        Best time per call in seconds.
+    """
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def report(title, timings):
+    """Print a summary of timings for alternative implementations.
+
+    Parameters
+    ----------
+    title : str
+        Title to print.
+    timings : list
+        List of (label, seconds) tuples. Speedups are reported relative
+        to the first entry.
+    """
+    print(title)
+    print('-' * len(title))
+    t0 = timings[0][1]
+    for label, t in timings:
+        print('{:>30s} {:10.3f} ms {:8.1f}x'.format(label, 1e3 * t, t0 / t))
+    print()
+
+
+def bench_snapshot(args):
+    """Compare FITS and binary snapshots of planner and scheduler state.
+    """
+    config = desisurvey.config.Configuration()
+    tiles = desisurvey.tiles.get_tiles()
+    planner = desisurvey.plan.Planner()
+    scheduler = desisurvey.scheduler.Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+    gen = np.random.RandomState(args.seed)
+    scheduler.snr2frac[:] = gen.uniform(size=tiles.ntiles)
+
+    def save_fits():
+        planner.save('bench_planner.fits')
+        scheduler.save('bench_scheduler.fits')
+
+    def restore_fits():
+        desisurvey.plan.Planner(restore='bench_planner.fits')
+        desisurvey.scheduler.Scheduler(
+            restore='bench_scheduler.fits', design_hourangle=scheduler.design_hourangle)
+
+    def save_npz():
+        desisurvey.snapshot.write_snapshot(
+            config.get_path('bench_snapshot.npz'), planner=planner, scheduler=scheduler)
+
+    def restore_npz():
+        desisurvey.plan.Planner(restore='bench_snapshot.npz')
+        desisurvey.scheduler.Scheduler(
+            restore='bench_snapshot.npz', design_hourangle=scheduler.design_hourangle)
+
+    report('Save planner and scheduler snapshots', [
+        ('FITS', time_call(save_fits, args.repeat)),
+        ('npz', time_call(save_npz, args.repeat))])
+    report('Restore planner and scheduler snapshots', [
+        ('FITS', time_call(restore_fits, args.repeat)),
+        ('npz', time_call(restore_npz, args.repeat))])
+
+
+def bench_history(args, num_nights=100, num_observed=20):
+    """Compare nightly FITS snapshots with a deduplicated snapshot history.
+    """
+    config = desisurvey.config.Configuration()
+    tiles = desisurvey.tiles.get_tiles()
+    planner = desisurvey.plan.Planner()
+    scheduler = desisurvey.scheduler.Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+    history = desisurvey.snapshot.SnapshotHistory('bench_history')
+    gen = np.random.RandomState(args.seed)
+    first = config.first_day()
+    nights = [first + datetime.timedelta(days=i) for i in range(num_nights)]
+    fits_size = 0
+    for night in nights:
+        planner.afternoon_plan(night, scheduler.completed)
+        idx = gen.choice(tiles.ntiles, size=num_observed, replace=False)
+        scheduler.snr2frac[idx] += gen.uniform(size=num_observed)
+        planner.save('bench_planner_{}.fits'.format(night))
+        scheduler.save('bench_scheduler_{}.fits'.format(night))
+        fits_size += os.path.getsize(config.get_path('bench_planner_{}.fits'.format(night)))
+        fits_size += os.path.getsize(config.get_path('bench_scheduler_{}.fits'.format(night)))
+        history.save(night, planner, scheduler)
+    history_size = sum([
+        os.path.getsize(os.path.join(history.objects_path, name))
+        for name in os.listdir(history.objects_path)])
+    history_size += os.path.getsize(history.index_name)
+
+    def random_night():
+        return nights[gen.randint(num_nights)]
+
+    def restore_fits():
+        night = random_night()
+        desisurvey.plan.Planner(restore='bench_planner_{}.fits'.format(night))
+        desisurvey.scheduler.Scheduler(
+            restore='bench_scheduler_{}.fits'.format(night),
+            design_hourangle=scheduler.design_hourangle)
+
+    def restore_history():
+        restore = history.read(random_night())
+        desisurvey.plan.Planner(restore=restore)
+        desisurvey.scheduler.Scheduler(
+            restore=restore, design_hourangle=scheduler.design_hourangle)
+
+    print('Storage for {} nights: FITS {:.1f} Mb, history {:.1f} Mb'.format(
+        num_nights, fits_size / 2 ** 20, history_size / 2 ** 20))
+    report('Restore a random night', [
+        ('FITS', time_call(restore_fits, args.repeat, number=10)),
+        ('history', time_call(restore_history, args.repeat, number=10))])
+
+
+def bench_moon(args, nevals=100000, nscalar=1000):
+    """Compare scalar, vectorized and tabulated scattered moonlight exposure factors.
+
+    The scalar timing is measured for ``nscalar`` evaluations and scaled
+    up to ``nevals`` evaluations.
+    """
+    gen = np.random.RandomState(args.seed)
+    moon_frac = gen.uniform(0, 1, nevals)
+    moon_sep = gen.uniform(0, 180, nevals)
+    moon_alt = gen.uniform(-90, 90, nevals)
+    airmass = gen.uniform(1, 2, nevals)
+
+    def scalar():
+        return np.array([
+            desisurvey.etc.moon_exposure_factor(
+                moon_frac[i], moon_sep[i], moon_alt[i], airmass[i])
+            for i in range(nscalar)])
+
+    def vector():
+        return desisurvey.etc.moon_exposure_factor(
+            moon_frac, moon_sep, moon_alt, airmass)
+
+    def tabulated():
+        return desisurvey.etc.moon_exposure_factor(
+            moon_frac, moon_sep, moon_alt, airmass, tabulated=True)
+
+    def tabulated_scalar():
+        return np.array([
+            desisurvey.etc.moon_exposure_factor(
+                moon_frac[i], moon_sep[i], moon_alt[i], airmass[i], tabulated=True)
+            for i in range(nscalar)])
+
+    exact = vector()
+    error = np.max(np.abs(scalar() - exact[:nscalar]))
+    print('Max abs difference of scalar and vector moon factors: {:.2g}'.format(error))
+    error = tabulated() / exact - 1
+    print('Tabulated moon factor relative error: max {:.2g}, RMS {:.2g}'.format(
+        np.max(np.abs(error)), np.sqrt(np.mean(error ** 2))))
+    report('Evaluate {} moon exposure factors'.format(nevals), [
+        ('scalar', time_call(scalar, args.repeat) * nevals / nscalar),
+        ('vector', time_call(vector, args.repeat)),
+        ('tabulated scalar', time_call(tabulated_scalar, args.repeat) * nevals / nscalar),
+        ('tabulated vector', time_call(tabulated, args.repeat))])
+
+    def scalar():
+        return [desisurvey.etc.exposure_time(
+            'GRAY', 1.1, 0.9, airmass[i], 0.01, moon_frac[i], moon_sep[i], moon_alt[i])
+            for i in range(nscalar)]
+
+    def vector():
+        return desisurvey.etc.exposure_time(
+            'GRAY', 1.1, 0.9, airmass, 0.01, moon_frac, moon_sep, moon_alt)
+
+    report('Evaluate {} exposure times'.format(nevals), [
+        ('scalar', time_call(scalar, args.repeat) * nevals / nscalar),
+        ('vector', time_call(vector, args.repeat))])
+
+
+def bench_bright(args, sizes=(1, 100, 5000)):
+    """Compare building and precompiling the bright-sky polynomial features.
+    """
+    gen = np.random.RandomState(args.seed)
+    coefs = desisurvey.etc._notwiCoefficients
+    for n in sizes:
+        airmass = gen.uniform(1, 2, n)
+        moon_frac = gen.uniform(0, 1, n)
+        moon_sep = gen.uniform(0, 180, n)
+        moon_alt = gen.uniform(-90, 90, n)
+
+        def build():
+            # Original implementation that builds all monomials on each call.
+            theta = np.atleast_2d(np.array([airmass, moon_frac, moon_sep, moon_alt]).T)
+            combs = chain.from_iterable(
+                combinations_with_replacement(range(4), i) for i in range(0, 4))
+            theta_transform = np.empty((theta.shape[0], len(coefs)))
+            for i, comb in enumerate(combs):
+                theta_transform[:, i] = theta[:, comb].prod(1)
+            return np.dot(theta_transform, coefs.T) + 3.0493419627360243
+
+        def compiled():
+            return desisurvey.etc._bright_exposure_factor_notwi(
+                airmass, moon_frac, moon_sep, moon_alt)
+
+        assert np.array_equal(build(), compiled())
+        number = max(1, 10000 // n)
+        report('Evaluate bright-sky polynomial for {} tiles'.format(n), [
+            ('build', time_call(build, args.repeat, number)),
+            ('compiled', time_call(compiled, args.repeat, number))])
+
+
+def bench_etc(args, nexp=200, cadences=(60., 1.), duration=3600.):
+    """Compare tracking many exposures with step-by-step, integrated and batch ETCs.
+
+    Conditions are sampled at each cadence, in seconds, for up to
+    ``duration`` seconds.
+    """
+    gen = np.random.RandomState(args.seed)
+    for cadence in cadences:
+        dt = cadence / 86400.
+        nsteps = int(round(duration / cadence))
+        seeing = gen.uniform(1.0, 1.2, (nsteps, nexp))
+        transp = gen.uniform(0.9, 1.0, (nsteps, nexp))
+        sky = gen.uniform(1.0, 1.5, (nsteps, nexp))
+        snr2frac = gen.uniform(0, 0.5, nexp)
+
+        def scalar():
+            exptime = np.empty(nexp)
+            for i in range(nexp):
+                ETC = desisurvey.etc.ExposureTimeCalculator()
+                ETC.start(0., 1, 'DARK', snr2frac[i], 1., 1.1, 1.0, 1.0)
+                step = 0
+                while step < nsteps:
+                    if not ETC.update((step + 1) * dt, seeing[step, i],
+                                      transp[step, i], sky[step, i]):
+                        break
+                    step += 1
+                ETC.stop((step + 1) * dt)
+                exptime[i] = ETC.exptime
+            return exptime
+
+        def integrate():
+            exptime = np.empty(nexp)
+            mjd = (np.arange(nsteps) + 1) * dt
+            for i in range(nexp):
+                ETC = desisurvey.etc.ExposureTimeCalculator()
+                ETC.start(0., 1, 'DARK', snr2frac[i], 1., 1.1, 1.0, 1.0)
+                nused, more = ETC.integrate(mjd, seeing[:, i], transp[:, i], sky[:, i])
+                ETC.stop(mjd[nused - 1] + (dt if more else 0))
+                exptime[i] = ETC.exptime
+            return exptime
+
+        def batch():
+            ETC = desisurvey.etc.BatchExposureTimeCalculator(nexp)
+            ETC.start(0., 1, 'DARK', snr2frac, 1., 1.1, 1.0, 1.0)
+            for step in range(nsteps):
+                active = ETC.active.copy()
+                more = ETC.update((step + 1) * dt, seeing[step], transp[step], sky[step])
+                ETC.stop((step + 1) * dt, mask=active & ~more)
+                if not np.any(ETC.active):
+                    break
+            ETC.stop((nsteps + 1) * dt)
+            return ETC.exptime
+
+        expected = scalar()
+        assert np.array_equal(expected, integrate())
+        assert np.allclose(expected, batch())
+        report('Track {} exposures sampled every {:.0f}s'.format(nexp, cadence), [
+            ('scalar', time_call(scalar, args.repeat)),
+            ('integrate', time_call(integrate, args.repeat)),
+            ('batch', time_call(batch, args.repeat))])
+
+
+def bench_weather(args, nrealizations=20, time_step=5.):
+    """Compare generating random conditions per realization and all at once.
+
+    Per-realization seeing and transparency are generated with
+    :func:`desimodel.weather.sample_seeing` and
+    :func:`desimodel.weather.sample_transp`.
+    """
+    config = desisurvey.config.Configuration()
+    num_nights = (config.last_day() - config.first_day()).days
+    nsamples = num_nights * int(np.ceil(24 * 60 / time_step))
+    gen = np.random.RandomState(args.seed)
+
+    def per_realization():
+        for i in range(nrealizations):
+            desimodel.weather.sample_seeing(nsamples, dt_sec=60 * time_step, gen=gen)
+            desimodel.weather.sample_transp(nsamples, dt_sec=60 * time_step, gen=gen)
+
+    def vectorized():
+        desisurvey.weather.Weather(
+            nrealizations=nrealizations, time_step=time_step, seed=args.seed)
+
+    report('Generate {} realizations of {} nights'.format(nrealizations, num_nights), [
+        ('per realization', time_call(per_realization, args.repeat)),
+        ('vectorized', time_call(vectorized, args.repeat))])
+
+
+def bench_sky(args, sizes=(1, 100, 5000)):
+    """Compare exact and cached bright-sky exposure factors for one decision.
+
+    The exact calculation interpolates the sun and moon ephemerides and
+    evaluates the full bright-sky model for each call, while the cached
+    calculation uses :meth:`desisurvey.scheduler.Scheduler.update_exposure_factor`.
+    """
+    config = desisurvey.config.Configuration()
+    tiles = desisurvey.tiles.get_tiles()
+    scheduler = desisurvey.scheduler.Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+    scheduler.update_tiles(np.ones(tiles.ntiles, bool), np.ones(tiles.ntiles))
+    scheduler.init_night(config.first_day())
+    gen = np.random.RandomState(args.seed)
+    scheduler.airmass[:] = gen.uniform(1, 2, tiles.ntiles)
+    ephem = scheduler.night_ephem
+    # Use a time during twilight when the model is most expensive.
+    mjd = ephem['brightdusk'] + 0.5 * (ephem['dusk'] - ephem['brightdusk'])
+    for n in sizes:
+        idx = np.sort(gen.choice(tiles.ntiles, min(n, tiles.ntiles), replace=False))
+        tileID = tiles.tileID[idx]
+
+        def exact():
+            moonDEC, moonRA = scheduler.moon_DECRA(mjd)
+            moonALT, _ = scheduler.moon_ALTAZ(mjd)
+            sunDEC, sunRA = scheduler.sun_DECRA(mjd)
+            sunALT, _ = scheduler.sun_ALTAZ(mjd)
+            moonSEP = desisurvey.utils.separation_matrix(
+                [moonRA], [moonDEC], tiles.tileRA[idx], tiles.tileDEC[idx])
+            sunSEP = desisurvey.utils.separation_matrix(
+                [sunRA], [sunDEC], tiles.tileRA[idx], tiles.tileDEC[idx])
+            return scheduler.exposure_model.exposure_factor(
+                scheduler.airmass[idx], ephem['moon_illum_frac'], moonSEP, moonALT, sunSEP, sunALT)
+
+        def cached():
+            return scheduler.update_exposure_factor(mjd, tileID)
+
+        assert np.allclose(exact(), cached(), rtol=1e-4, atol=0)
+        number = max(1, 10000 // n)
+        report('Evaluate bright-sky exposure factors for {} tiles'.format(len(idx)), [
+            ('exact', time_call(exact, args.repeat, number)),
+            ('cached', time_call(cached, args.repeat, number))])
+
+
+def get_optimizer(program='DARK', nbins=192, **kwargs):
+    """Create an optimizer for a smooth synthetic available LST histogram.
+    """
+    edges = np.linspace(0., 360., nbins + 1)
+    centers = 0.5 * (edges[1:] + edges[:-1])
+    hist = 10 + 5 * np.cos(np.radians(centers - 60)) + 2 * np.sin(np.radians(3 * centers))
+    return desisurvey.optimize.Optimizer(program, edges, hist, **kwargs)
+
+
+def bench_improve(args, nbins=(192, 1920), ncandidates=100):
+    """Compare optimizer plan calculations with dense and banded plans.
+
+    Dense plans have shape (ntiles, nbins).  Candidates are scored one at a
+    time and all at once with dense plans, and with banded plans using
+    :meth:`desisurvey.optimize.Optimizer.eval_move_scores`.  The plan is then
+    updated with a full recalculation and incrementally.
+    """
+    gen = np.random.RandomState(args.seed)
+    for n in nbins:
+        opt = get_optimizer(nbins=n, init='zero')
+        ha = gen.uniform(-30, 30, opt.ntiles)
+
+        def dense_plan():
+            # Original implementation using dense (ntiles, nbins) arrays.
+            exptime, _ = opt.get_exptime(ha)
+            lst_min = desisurvey.optimize.wrap(opt.ra + ha - 0.5 * exptime, opt.origin)
+            lst_max = desisurvey.optimize.wrap(opt.ra + ha + 0.5 * exptime, opt.origin)
+            lo = np.clip(opt.lst_edges[1:] - lst_min[:, np.newaxis], 0, opt.binsize)
+            hi = np.clip(lst_max[:, np.newaxis] - opt.lst_edges[:-1], 0, opt.binsize)
+            plan = lo + hi
+            plan[lst_max > lst_min] -= opt.binsize
+            return plan * 24. / 360.
+
+        def banded_plan():
+            return opt.get_plan(ha)
+
+        assert np.allclose(dense_plan(), opt.expand_plan(*banded_plan()), rtol=0, atol=1e-12)
+        report('Calculate plan of {} tiles with {} LST bins'.format(opt.ntiles, n), [
+            ('dense', time_call(dense_plan, args.repeat)),
+            ('banded', time_call(banded_plan, args.repeat))])
+
+        opt.plan_first, opt.plan_weights = opt.get_plan(ha)
+        opt.use_plan()
+        plan_tiles = opt.plan_tiles
+        subset = np.sort(gen.choice(opt.ntiles, ncandidates, replace=False))
+        first, weights = opt.get_plan(ha[subset] + 0.5 * opt.binsize, subset)
+        scenario = opt.expand_plan(first, weights)
+
+        def loop():
+            new_score = np.zeros(len(subset))
+            for i, itile in enumerate(subset):
+                new_plan_hist = opt.plan_hist - plan_tiles[itile] + scenario[i]
+                new_score[i] = opt.eval_score(new_plan_hist)
+            return new_score
+
+        def vectorized():
+            return opt.eval_score(opt.plan_hist - plan_tiles[subset] + scenario)
+
+        def banded():
+            return opt.eval_move_scores(subset, first, weights)
+
+        assert np.allclose(loop(), banded(), rtol=1e-12, atol=0)
+        report('Score {} optimizer candidates with {} LST bins'.format(len(subset), n), [
+            ('loop', time_call(loop, args.repeat, 10)),
+            ('vectorized', time_call(vectorized, args.repeat, 10)),
+            ('banded', time_call(banded, args.repeat, 10))])
+
+        # Compare full and incremental plan updates after accepting a move.
+        itile = subset[0]
+        plans = [(opt.plan_first[itile], opt.plan_weights[itile].copy()), (first[0], weights[0])]
+
+        def full():
+            for plan_first, plan_weights in plans:
+                opt.plan_first[itile] = plan_first
+                opt.plan_weights[itile] = 0.
+                opt.plan_weights[itile, :len(plan_weights)] = plan_weights
+                opt.use_plan()
+
+        def incremental():
+            for plan_first, plan_weights in plans:
+                opt.update_plan(itile, plan_first, plan_weights)
+
+        report('Update plan of {} tiles with {} LST bins'.format(opt.ntiles, n), [
+            ('full', time_call(full, args.repeat, 100)),
+            ('incremental', time_call(incremental, args.repeat, 100))])
+
+
+def bench_smoothing(args, radii=(5., 10.)):
+    """Compare dense and sparse optimizer smoothing weights.
+    """
+    opt = get_optimizer(init='zero')
+    gen = np.random.RandomState(args.seed)
+    ha = gen.uniform(-10, 10, opt.ntiles)
+    for radius in radii:
+
+        def dense_init():
+            # Original implementation using dense matrices.
+            separations = desisurvey.utils.separation_matrix(opt.ra, opt.dec, opt.ra, opt.dec)
+            weights = np.exp(-0.5 * (separations / radius) ** 2)
+            weights -= np.diag(np.diag(weights))
+            return weights, weights.sum(axis=1)
+
+        def sparse_init():
+            opt.init_smoothing(radius * u.deg)
+            return opt.smoothing_weights, opt.smoothing_sums
+
+        dense, dense_sums = dense_init()
+        sparse, sparse_sums = sparse_init()
+        assert np.allclose(dense.dot(ha) / dense_sums, sparse.dot(ha) / sparse_sums, atol=1e-2)
+        report('Initialize smoothing weights for {} tiles with radius {} deg'.format(
+            opt.ntiles, radius), [
+            ('dense', time_call(dense_init, args.repeat)),
+            ('sparse', time_call(sparse_init, args.repeat))])
+        report('Smooth {} HA assignments ({:.0f} MB dense, {:.0f} MB sparse)'.format(
+            opt.ntiles, dense.nbytes / 2 ** 20,
+            (sparse.data.nbytes + sparse.indices.nbytes + sparse.indptr.nbytes) / 2 ** 20), [
+            ('dense', time_call(lambda: dense.dot(ha), args.repeat, 10)),
+            ('sparse', time_call(lambda: sparse.dot(ha), args.repeat, 10))])
+
+
+def bench_methods(args, programs=('DARK', 'BRIGHT'), ncycles=(1, 5)):
+    """Compare annealing and gradient optimization of design hour angles.
+
+    Annealing cycles follow ``surveyinit --method anneal`` with its default
+    parameters, and start from the same initial HA assignments as
+    :meth:`desisurvey.optimize.Optimizer.minimize`.  Each optimization is
+    timed once and its final RMSE and loss metrics are also printed.
+    """
+    for program in programs:
+        timings, metrics = [], []
+        for n in ncycles:
+            opt = get_optimizer(program, init='flat', center=None)
+
+            def anneal():
+                frac, smoothing = 1. / opt.binsize, 0.05
+                for cycle in range(n):
+                    for i in range(opt.ntiles):
+                        opt.improve(frac)
+                    opt.smooth(alpha=smoothing)
+                    frac *= 0.95
+                    smoothing *= 0.95
+
+            timings.append(('anneal x{}'.format(n), time_call(anneal, 1)))
+            metrics.append((opt.RMSE_history[-1], opt.loss_history[-1]))
+        opt = get_optimizer(program, init='flat', center=None)
+        timings.append(('L-BFGS-B', time_call(opt.minimize, 1)))
+        metrics.append((opt.RMSE_history[-1], opt.loss_history[-1]))
+        report('Optimize {} HA assignments for {} tiles'.format(program, opt.ntiles), timings)
+        for (label, _), (RMSE, loss) in zip(timings, metrics):
+            print('{:>30s} RMSE {:6.3f}% loss {:5.2f}%'.format(label, 1e2 * RMSE, 1e2 * loss))
+        print()
+
+
+BENCHMARKS = dict(
+    snapshot=bench_snapshot,
+    history=bench_history,
+    moon=bench_moon,
+    bright=bench_bright,
+    etc=bench_etc,
+    weather=bench_weather,
+    sky=bench_sky,
+    improve=bench_improve,
+    smoothing=bench_smoothing,
+    methods=bench_methods,
+)
+
+
+def main(args):
+    """Command-line driver for running benchmarks.
+    """
+    # Set up the logger
+    if args.debug:
+        log = desiutil.log.get_logger(desiutil.log.DEBUG)
+        args.verbose = True
+    elif args.verbose:
+        log = desiutil.log.get_logger(desiutil.log.INFO)
+    else:
+        log = desiutil.log.get_logger(desiutil.log.WARNING)
+
+    # Set the output path if requested.
+    config = desisurvey.config.Configuration(file_name=args.config_file)
+    if args.output_path is not None:
+        config.set_output_path(args.output_path)
+    if args.tiles_file is not None:
+        config.tiles_file.set_value(args.tiles_file)
+
+    for name in args.benchmarks:
+        BENCHMARKS[name](args)
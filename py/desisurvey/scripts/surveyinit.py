@@ -8,6 +8,8 @@ This script will calculate the ephemerides and expected weather (dome open
 fraction) for 2019-2025, then calculate design hour angles for the
 nominal survey dates.  The results are saved in a file (normally
 ``surveyinit.fits``) and then do not need to be recalculated ever again.
+Running this script again only re-optimizes the programs whose inputs
+(tiles, available LST, configuration or optimization options) have changed.
 
 To run this script from the command line, use the ``surveyinit`` entry point
 that is created when this package is installed, and should be in your shell
@@ -16,17 +18,22 @@ command search path.
 from __future__ import print_function, division, absolute_import
 
 import os
+import json
+import hashlib
 import argparse
+import multiprocessing
 
 import numpy as np
 
 import astropy.io.fits as fits
 import astropy.table
+import astropy.units as u
 
 import desiutil.log
 
 import desimodel.weather
 
+import desisurvey.config
 import desisurvey.utils
 import desisurvey.ephem
 import desisurvey.tiles
@@ -53,23 +60,33 @@ def parse(options=None):
     parser.add_argument(
         '--nbins', type=int, default=192, metavar='N',
         help='number of LST bins to use')
+    parser.add_argument(
+        '--levels', type=int, default=0, metavar='L',
+        help='number of coarser LST binnings, each halving nbins, to optimize first')
     parser.add_argument(
         '--init', choices=('zero', 'flat'), default='flat',
         help='method to assign initial HA to each tile')
     parser.add_argument(
-        '--adjust', default=1.0, metavar='DEG',
-        help='tile HA adjustment (deg) per iteration, anneals each cycle')
+        '--method', choices=('anneal', 'lbfgs'), default='anneal',
+        help='method to optimize HA assignments: annealing cycles or L-BFGS-B')
+    parser.add_argument(
+        '--penalty', type=float, default=0.1, metavar='P',
+        help='weight of HA smoothing penalty used by the lbfgs method')
+    parser.add_argument(
+        '--adjust', type=float, default=1.0, metavar='DEG',
+        help='tile HA adjustment (deg) per iteration, anneals each cycle '
+        'and is multiplied by 2 ** level at coarser --levels')
     parser.add_argument(
-        '--smooth', default=0.05, metavar='S',
+        '--smooth', type=float, default=0.05, metavar='S',
         help='amount to smooth HA assignments, anneals each cycle')
     parser.add_argument(
-        '--anneal', default=0.95, metavar='A',
+        '--anneal', type=float, default=0.95, metavar='A',
         help='decrease adjust, smooth by this factor after each cycle')
     parser.add_argument(
-        '--max-rmse', default=0.02, metavar='MAX',
+        '--max-rmse', type=float, default=0.02, metavar='MAX',
         help='continue cycles until root mean square error < MAX')
     parser.add_argument(
-        '--epsilon', default=0.01, metavar='EPS',
+        '--epsilon', type=float, default=0.01, metavar='EPS',
         help='continue cycles until fractional score improvement < EPS')
     parser.add_argument(
         '--max-cycles', type=int, default=100,
@@ -83,6 +100,21 @@ def parse(options=None):
     parser.add_argument(
         '--bright-stretch', type=float, default=1.5, metavar='S',
         help='stretch BRIGHT exposure times by this factor')
+    parser.add_argument(
+        '--nstarts', type=int, default=1, metavar='M',
+        help='number of independent annealing runs per program, keeping the best')
+    parser.add_argument(
+        '--seed', type=int, default=123, metavar='SEED',
+        help='random number seed for the first annealing run of each program')
+    parser.add_argument(
+        '--nproc', type=int, default=1, metavar='N',
+        help='number of worker processes for parallel annealing runs')
+    parser.add_argument(
+        '--checkpoint', type=int, default=0, metavar='N',
+        help='save annealing checkpoints every N cycles (or never when 0)')
+    parser.add_argument(
+        '--resume', action='store_true',
+        help='resume annealing from any saved checkpoints')
     parser.add_argument(
         '--save', default='surveyinit.fits', metavar='NAME',
         help='name of FITS output file where results are saved')
@@ -101,12 +133,303 @@ def parse(options=None):
     else:
         args = parser.parse_args(options)
 
+    if args.levels < 0 or args.nbins % 2 ** args.levels:
+        parser.error('Expected nbins divisible by 2 ** levels.')
+
     return args
 
 
+def get_inputs_hash(program, lst_bins, lst_hist, args):
+    """Calculate a content hash of the inputs that determine a program's plan.
+
+    The hash covers the program's tiles, the available LST histogram, the
+    configuration parameters used by :class:`desisurvey.optimize.Optimizer`
+    and the command-line arguments that affect the optimization results.
+
+    Parameters
+    ----------
+    program : str
+        Name of the program to optimize.
+    lst_bins : array
+        Array of LST bin edges.
+    lst_hist : array
+        Array of available LST in each bin for this program.
+    args : object
+        Object with attributes for parsed command-line arguments.
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA1 digest.
+    """
+    config = desisurvey.config.Configuration()
+    tiles = desisurvey.tiles.get_tiles()
+    sel = tiles.program_mask[program]
+    params = {name: getattr(args, name) for name in (
+        'nbins', 'init', 'method', 'penalty', 'levels', 'adjust', 'smooth', 'anneal',
+        'max_rmse', 'epsilon', 'max_cycles', 'nstarts', 'seed', '{}_stretch'.format(program.lower()))}
+    params['texp_nom'] = getattr(config.nominal_exposure_time, program)().to(u.s).value
+    params['min_altitude'] = config.min_altitude().to(u.deg).value
+    params['latitude'] = config.location.latitude().to(u.deg).value
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    for array in (tiles.tileID[sel], tiles.tileRA[sel], tiles.tileDEC[sel],
+                  tiles.dust_factor[sel], lst_bins, lst_hist):
+        array = np.ascontiguousarray(array, dtype=float)
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def read_previous_plan(fullname):
+    """Read the results of a previous plan that might be reused.
+
+    Parameters
+    ----------
+    fullname : str
+        Full path of a FITS file written by :func:`calculate_initial_plan`.
+
+    Returns
+    -------
+    tuple
+        Tuple (design, tables) where design is the DESIGN table and tables
+        is a dictionary of the LST usage table for each program, indexed by
+        program name.  Only programs whose inputs hash was saved are
+        included, and tables is empty if the file is missing or predates
+        saving hashes.
+    """
+    tables = {}
+    if not os.path.exists(fullname):
+        return None, tables
+    with fits.open(fullname, memmap=False) as hdus:
+        if 'DESIGN' not in hdus or 'TILEID' not in hdus['DESIGN'].columns.names:
+            return None, tables
+        design = astropy.table.Table.read(hdus['DESIGN'])
+        for hdu in hdus[1:]:
+            if 'INPUTS' in hdu.header and hdu.name != 'DESIGN':
+                tables[hdu.name] = astropy.table.Table.read(hdu)
+                tables[hdu.name].meta.pop('EXTNAME', None)
+    return design, tables
+
+
+def get_checkpoint_name(args, program, seed):
+    """Get the name of the annealing checkpoint file for one program.
+
+    Parameters
+    ----------
+    args : object
+        Object with attributes for parsed command-line arguments.
+    program : str
+        Name of the program being optimized.
+    seed : int
+        Random number seed of the annealing run.
+
+    Returns
+    -------
+    str
+        Name derived from args.save, to be passed to config.get_path().
+    """
+    base, _ = os.path.splitext(args.save)
+    return '{}_{}_{}.npz'.format(base, program, seed)
+
+
+def save_checkpoint(fullname, opt, **params):
+    """Save an annealing checkpoint.
+
+    The checkpoint is written to a temporary file that is then renamed,
+    so it is never left partially written.
+
+    Parameters
+    ----------
+    fullname : str
+        Full path of the checkpoint file to write.
+    opt : :class:`desisurvey.optimize.Optimizer`
+        Optimizer whose state should be saved.
+    params : dict
+        Additional scalar annealing parameters to save.
+    """
+    arrays = opt.get_state()
+    for key, value in params.items():
+        arrays[key.upper()] = np.array(value)
+    with open(fullname + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(fullname + '.tmp', fullname)
+
+
+def optimize_program(program, lst_bins, lst_hist, args, seed=123, center=None):
+    """Optimize the design hour angles of one program.
+
+    Runs annealing cycles of :class:`desisurvey.optimize.Optimizer` until
+    the convergence criteria specified in args are met, or a single call of
+    :meth:`desisurvey.optimize.Optimizer.minimize` for the lbfgs method.
+    When args.levels > 0, this is first done with LST bins that are
+    2 ** args.levels times coarser, then the HA assignments are refined
+    at each finer binning.  Coarser levels stop as soon as the RMSE target
+    is met.
+
+    When args.checkpoint > 0, the annealing state is saved every
+    args.checkpoint cycles and at the end of each level, and optimization
+    continues from any saved checkpoint when args.resume is set, with
+    results identical to an uninterrupted run.  Checkpoints record the
+    hash of their inputs and settings, calculated with
+    :func:`get_inputs_hash`, and a checkpoint saved with a different hash
+    is ignored.
+
+    Parameters
+    ----------
+    program : str
+        Name of the program to optimize.
+    lst_bins : array
+        Array of LST bin edges.
+    lst_hist : array
+        Array of available LST in each bin for this program.
+    args : object
+        Object with attributes for parsed command-line arguments.
+    seed : int
+        Random number seed to use for the optimizer.
+    center : float or None
+        Central LST in degrees for 'flat' initial HA assignments, or None
+        to pick the best of a grid of centers.
+
+    Returns
+    -------
+    tuple
+        Tuple (table, ha_initial, ha, texp, score) where table summarizes
+        the available, initial and planned LST usage, the arrays give the
+        initial and optimized design hour angles and the exposure times in
+        seconds for each tile in the program, and score is the final value
+        of :meth:`desisurvey.optimize.Optimizer.eval_score`.  The NIMPROVE
+        value of the table metadata is the total number of calls to
+        :meth:`desisurvey.optimize.Optimizer.improve` at all levels.
+    """
+    log = desiutil.log.get_logger()
+    # Label log messages with the seed when there are multiple runs.
+    name = program if args.nstarts == 1 else '{}/{}'.format(program, seed)
+    stretches = dict(
+        DARK=args.dark_stretch,
+        GRAY=args.gray_stretch,
+        BRIGHT=args.bright_stretch)
+    # Initialize an LST summary table.
+    table = astropy.table.Table(meta={'ORIGIN': lst_bins[0]})
+    table['AVAIL'] = lst_hist
+    # Look for a checkpoint to resume from.
+    config = desisurvey.config.Configuration()
+    checkpoint = config.get_path(get_checkpoint_name(args, program, seed))
+    inputs = get_inputs_hash(program, lst_bins, lst_hist, args)
+    state = None
+    if args.resume and os.path.exists(checkpoint):
+        with np.load(checkpoint) as data:
+            state = {key: data[key] for key in data.files}
+        if 'INPUTS' not in state or str(state['INPUTS']) != inputs:
+            log.warning('{} ignoring "{}" saved with different inputs or settings.'
+                        .format(name, checkpoint))
+            state = None
+        else:
+            log.info('{} resuming from "{}".'.format(name, checkpoint))
+    # Optimize with progressively finer LST binning, ending with the full
+    # resolution of lst_hist.
+    first_level = args.levels if state is None else int(state['LEVEL'])
+    # Count improve() calls in completed levels.
+    nimprove = 0 if state is None else int(state.get('NIMPROVE', 0))
+    for level in range(first_level, -1, -1):
+        factor = 2 ** level
+        level_bins = lst_bins[::factor]
+        level_hist = lst_hist.reshape(-1, factor).sum(axis=1)
+        if state is not None:
+            # Restore the optimizer saved in the checkpoint.
+            opt = desisurvey.optimize.Optimizer(
+                program, level_bins, level_hist, init='array', initial_ha=state['HA'],
+                subset=state['TILEID'], stretch=stretches[program], seed=seed)
+            opt.set_state(state)
+            ha_initial = state['INITIAL']
+        elif level == args.levels:
+            # Initailize an optimizer for this program.
+            opt = desisurvey.optimize.Optimizer(
+                program, level_bins, level_hist, init=args.init, center=center,
+                stretch=stretches[program], seed=seed)
+            ha_initial = opt.ha_initial
+        else:
+            # Refine the HA assignments from the previous level.
+            opt = desisurvey.optimize.Optimizer(
+                program, level_bins, level_hist, init='array', initial_ha=opt.ha,
+                subset=opt.tid, stretch=stretches[program], seed=seed)
+        label = name if args.levels == 0 else '{}@{}'.format(name, opt.nbins)
+        if args.method == 'lbfgs':
+            result = opt.minimize(smoothing=args.penalty)
+            log.info(
+                '{} L-BFGS-B [{:03d}] RMSE={:6.2f}% LOSS={:5.2f}% {}'
+                .format(label, result.nit, 1e2 * opt.RMSE_history[-1],
+                        1e2 * opt.loss_history[-1], result.message))
+        else:
+            # Initialize annealing cycles.
+            if state is not None:
+                ncycles, frac, smoothing = int(state['NCYCLES']), state['FRAC'][()], state['SMOOTHING'][()]
+                converged = bool(state['CONVERGED'])
+            else:
+                ncycles = 0
+                # Coarser levels take proportionally larger HA steps, so the
+                # step is the same fraction of an LST bin at every level.
+                frac = args.adjust * 2 ** level / opt.binsize
+                smoothing = args.smooth
+                converged = False
+            # Loop over annealing cycles.
+            while not converged and ncycles < args.max_cycles:
+                start_score = opt.eval_score(opt.plan_hist)
+                for i in range(opt.ntiles):
+                    opt.improve(frac)
+                if smoothing > 0:
+                    opt.smooth(alpha=smoothing)
+                stop_score = opt.eval_score(opt.plan_hist)
+                delta = (stop_score - start_score) / start_score
+                RMSE = opt.RMSE_history[-1]
+                loss = opt.loss_history[-1]
+                log.info(
+                    '{} [{:03d}] dHA={:5.3f}deg '.format(label, ncycles + 1, frac * opt.binsize) +
+                    'RMSE={:6.2f}% LOSS={:5.2f}% delta(score)={:+5.1f}%'
+                    .format(1e2*RMSE, 1e2*loss, 1e2*delta))
+                # Both conditions must be satisfied to terminate, except that
+                # coarser levels only need to reach the RMSE target.
+                if RMSE < args.max_rmse and (level > 0 or delta > -args.epsilon):
+                    converged = True
+                    break
+                # Anneal parameters for next cycle.
+                frac *= args.anneal
+                smoothing *= args.anneal
+                ncycles += 1
+                if args.checkpoint > 0 and ncycles % args.checkpoint == 0:
+                    save_checkpoint(checkpoint, opt, level=level, initial=ha_initial, ncycles=ncycles,
+                                    frac=frac, smoothing=smoothing, converged=converged,
+                                    inputs=inputs, nimprove=nimprove)
+            if args.checkpoint > 0:
+                save_checkpoint(checkpoint, opt, level=level, initial=ha_initial, ncycles=ncycles,
+                                frac=frac, smoothing=smoothing, converged=converged, inputs=inputs,
+                                nimprove=nimprove)
+        nimprove += opt.nimprove
+        state = None
+    plan_sum = opt.plan_hist.sum()
+    avail_sum = opt.lst_hist_sum
+    margin = (avail_sum - plan_sum) / plan_sum
+    log.info('{} plan uses {:.1f}h with {:.1f}h avail ({:.1f}% margin).'
+             .format(name, plan_sum, avail_sum, 1e2 * margin))
+    table['INIT'] = opt.get_plan_hist(*opt.get_plan(ha_initial))
+    table['PLAN'] = opt.plan_hist
+    score = opt.eval_score(opt.plan_hist)
+    table.meta['SEED'] = seed
+    table.meta['SCORE'] = score
+    table.meta['NIMPROVE'] = nimprove
+    # Calculate exposure times in (solar) seconds.
+    texp, _ = opt.get_exptime(opt.ha)
+    texp *= 24. * 3600. / 360. * 0.99726956583
+    return table, ha_initial, opt.ha, texp, score
+
+
 def calculate_initial_plan(args):
     """Calculate the initial survey plan.
 
+    Each program's LST usage table records a hash of its inputs, calculated
+    with :func:`get_inputs_hash`.  Unless args.recalc is set, programs whose
+    inputs are unchanged since a previous plan was saved reuse its results
+    instead of being optimized again, and the file is not rewritten when
+    no program has changed.
+
     Use :func:`desisurvey.plan.load_weather` and
     :func:`desisurvey.plan.load_design_hourangles` to retrieve
     these data from the saved plan.
@@ -152,79 +475,92 @@ def calculate_initial_plan(args):
     lst_hist, lst_bins = ephem.get_available_lst(
         nbins=args.nbins, weather=weather[ilo:ihi], include_twilight=args.include_twilight)
 
+    # Read a previous plan whose results can be reused for programs
+    # with unchanged inputs.
+    fullname = config.get_path(args.save)
+    previous, previous_tables = (None, {}) if args.recalc else read_previous_plan(fullname)
+
     # Initialize the output results table.
     design = astropy.table.Table()
+    design['TILEID'] = tiles.tileID
     design['INIT'] = np.zeros(tiles.ntiles)
     design['HA'] = np.zeros(tiles.ntiles)
     design['TEXP'] = np.zeros(tiles.ntiles)
 
-    # Optimize each program separately.
-    stretches = dict(
-        DARK=args.dark_stretch,
-        GRAY=args.gray_stretch,
-        BRIGHT=args.bright_stretch)
+    if args.nstarts < 1:
+        raise ValueError('Expected nstarts >= 1.')
+    # Optimize each program separately, with independent annealing runs
+    # that differ in their random seed and initial center.
+    jobs = []
+    programs, inputs = [], {}
     for pindex, program in enumerate(tiles.PROGRAMS):
-        sel = tiles.program_mask[program]
-        if not np.any(sel):
+        if not np.any(tiles.program_mask[program]):
             log.info('Skipping {} program with no tiles.'.format(program))
             continue
-        # Initialize an LST summary table.
-        table = astropy.table.Table(meta={'ORIGIN': lst_bins[0]})
-        table['AVAIL'] = lst_hist[pindex]
-        # Initailize an optimizer for this program.
-        opt = desisurvey.optimize.Optimizer(
-            program, lst_bins, lst_hist[pindex], init=args.init, center=None,
-            stretch=stretches[program])
-        table['INIT'] = opt.plan_hist.copy()
-        design['INIT'][sel] = opt.ha_initial
-        # Initialize annealing cycles.
-        ncycles = 0
-        binsize = 360. / args.nbins
-        frac = args.adjust / binsize
-        smoothing = args.smooth
-        # Loop over annealing cycles.
-        while ncycles < args.max_cycles:
-            start_score = opt.eval_score(opt.plan_hist)
-            for i in range(opt.ntiles):
-                opt.improve(frac)
-            if smoothing > 0:
-                opt.smooth(alpha=smoothing)
-            stop_score = opt.eval_score(opt.plan_hist)
-            delta = (stop_score - start_score) / start_score
-            RMSE = opt.RMSE_history[-1]
-            loss = opt.loss_history[-1]
+        programs.append(program)
+        inputs[program] = get_inputs_hash(program, lst_bins, lst_hist[pindex], args)
+        table = previous_tables.get(program)
+        if table is not None and table.meta['INPUTS'] == inputs[program]:
+            log.info('Reusing {} plan with unchanged inputs.'.format(program))
+            continue
+        for istart in range(args.nstarts):
+            # The first run scans initial centers, as for a single run.
+            center = None if istart == 0 else lst_bins[0] + 360. * istart / args.nstarts
+            jobs.append((program, lst_bins, lst_hist[pindex], args, args.seed + istart, center))
+    if not jobs and previous is not None and np.array_equal(previous['TILEID'], tiles.tileID):
+        log.info('Initial plan in "{}" is up to date.'.format(fullname))
+        return
+    nproc = min(args.nproc, len(jobs))
+    if nproc > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        # Workers must inherit our configuration and cached tiles.
+        log.warning('Cannot fork worker processes so running serially.')
+        nproc = 1
+    if nproc > 1:
+        # Each run is independent with its own random seed, so the results
+        # are identical to running serially.
+        with multiprocessing.get_context('fork').Pool(nproc) as pool:
+            results = pool.starmap(optimize_program, jobs)
+    else:
+        results = [optimize_program(*job) for job in jobs]
+    for program in programs:
+        sel = tiles.program_mask[program]
+        runs = [result for job, result in zip(jobs, results) if job[0] == program]
+        if not runs:
+            # Copy the previous results for this program's tiles.
+            table = previous_tables[program]
+            order = np.argsort(previous['TILEID'])
+            rows = order[np.searchsorted(previous['TILEID'], tiles.tileID[sel], sorter=order)]
+            hdus.append(fits.BinTableHDU(table, name=program))
+            for name in ('INIT', 'HA', 'TEXP'):
+                design[name][sel] = previous[name][rows]
+            continue
+        scores = np.array([run[-1] for run in runs])
+        ibest = np.argmin(scores)
+        if len(runs) > 1:
             log.info(
-                '[{:03d}] dHA={:5.3f}deg '.format(ncycles + 1, frac * binsize) +
-                'RMSE={:6.2f}% LOSS={:5.2f}% delta(score)={:+5.1f}%'
-                .format(1e2*RMSE, 1e2*loss, 1e2*delta))
-            # Both conditions must be satisfied to terminate.
-            if RMSE < args.max_rmse and delta > -args.epsilon:
-                break
-            # Anneal parameters for next cycle.
-            frac *= args.anneal
-            smoothing *= args.anneal
-            ncycles += 1
-        plan_sum = opt.plan_hist.sum()
-        avail_sum = opt.lst_hist_sum
-        margin = (avail_sum - plan_sum) / plan_sum
-        log.info('{} plan uses {:.1f}h with {:.1f}h avail ({:.1f}% margin).'
-                 .format(program, plan_sum, avail_sum, 1e2 * margin))
+                '{} best score {:.3f} from seed {} with {} runs in [{:.3f},{:.3f}] (std {:.3f}).'
+                .format(program, scores[ibest], args.seed + ibest, len(runs),
+                        scores.min(), scores.max(), scores.std()))
+        table, ha_initial, ha, texp, _ = runs[ibest]
+        table.meta['NSTARTS'] = len(runs)
+        table.meta['INPUTS'] = inputs[program]
         # Save planned LST usage.
-        table['PLAN'] = opt.plan_hist
         hdus.append(fits.BinTableHDU(table, name=program))
-
-        # Calculate exposure times in (solar) seconds.
-        texp, _ = opt.get_exptime(opt.ha)
-        texp *= 24. * 3600. / 360. * 0.99726956583
         # Save results for this program.
-        design['HA'][sel] = opt.ha
+        design['INIT'][sel] = ha_initial
+        design['HA'][sel] = ha
         design['TEXP'][sel] = texp
 
     hdus.append(fits.BinTableHDU(design, name='DESIGN'))
-    fullname = config.get_path(args.save)
     hdus.writeto(fullname, overwrite=True)
     log.info('Saved initial plan to "{}".'.format(fullname))
 
+    # Checkpoints are no longer needed.
+    for job in jobs:
+        checkpoint = config.get_path(get_checkpoint_name(args, job[0], job[4]))
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
 
 def main(args):
     """Command-line driver for initializing the survey plan.
@@ -248,9 +584,5 @@ def main(args):
     # Tabulate emphemerides if necessary.
     ephem = desisurvey.ephem.get_ephem(use_cache=not args.recalc)
 
-    # Calculate design hour angles if necessary.
-    fullname = config.get_path(args.save)
-    if args.recalc or not os.path.exists(fullname):
-        calculate_initial_plan(args)
-    else:
-        log.info('Initial plan has already been created.')
+    # Calculate design hour angles for programs whose inputs have changed.
+    calculate_initial_plan(args)
@@ -0,0 +1,327 @@
+"""Save and restore planner and scheduler state in a single binary file.
+
+A snapshot is an uncompressed numpy ``.npz`` archive containing per-tile
+arrays and a JSON metadata string. Either or both of a
+:class:`desisurvey.plan.Planner` and a :class:`desisurvey.scheduler.Scheduler`
+can be saved in the same snapshot, and each class can restore its own state
+from a snapshot that contains it.
+
+The archive members are:
+
+ - TILEID: tile IDs, used to check that a snapshot matches the current tiles.
+ - PLAN_COVERED, PLAN_COUNTDOWN, PLAN_AVAILABLE, PLAN_PRIORITY: planner arrays.
+ - SCHED_SNR2FRAC: scheduler array.
+ - META: JSON encoded dictionary of metadata.
+
+Snapshots are written to a temporary file that is then renamed, so a
+snapshot is never left partially written.  Since archive members are not
+compressed, reading a snapshot is limited by disk I/O rather than decoding,
+and is much faster than reading the equivalent FITS files.
+
+Use :class:`SnapshotHistory` to efficiently store the snapshots for
+every night of a survey.
+"""
+from __future__ import print_function, division
+
+import os
+import json
+import hashlib
+
+import numpy as np
+
+import desiutil.log
+
+import desisurvey.config
+import desisurvey.utils
+
+
+# Version number of the snapshot layout.
+VERSION = 1
+
+
+def is_snapshot(name):
+    """Test if a file name refers to a binary snapshot.
+
+    Parameters
+    ----------
+    name : str
+        File name to test.
+
+    Returns
+    -------
+    bool
+        True if the name has the ``.npz`` extension.
+    """
+    return os.path.splitext(name)[1] == '.npz'
+
+
+def get_arrays(planner=None, scheduler=None):
+    """Collect the snapshot arrays and metadata for a planner and/or scheduler.
+
+    Parameters
+    ----------
+    planner : :class:`desisurvey.plan.Planner` or None
+        Planner whose state should be included.
+    scheduler : :class:`desisurvey.scheduler.Scheduler` or None
+        Scheduler whose state should be included.
+
+    Returns
+    -------
+    tuple
+        Tuple (arrays, meta) of dictionaries.
+    """
+    if planner is None and scheduler is None:
+        raise ValueError('Nothing to save in snapshot.')
+    tiles = planner.tiles if planner is not None else scheduler.tiles
+    arrays = dict(TILEID=tiles.tileID)
+    meta = dict(VERSION=VERSION)
+    if planner is not None:
+        arrays['PLAN_COVERED'] = planner.tile_covered
+        arrays['PLAN_COUNTDOWN'] = planner.tile_countdown
+        arrays['PLAN_AVAILABLE'] = planner.tile_available
+        arrays['PLAN_PRIORITY'] = planner.tile_priority
+        meta['CADENCE'] = planner.fiberassign_cadence
+        meta['FIRST'] = planner.first_night.isoformat() if planner.first_night else ''
+        meta['LAST'] = planner.last_night.isoformat() if planner.last_night else ''
+    if scheduler is not None:
+        arrays['SCHED_SNR2FRAC'] = scheduler.snr2frac
+        meta['NIGHT'] = scheduler.night.isoformat() if scheduler.night else ''
+        meta['NDONE'] = int(scheduler.completed_by_pass.sum())
+    return arrays, meta
+
+
+def write_snapshot(fullname, planner=None, scheduler=None):
+    """Write a binary snapshot of a planner and/or scheduler.
+
+    Normally called via :meth:`desisurvey.plan.Planner.save` or
+    :meth:`desisurvey.scheduler.Scheduler.save` with a ``.npz`` file name,
+    or directly to save both objects in a single file.
+
+    Parameters
+    ----------
+    fullname : str
+        Full path of the file to write, which should have the ``.npz``
+        extension.
+    planner : :class:`desisurvey.plan.Planner` or None
+        Planner whose state should be saved.
+    scheduler : :class:`desisurvey.scheduler.Scheduler` or None
+        Scheduler whose state should be saved.
+    """
+    arrays, meta = get_arrays(planner, scheduler)
+    arrays['META'] = np.array(json.dumps(meta))
+    with open(fullname + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.rename(fullname + '.tmp', fullname)
+
+
+def read_snapshot(fullname, tileID=None):
+    """Read a binary snapshot.
+
+    Parameters
+    ----------
+    fullname : str
+        Full path of the file to read.
+    tileID : array or None
+        Expected tile IDs. A RuntimeError is raised if the snapshot
+        tile IDs do not match.
+
+    Returns
+    -------
+    tuple
+        Tuple (arrays, meta) of dictionaries.
+    """
+    if not os.path.exists(fullname):
+        raise RuntimeError('Cannot restore from non-existent "{}".'.format(fullname))
+    with np.load(fullname) as data:
+        arrays = {key: data[key] for key in data.files}
+    meta = json.loads(str(arrays.pop('META')))
+    if meta.get('VERSION') != VERSION:
+        raise RuntimeError('Unsupported snapshot version in "{}".'.format(fullname))
+    if tileID is not None and not np.array_equal(arrays['TILEID'], tileID):
+        raise RuntimeError('Saved tile IDs do not match current tiles_file.')
+    return arrays, meta
+
+
+def _digest(arrays):
+    """Calculate a content hash for a dictionary of arrays.
+    """
+    digest = hashlib.sha1()
+    for key in sorted(arrays):
+        array = np.ascontiguousarray(arrays[key])
+        digest.update(key.encode())
+        digest.update(array.dtype.str.encode())
+        digest.update(repr(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+class SnapshotHistory(object):
+    """Store the nightly history of planner and scheduler snapshots.
+
+    Each night's state is stored as the difference with respect to a
+    periodic keyframe that contains the full per-tile arrays, so that
+    restoring any night only requires reading one keyframe and one
+    small delta.  Keyframes and deltas are stored as uncompressed npz
+    files whose names are the hash of their contents, so identical
+    content is only stored once, e.g., for nights without any
+    observations.  A JSON index maps each night to its keyframe, delta
+    and metadata.
+
+    Use :meth:`save` to record the state for a night and :meth:`read` to
+    retrieve it, then pass the result as the ``restore`` argument of
+    :class:`desisurvey.plan.Planner` or
+    :class:`desisurvey.scheduler.Scheduler`.
+
+    Parameters
+    ----------
+    path : str
+        Directory where the history is stored, which is created if
+        necessary. A relative path refers to our configured output path.
+    keyframe_interval : int
+        Maximum number of nights between keyframes. A new keyframe is also
+        started when more than half of the tiles have changed since the
+        current keyframe.
+    """
+    def __init__(self, path='history', keyframe_interval=30):
+        self.log = desiutil.log.get_logger()
+        config = desisurvey.config.Configuration()
+        self.path = config.get_path(path)
+        self.objects_path = os.path.join(self.path, 'objects')
+        if not os.path.isdir(self.objects_path):
+            os.makedirs(self.objects_path)
+        self.keyframe_interval = keyframe_interval
+        self.index_name = os.path.join(self.path, 'index.json')
+        if os.path.exists(self.index_name):
+            with open(self.index_name) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+        # Cache the most recently used keyframe.
+        self._keyframe = None
+        self._keyframe_arrays = None
+
+    @property
+    def nights(self):
+        """Sorted list of nights recorded in this history, as ISO strings.
+        """
+        return sorted(self.index)
+
+    def _write_object(self, arrays):
+        """Write arrays to a content-addressed file, if necessary.
+        """
+        name = _digest(arrays)
+        fullname = os.path.join(self.objects_path, name + '.npz')
+        if not os.path.exists(fullname):
+            with open(fullname + '.tmp', 'wb') as f:
+                np.savez(f, **arrays)
+            os.rename(fullname + '.tmp', fullname)
+        return name
+
+    def _read_object(self, name):
+        """Read arrays from a content-addressed file.
+        """
+        fullname = os.path.join(self.objects_path, name + '.npz')
+        with np.load(fullname) as data:
+            return {key: data[key] for key in data.files}
+
+    def _get_keyframe(self, name):
+        """Return the arrays for the named keyframe, using our cache.
+        """
+        if name != self._keyframe:
+            self._keyframe_arrays = self._read_object(name)
+            self._keyframe = name
+        return self._keyframe_arrays
+
+    def save(self, night, planner=None, scheduler=None):
+        """Record the state of a planner and/or scheduler for one night.
+
+        Any state previously recorded for the same night is replaced, and
+        its stored objects are deleted unless another night uses them.
+
+        Parameters
+        ----------
+        night : date
+            Converted to a date using :func:`desisurvey.utils.get_date`.
+        planner : :class:`desisurvey.plan.Planner` or None
+            Planner whose state should be saved.
+        scheduler : :class:`desisurvey.scheduler.Scheduler` or None
+            Scheduler whose state should be saved.
+        """
+        night = desisurvey.utils.get_date(night).isoformat()
+        arrays, meta = get_arrays(planner, scheduler)
+        # Find the keyframe used by the most recent previous night.
+        previous = [n for n in self.index if n < night]
+        delta, keyframe = None, None
+        if previous:
+            last = self.index[max(previous)]
+            if last['age'] + 1 < self.keyframe_interval:
+                key_arrays = self._get_keyframe(last['keyframe'])
+                delta = {}
+                nchanged, ntotal = 0, 0
+                for name, array in arrays.items():
+                    if (name not in key_arrays or
+                        key_arrays[name].shape != array.shape or
+                        key_arrays[name].dtype != array.dtype):
+                        # Cannot use this keyframe.
+                        delta = None
+                        break
+                    idx = np.flatnonzero(array != key_arrays[name])
+                    delta[name + '_IDX'] = idx
+                    delta[name + '_VAL'] = array.ravel()[idx]
+                    nchanged += len(idx)
+                    ntotal += array.size
+                if set(key_arrays) != set(arrays) or nchanged > 0.5 * ntotal:
+                    delta = None
+                if delta is not None:
+                    keyframe, age = last['keyframe'], last['age'] + 1
+        if delta is None:
+            # Start a new keyframe.
+            keyframe, age = self._write_object(arrays), 0
+            self._keyframe = keyframe
+            self._keyframe_arrays = {name: array.copy() for name, array in arrays.items()}
+            delta_name = None
+        else:
+            delta_name = self._write_object(delta)
+        replaced = self.index.get(night)
+        self.index[night] = dict(keyframe=keyframe, delta=delta_name, age=age, meta=meta)
+        with open(self.index_name + '.tmp', 'w') as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.rename(self.index_name + '.tmp', self.index_name)
+        if replaced is not None:
+            # Delete objects that are no longer used after updating the index,
+            # so an interrupted save never leaves the index pointing to a
+            # missing object.
+            used = set()
+            for entry in self.index.values():
+                used.update((entry['keyframe'], entry['delta']))
+            for name in (replaced['keyframe'], replaced['delta']):
+                if name is not None and name not in used:
+                    os.remove(os.path.join(self.objects_path, name + '.npz'))
+        self.log.debug('Saved {} for {} to history in "{}".'.format(
+            'keyframe' if delta_name is None else 'delta', night, self.path))
+
+    def read(self, night):
+        """Read the state recorded for one night.
+
+        Parameters
+        ----------
+        night : date
+            Converted to a date using :func:`desisurvey.utils.get_date`.
+
+        Returns
+        -------
+        tuple
+            Tuple (arrays, meta) of dictionaries in the same format returned
+            by :func:`read_snapshot`.
+        """
+        night = desisurvey.utils.get_date(night).isoformat()
+        if night not in self.index:
+            raise ValueError('No snapshot recorded for {}.'.format(night))
+        entry = self.index[night]
+        arrays = {name: array.copy() for name, array in
+                  self._get_keyframe(entry['keyframe']).items()}
+        if entry['delta'] is not None:
+            delta = self._read_object(entry['delta'])
+            for name, array in arrays.items():
+                array.ravel()[delta[name + '_IDX']] = delta[name + '_VAL']
+        return arrays, dict(entry['meta'])
@@ -1,11 +1,15 @@
 import unittest
+import unittest.mock
+from itertools import chain, combinations_with_replacement
 
 import numpy as np
 
 import astropy.units as u
 
 import desisurvey.config
-from desisurvey.etc import exposure_time, moon_exposure_factor, ExposureTimeCalculator
+import desisurvey.etc
+from desisurvey.etc import exposure_time, moon_exposure_factor, ExposureTimeCalculator, \
+     BatchExposureTimeCalculator, HistoryBuffer, interpolate_grid
 
 
 class TestExpCalc(unittest.TestCase):
@@ -72,6 +76,159 @@ class TestExpCalc(unittest.TestCase):
             moon_frac=0.5, moon_sep=30, moon_alt=30, airmass=1.2)
         self.assertGreater(x2, x1)
 
+    def test_moon_vector(self):
+        gen = np.random.RandomState(123)
+        n = 200
+        moon_frac = gen.uniform(0, 1, n)
+        moon_sep = gen.uniform(0, 180, n)
+        moon_alt = gen.uniform(-90, 90, n)
+        airmass = gen.uniform(1, 2, n)
+        #- Array inputs agree with scalar inputs, including moon down
+        x = moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass)
+        self.assertEqual(x.shape, (n,))
+        for i in range(n):
+            xi = moon_exposure_factor(moon_frac[i], moon_sep[i], moon_alt[i], airmass[i])
+            self.assertTrue(np.isscalar(xi))
+            self.assertAlmostEqual(x[i], xi, 12)
+        self.assertTrue(np.all(x[moon_alt < 0] == 1))
+        #- Inputs are broadcast
+        x = moon_exposure_factor(0.5, moon_sep.reshape(-1, 1), 30., airmass[:5])
+        self.assertEqual(x.shape, (n, 5))
+        with self.assertRaises(ValueError):
+            moon_exposure_factor(moon_frac, moon_sep, moon_alt, 0.5)
+        #- Vectorized exposure times agree with scalar exposure times
+        t = exposure_time('GRAY', 1.1, 0.9, airmass, 0.01, moon_frac, moon_sep, moon_alt)
+        for i in range(0, n, 20):
+            ti = exposure_time('GRAY', 1.1, 0.9, airmass[i], 0.01,
+                               moon_frac[i], moon_sep[i], moon_alt[i])
+            self.assertAlmostEqual(t[i].to(u.s).value, ti.to(u.s).value, 8)
+
+    def test_moon_tabulated(self):
+        gen = np.random.RandomState(123)
+        n = 1000
+        moon_frac = gen.uniform(0, 1, n)
+        moon_sep = gen.uniform(0, 180, n)
+        moon_alt = gen.uniform(-90, 90, n)
+        airmass = gen.uniform(1, 2, n)
+        x = moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass, tabulated=False)
+        y = moon_exposure_factor(moon_frac, moon_sep, moon_alt, airmass, tabulated=True)
+        self.assertTrue(np.allclose(x, y, rtol=5e-3, atol=0))
+        self.assertTrue(np.all(y[moon_alt < 0] == 1))
+
+    def test_interpolate_grid(self):
+        #- Multilinear interpolation is exact for a linear function
+        lo, hi = np.array([0., -1., 10.]), np.array([1., 1., 20.])
+        grids = [np.linspace(x0, x1, n) for x0, x1, n in zip(lo, hi, (3, 5, 4))]
+        X, Y, Z = np.meshgrid(*grids, indexing='ij')
+        grid = 1 + 2 * X - Y + 0.5 * Z
+        gen = np.random.RandomState(123)
+        x, y, z = [gen.uniform(x0, x1, 100) for x0, x1 in zip(lo, hi)]
+        values = interpolate_grid(grid, lo, hi, x, y, z, chunk_size=7)
+        self.assertTrue(np.allclose(values, 1 + 2 * x - y + 0.5 * z))
+        #- Coordinates are broadcast and clipped to the grid
+        values = interpolate_grid(grid, lo, hi, x.reshape(-1, 1), 2., z[:3])
+        self.assertEqual(values.shape, (100, 3))
+        self.assertTrue(np.allclose(values, 1 + 2 * x.reshape(-1, 1) - 1 + 0.5 * z[:3]))
+
+    def test_bright_notwi(self):
+        #- Precompiled polynomial is identical to building all monomials
+        gen = np.random.RandomState(123)
+        n = 500
+        airmass = gen.uniform(1, 2, n)
+        moon_frac = gen.uniform(0, 1, n)
+        moon_sep = gen.uniform(0, 180, n)
+        moon_alt = gen.uniform(-90, 90, n)
+        theta = np.array([airmass, moon_frac, moon_sep, moon_alt]).T
+        combs = chain.from_iterable(
+            combinations_with_replacement(range(4), i) for i in range(0, 4))
+        theta_transform = np.empty((n, 35))
+        for i, comb in enumerate(combs):
+            theta_transform[:, i] = theta[:, comb].prod(1)
+        expected = (np.dot(theta_transform, desisurvey.etc._notwiCoefficients.T) +
+                    3.0493419627360243)
+        fexp = desisurvey.etc._bright_exposure_factor_notwi(
+            airmass, moon_frac, moon_sep, moon_alt)
+        self.assertTrue(np.array_equal(fexp, expected))
+        fexp = desisurvey.etc._bright_exposure_factor_notwi(
+            airmass[0], moon_frac[0], moon_sep[0], moon_alt[0])
+        self.assertEqual(fexp.shape, (1,))
+        self.assertTrue(np.allclose(fexp, expected[:1], rtol=1e-12, atol=0))
+
+    def test_bright_sky_terms(self):
+        #- Precomputed sky terms reproduce bright_exposure_factor
+        gen = np.random.RandomState(123)
+        n = 50
+        airmass = gen.uniform(1, 2, n)
+        moon_sep = gen.uniform(0, 180, n)
+        sun_sep = gen.uniform(0, 180, n)
+        # Dark, moon up, twilight with moon down, twilight with moon up.
+        for moon_alt, sun_alt in ((-10, -30), (40, -30), (-10, -15), (40, -15)):
+            moon_frac = gen.uniform(0, 1)
+            expected = desisurvey.etc.bright_exposure_factor(
+                airmass, moon_frac, moon_sep, moon_alt, sun_sep, sun_alt)
+            terms = desisurvey.etc.bright_sky_terms(moon_frac, moon_alt, sun_alt)
+            self.assertEqual(terms.shape, (13,))
+            fexp = desisurvey.etc.bright_exposure_factor_from_terms(
+                terms, airmass, moon_sep, sun_sep)
+            self.assertTrue(np.allclose(fexp, expected, rtol=1e-12, atol=0))
+        #- Terms broadcast over arrays of moon and sun parameters
+        moon_alt = np.array([-10, 40, -10, 40])
+        sun_alt = np.array([-30, -30, -15, -15])
+        terms = desisurvey.etc.bright_sky_terms(0.5, moon_alt, sun_alt)
+        self.assertEqual(terms.shape, (4, 13))
+        fexp = desisurvey.etc.bright_exposure_factor_from_terms(
+            terms[:, np.newaxis], airmass, moon_sep, sun_sep)
+        self.assertEqual(fexp.shape, (4, n))
+        for i in range(4):
+            expected = desisurvey.etc.bright_exposure_factor(
+                airmass, 0.5, moon_sep, moon_alt[i], sun_sep, sun_alt[i])
+            self.assertTrue(np.allclose(fexp[i], expected, rtol=1e-12, atol=0))
+
+    def test_exposure_model(self):
+        model = desisurvey.etc.get_exposure_model()
+        self.assertIs(model, desisurvey.etc.get_exposure_model())
+        self.assertIsNot(model, desisurvey.etc.get_exposure_model(use_cache=False))
+        gen = np.random.RandomState(123)
+        n = 100
+        seeing = gen.uniform(0.5, 2.5, n)
+        transparency = gen.uniform(0.1, 1, n)
+        EBV = gen.uniform(0, 0.3, n)
+        airmass = gen.uniform(1, 2, n)
+        moon_frac = gen.uniform(0, 1, n)
+        moon_sep = gen.uniform(0, 180, n)
+        moon_alt = gen.uniform(-90, 90, n)
+        #- Model methods agree with module functions
+        self.assertTrue(np.array_equal(
+            model.seeing_exposure_factor(seeing),
+            desisurvey.etc.seeing_exposure_factor(seeing)))
+        self.assertTrue(np.array_equal(
+            model.dust_exposure_factor(EBV), desisurvey.etc.dust_exposure_factor(EBV)))
+        self.assertTrue(np.allclose(model.seeing_exposure_factor(1.1), 1.))
+        for program in 'DARK', 'GRAY', 'BRIGHT':
+            t1 = model.exposure_time(program, seeing, transparency, airmass, EBV,
+                                     moon_frac, moon_sep, moon_alt)
+            t2 = exposure_time(program, seeing, transparency, airmass, EBV,
+                               moon_frac, moon_sep, moon_alt)
+            self.assertTrue(np.array_equal(t1.to(u.s).value, t2.to(u.s).value))
+        with self.assertRaises(ValueError):
+            model.airmass_exposure_factor(0.9)
+        #- Module functions use the shared model
+        shared = desisurvey.etc.get_exposure_model()
+        with unittest.mock.patch.object(shared, 'dust_exposure_factor', return_value=-1.):
+            self.assertEqual(desisurvey.etc.dust_exposure_factor(EBV), -1.)
+        #- Exposure factors broadcast over moon and sun parameters
+        sun_sep = gen.uniform(0, 180, n)
+        sun_alt = gen.uniform(-40, -10, n)
+        fexp = desisurvey.etc.exposure_factor(
+            airmass, moon_frac, moon_sep, moon_alt, sun_sep, sun_alt)
+        self.assertEqual(fexp.shape, (n,))
+        for i in range(n):
+            expected = model.airmass_exposure_factor(airmass[i]) * desisurvey.etc.bright_exposure_factor(
+                airmass[i:i + 1], moon_frac[i], moon_sep[i:i + 1], moon_alt[i], sun_sep[i:i + 1], sun_alt[i])
+            self.assertTrue(np.allclose(fexp[i], expected, rtol=1e-12, atol=0))
+        with self.assertRaises(ValueError):
+            model.exposure_factor(airmass, moon_frac + 1, moon_sep, moon_alt, sun_sep, sun_alt)
+
     def test_ETC(self):
         for save in False, True:
             ETC = ExposureTimeCalculator(save_history=save)
@@ -108,6 +265,132 @@ class TestExpCalc(unittest.TestCase):
             self.assertEqual(ETC.exptime, now - 1.)
             self.assertTrue((not done) or (ETC.snr2frac >= 1))
 
+    def test_integrate(self):
+        #- Integrating a time series is identical to step-by-step updates
+        gen = np.random.RandomState(123)
+        nsamples = 100
+        for trial in range(20):
+            mjd = 1. + np.cumsum(gen.uniform(20, 120, nsamples)) / 86400.
+            # Alternate between variable conditions, which trigger an abort,
+            # and stable conditions, which reach the target SNR2.
+            if trial % 2:
+                seeing = gen.uniform(0.8, 2.0, nsamples)
+                transp = gen.uniform(0.5, 1.0, nsamples)
+            else:
+                seeing = gen.uniform(1.0, 1.2, nsamples)
+                transp = gen.uniform(0.9, 1.0, nsamples)
+            sky = gen.uniform(1.0, 1.5, nsamples)
+            seeing[:3], transp[:3] = 1.1, 1.
+            ETC1 = ExposureTimeCalculator(save_history=True)
+            ETC2 = ExposureTimeCalculator(save_history=True)
+            for ETC in ETC1, ETC2:
+                ETC.start(1., 1, 'DARK', 0.2, 1.2, 1.1, 1.0, 1.0)
+            # Use the first few samples to perform normal updates.
+            for i in range(3):
+                self.assertTrue(ETC1.update(mjd[i], seeing[i], transp[i], sky[i]))
+                ETC2.update(mjd[i], seeing[i], transp[i], sky[i])
+            for i in range(3, nsamples):
+                more = ETC1.update(mjd[i], seeing[i], transp[i], sky[i])
+                if not more:
+                    break
+            nused, more2 = ETC2.integrate(mjd[3:], seeing[3:], transp[3:], sky[3:])
+            self.assertEqual(nused, i - 2)
+            self.assertEqual(more2, more)
+            self.assertEqual(ETC2.snr2frac, ETC1.snr2frac)
+            self.assertEqual(ETC2.should_abort, ETC1.should_abort)
+            for key in ETC1.history:
+                self.assertTrue(np.array_equal(ETC1.history[key], ETC2.history[key]))
+            self.assertEqual(ETC1.stop(mjd[i]), ETC2.stop(mjd[i]))
+            self.assertEqual(ETC1.exptime, ETC2.exptime)
+
+    def test_history_buffer(self):
+        #- Rows are kept in order, growing up to the maximum size
+        for max_size in None, 7, 8:
+            buffer = HistoryBuffer(('a', 'b'), size=2, max_size=max_size)
+            rows = np.arange(40, dtype=float).reshape(20, 2)
+            for nappend, nextend in (3, 0), (0, 4), (1, 3), (0, 9), (3, 0):
+                for row in rows[:nappend]:
+                    buffer.append(*row)
+                buffer.extend(*rows[nappend:nappend + nextend].T)
+                rows = rows[nappend + nextend:]
+            expected = np.arange(40, dtype=float).reshape(20, 2)
+            if max_size is not None:
+                expected = expected[-max_size:]
+            self.assertEqual(len(buffer), len(expected))
+            self.assertTrue(np.array_equal(buffer.view(), expected))
+            self.assertTrue(np.array_equal(buffer.view('b'), expected[:, 1]))
+            #- Views do not copy until the buffer wraps around
+            if max_size is None:
+                self.assertTrue(np.shares_memory(buffer.view('a'), buffer._arrays[0]))
+            self.assertFalse(np.shares_memory(buffer.view('a', copy=True), buffer._arrays[0]))
+        with self.assertRaises(ValueError):
+            HistoryBuffer(('a',), size=0)
+        #- ETC history is capped
+        ETC = ExposureTimeCalculator(save_history=True, history_size=2, max_history=5)
+        ETC.start(0., 1, 'DARK', 0., 1., 1.1, 1.0, 1.0)
+        for i in range(10):
+            ETC.update((i + 1) / 1440., 1.1, 1.0, 1.0)
+        history = ETC.history
+        self.assertTrue(np.allclose(history['mjd'], np.arange(6, 11) / 1440.))
+        self.assertEqual(history['snr2frac'][-1], ETC.snr2frac)
+        #- ETC history values are views until the buffer wraps around, or copies on request
+        copied = ETC.history_copy()
+        ETC.update(11 / 1440., 1.1, 1.0, 1.0)
+        self.assertTrue(np.allclose(copied['mjd'], np.arange(6, 11) / 1440.))
+        self.assertTrue(np.allclose(ETC.history['mjd'], np.arange(7, 12) / 1440.))
+        ETC = ExposureTimeCalculator(save_history=True)
+        ETC.start(0., 1, 'DARK', 0., 1., 1.1, 1.0, 1.0)
+        ETC.update(1 / 1440., 1.1, 1.0, 1.0)
+        for name, values in ETC.history.items():
+            self.assertTrue(np.shares_memory(values, ETC._history._arrays[ETC.HISTORY_NAMES.index(name)]))
+        for name, values in ETC.history_copy().items():
+            self.assertFalse(np.shares_memory(values, ETC._history._arrays[ETC.HISTORY_NAMES.index(name)]))
+        with self.assertRaises(RuntimeError):
+            ExposureTimeCalculator().history
+
+    def test_batch_ETC(self):
+        #- Batch ETC tracks the same exposures as independent ETCs
+        n = 50
+        gen = np.random.RandomState(123)
+        programs = np.array(['DARK', 'GRAY', 'BRIGHT'])[gen.randint(3, size=n)]
+        snr2frac = gen.uniform(0, 0.5, n)
+        factor = gen.uniform(1, 2, n)
+        batch = BatchExposureTimeCalculator(n, save_history=True, history_size=4)
+        scalars = [ExposureTimeCalculator() for i in range(n)]
+        now = 1.
+        batch.start(now, 1, programs, snr2frac, factor, 1.1, 1.0, 1.0)
+        for i, ETC in enumerate(scalars):
+            ETC.start(now, 1, programs[i], snr2frac[i], factor[i], 1.1, 1.0, 1.0)
+        self.assertTrue(np.all(batch.active))
+        done = np.zeros(n, bool)
+        while np.any(batch.active):
+            now += 60 / 86400.
+            seeing = gen.uniform(0.8, 2.0, n)
+            transp = gen.uniform(0.5, 1.0, n)
+            sky = gen.uniform(1.0, 1.5, n)
+            active = batch.active.copy()
+            more = batch.update(now, seeing, transp, sky)
+            self.assertFalse(np.any(more[~active]))
+            for i in np.flatnonzero(active):
+                self.assertEqual(more[i], scalars[i].update(now, seeing[i], transp[i], sky[i]))
+                self.assertAlmostEqual(batch.snr2frac[i], scalars[i].snr2frac, 12)
+            stop = active & ~more
+            done |= batch.stop(now, mask=stop)
+            for i in np.flatnonzero(stop):
+                self.assertEqual(done[i], scalars[i].stop(now))
+                self.assertEqual(batch.exptime[i], scalars[i].exptime)
+        self.assertFalse(np.any(batch.active))
+        #- History is recorded in preallocated buffers that grow as needed
+        history = batch.history
+        self.assertEqual(history['mjd'].shape[1], n)
+        self.assertGreater(len(history['mjd']), 4)
+        self.assertTrue(np.array_equal(history['snr2frac'][0], snr2frac))
+        #- A consecutive exposure of the same tile is recognized
+        batch.start(now, 1, 'DARK', 0.5, 1., 1.1, 1.0, 1.0, mask=np.arange(n) < 2)
+        self.assertTrue(np.array_equal(batch.tile_nexp[:3], [2, 2, 1]))
+        with self.assertRaises(ValueError):
+            batch.stop(now, mask=np.ones(n + 1, bool))
+
 
 def test_suite():
     """Allows testing of only this module with the command::
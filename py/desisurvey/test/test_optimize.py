@@ -2,7 +2,12 @@ import unittest
 
 import numpy as np
 
+import astropy.units as u
+
+import desisurvey.tiles
+import desisurvey.utils
 from desisurvey.optimize import *
+from desisurvey.test.base import Tester
 
 
 class TestUtils(unittest.TestCase):
@@ -15,6 +20,138 @@ class TestUtils(unittest.TestCase):
             assert np.all(w < dx + 360)
 
 
+class TestOptimizer(Tester):
+
+    def get_optimizer(self, program='DARK', nbins=96, **kwargs):
+        edges = np.linspace(0., 360., nbins + 1)
+        centers = 0.5 * (edges[1:] + edges[:-1])
+        hist = 10 + 5 * np.cos(np.radians(centers - 45))
+        return Optimizer(program, edges, hist, **kwargs)
+
+    def test_init_array(self):
+        opt = self.get_optimizer(init='zero')
+        gen = np.random.RandomState(123)
+        ha = gen.uniform(-10, 10, opt.ntiles)
+        opt2 = self.get_optimizer(init='array', initial_ha=ha, subset=opt.tid)
+        self.assertTrue(np.array_equal(opt2.ha, ha))
+        self.assertTrue(np.array_equal(opt2.plan_hist, opt.get_plan_hist(*opt.get_plan(ha))))
+        # Tiles from another program are not allowed.
+        tiles = desisurvey.tiles.get_tiles()
+        other = tiles.tileID[~tiles.program_mask['DARK']][:1]
+        with self.assertRaises(ValueError):
+            self.get_optimizer(init='array', initial_ha=np.zeros(len(other)), subset=other)
+
+    def test_eval_score(self):
+        opt = self.get_optimizer(init='zero')
+        gen = np.random.RandomState(123)
+        plan_hists = opt.plan_hist * gen.uniform(0.9, 1.1, (5, opt.nbins))
+        scores = opt.eval_score(plan_hists)
+        self.assertEqual(scores.shape, (5,))
+        for plan_hist, score in zip(plan_hists, scores):
+            self.assertTrue(np.allclose(opt.eval_score(plan_hist), score, rtol=1e-12, atol=0))
+        self.assertTrue(np.isscalar(opt.eval_score(opt.plan_hist)))
+
+    def test_improve(self):
+        opt = self.get_optimizer(init='flat', center=45.)
+        initial_score = opt.eval_score(opt.plan_hist)
+        for i in range(50):
+            opt.improve(frac=0.25)
+        self.assertEqual(opt.nimprove, 50)
+        self.assertTrue(opt.eval_score(opt.plan_hist) <= initial_score)
+        self.assertTrue(np.allclose(opt.plan_tiles, opt.expand_plan(*opt.get_plan(opt.ha))))
+
+    def test_get_plan(self):
+        gen = np.random.RandomState(123)
+        for nbins in (96, 960):
+            opt = self.get_optimizer(init='zero', nbins=nbins)
+            ha = gen.uniform(-30, 30, opt.ntiles)
+            first, weights = opt.get_plan(ha)
+            self.assertEqual(first.shape, (opt.ntiles,))
+            # Compare with the overlap of each exposure with all LST bins.
+            exptime, _ = opt.get_exptime(ha)
+            self.assertEqual(weights.shape[1], int(exptime.max() // opt.binsize) + 2)
+            lst_min = wrap(opt.ra + ha - 0.5 * exptime, opt.origin)
+            lst_max = wrap(opt.ra + ha + 0.5 * exptime, opt.origin)
+            lo = np.clip(opt.lst_edges[1:] - lst_min[:, np.newaxis], 0, opt.binsize)
+            hi = np.clip(lst_max[:, np.newaxis] - opt.lst_edges[:-1], 0, opt.binsize)
+            dense = lo + hi
+            dense[lst_max > lst_min] -= opt.binsize
+            plan = opt.expand_plan(first, weights)
+            self.assertTrue(np.allclose(plan, dense * 24. / 360., rtol=0, atol=1e-12))
+            self.assertTrue(np.allclose(plan.sum(axis=1), exptime * 24. / 360.))
+            # Banded plans for a subset.
+            subset = gen.choice(opt.ntiles, 10, replace=False)
+            first, weights = opt.get_plan(ha[subset], subset)
+            self.assertTrue(np.allclose(opt.expand_plan(first, weights), plan[subset]))
+            # Scores of single-tile moves agree with a dense calculation.
+            opt.plan_first, opt.plan_weights = opt.get_plan(ha)
+            opt.use_plan()
+            for ibin in (0, nbins // 2, nbins - 1):
+                self.assertTrue(np.array_equal(opt.plan_in_bin(ibin), plan[:, ibin]))
+            for dha in (-5., 0.5):
+                first, weights = opt.get_plan(ha[subset] + dha, subset)
+                scores = opt.eval_move_scores(subset, first, weights)
+                dense_hist = opt.plan_hist - plan[subset] + opt.expand_plan(first, weights)
+                self.assertTrue(np.allclose(scores, opt.eval_score(dense_hist), rtol=1e-12, atol=0))
+
+    def test_smoothing(self):
+        opt = self.get_optimizer(init='zero')
+        # Calculate dense weights without any cutoff.
+        sep = desisurvey.utils.separation_matrix(opt.ra, opt.dec, opt.ra, opt.dec)
+        dense = np.exp(-0.5 * (sep / 10.) ** 2)
+        np.fill_diagonal(dense, 0.)
+        opt.init_smoothing(10 * u.deg, cutoff=np.inf)
+        self.assertTrue(np.allclose(opt.smoothing_weights.toarray(), dense, rtol=1e-8, atol=1e-12))
+        # Truncated weights give the same smoothing to a small tolerance.
+        opt.init_smoothing(10 * u.deg, cutoff=4.)
+        weights = opt.smoothing_weights.toarray()
+        self.assertTrue(np.all(weights[sep > 40.] == 0))
+        self.assertTrue(np.allclose(weights[sep < 39.], dense[sep < 39.], rtol=1e-8, atol=1e-12))
+        gen = np.random.RandomState(123)
+        opt.ha = gen.uniform(-10, 10, opt.ntiles)
+        expected = 0.9 * opt.ha + 0.1 * dense.dot(opt.ha) / dense.sum(axis=1)
+        opt.smooth(alpha=0.1)
+        self.assertTrue(np.allclose(opt.ha, expected, rtol=0, atol=1e-3))
+
+    def test_minimize(self):
+        opt = self.get_optimizer(init='flat', center=45.)
+        gen = np.random.RandomState(123)
+        ha = np.clip(opt.ha + gen.uniform(-2, 2, opt.ntiles), -opt.max_abs_ha, opt.max_abs_ha)
+        score, gradient = opt.eval_score_gradient(ha)
+        self.assertTrue(np.allclose(score, opt.eval_score(opt.expand_plan(*opt.get_plan(ha)).sum(axis=0))))
+        # Compare with finite differences.
+        for itile in gen.choice(opt.ntiles, 5, replace=False):
+            dha = np.zeros(opt.ntiles)
+            dha[itile] = 1e-4
+            numerical = (opt.eval_score_gradient(ha + dha)[0] -
+                         opt.eval_score_gradient(ha - dha)[0]) / 2e-4
+            self.assertTrue(np.allclose(gradient[itile], numerical, rtol=1e-3, atol=1e-8))
+        initial_score = opt.eval_score(opt.plan_hist)
+        opt.minimize()
+        self.assertTrue(np.all(np.abs(opt.ha) < opt.max_abs_ha))
+        self.assertTrue(opt.eval_score(opt.plan_hist) < initial_score)
+        self.assertTrue(np.allclose(opt.plan_tiles, opt.expand_plan(*opt.get_plan(opt.ha))))
+
+    def test_update_plan(self):
+        opt = self.get_optimizer(init='flat', center=45.)
+        opt.resync_interval = 7
+        gen = np.random.RandomState(123)
+        for i in range(20):
+            itile = gen.randint(opt.ntiles)
+            dha = gen.uniform(-5, 5)
+            first, weights = opt.get_plan(opt.ha[[itile]] + dha, [itile])
+            opt.update_plan(itile, first[0], weights[0])
+            # Incremental updates agree with a full recalculation.
+            plan_hist = opt.plan_tiles.sum(axis=0)
+            self.assertTrue(np.allclose(opt.plan_hist, plan_hist, rtol=1e-12, atol=1e-12))
+            self.assertTrue(np.allclose(opt.plan_sum, plan_hist.sum(), rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(opt.loss_history[-1], opt.eval_loss(plan_hist), rtol=1e-10, atol=1e-12))
+            self.assertTrue(np.allclose(opt.RMSE_history[-1], opt.eval_RMSE(plan_hist), rtol=1e-8, atol=0))
+            self.assertTrue(np.allclose(opt.scale_history[-1], opt.eval_scale(plan_hist), rtol=1e-12, atol=0))
+            self.assertEqual(opt.scale_history[-1], opt.eval_scale(opt.plan_hist))
+            self.assertEqual(opt.nupdates, (i + 1) % 7)
+
+
 def test_suite():
     """Allows testing of only this module with the command::
 
@@ -33,9 +33,10 @@ class TestPlan(Tester):
                     self.assertTrue(np.array_equal(plan.tile_countdown, plan2.tile_countdown))
                 # Mark a random set of tiles completed after this night.
                 completed[gen.choice(tiles.ntiles, tiles.ntiles // num_nights)] = True
-                # Save and restore our state.
-                plan.save('snapshot.fits')
-                plan2 = Planner(restore='snapshot.fits')
+                # Save and restore our state, alternating FITS and binary snapshots.
+                name = 'snapshot.fits' if i % 2 else 'snapshot.npz'
+                plan.save(name)
+                plan2 = Planner(restore=name)
 
 
 def test_suite():
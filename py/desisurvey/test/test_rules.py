@@ -1,7 +1,9 @@
+import os
 import unittest
 
 import numpy as np
 
+import desisurvey.config
 import desisurvey.tiles
 from desisurvey.test.base import Tester
 from desisurvey.rules import Rules
@@ -21,6 +23,45 @@ class TestRules(Tester):
             completed[gen.choice(tiles.ntiles, tiles.ntiles // 10, replace=False)] = True
             rules.apply(completed)
 
+    def test_incremental(self):
+        rules = Rules('rules-layers.yaml')
+        reference = Rules('rules-layers.yaml')
+        tiles = desisurvey.tiles.get_tiles()
+        completed = np.zeros(tiles.ntiles, bool)
+        priorities = rules.apply(completed)
+        gen = np.random.RandomState(123)
+        for i in range(10):
+            new = gen.choice(tiles.ntiles, tiles.ntiles // 10, replace=False)
+            completed[new] = True
+            # Chain incremental updates without resetting their state.
+            changed = rules.apply_incremental(new)
+            expected = reference.apply(completed)
+            self.assertTrue(np.array_equal(
+                changed, np.where(expected != priorities)[0]))
+            self.assertTrue(np.array_equal(rules.priorities, expected))
+            priorities = expected
+
+    def test_cache(self):
+        rules = Rules('rules-layers.yaml', use_cache=False, write_cache=True)
+        restored = Rules('rules-layers.yaml', use_cache=True)
+        self.assertEqual(rules.group_names, restored.group_names)
+        self.assertEqual(rules.group_rules, restored.group_rules)
+        self.assertTrue(np.array_equal(rules.group_ids, restored.group_ids))
+        self.assertTrue(np.array_equal(rules.dec_priority, restored.dec_priority))
+        completed = np.zeros(len(rules.group_ids), bool)
+        completed[::3] = True
+        self.assertTrue(np.array_equal(rules.apply(completed), restored.apply(completed)))
+        # A corrupt cache is ignored and the rules are parsed again.
+        cache_name = desisurvey.config.Configuration().get_path('rules-layers-compiled.npz')
+        with open(cache_name, 'r+b') as f:
+            f.truncate(100)
+        reparsed = Rules('rules-layers.yaml', use_cache=True)
+        self.assertTrue(np.array_equal(rules.apply(completed), reparsed.apply(completed)))
+        # Rules are not cached by default.
+        os.remove(cache_name)
+        Rules('rules-layers.yaml')
+        self.assertFalse(os.path.exists(cache_name))
+
 
 def test_suite():
     """Allows testing of only this module with the command::
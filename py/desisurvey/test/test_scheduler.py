@@ -4,8 +4,10 @@ import datetime
 import numpy as np
 
 import desisurvey.plan
+import desisurvey.tiles
 import desisurvey.etc
 import desisurvey.config
+import desisurvey.utils
 from desisurvey.test.base import Tester
 from desisurvey.scripts import surveyinit
 from desisurvey.scheduler import Scheduler
@@ -24,9 +26,10 @@ class TestScheduler(Tester):
         num_nights = (self.stop - self.start).days
         for i in range(num_nights):
             night = self.start + datetime.timedelta(i)
-            # Save and restore scheduler state.
-            scheduler.save('snapshot.fits')
-            scheduler2 = Scheduler(restore='snapshot.fits')
+            # Save and restore scheduler state, alternating FITS and binary snapshots.
+            name = 'snapshot.fits' if i % 2 else 'snapshot.npz'
+            scheduler.save(name)
+            scheduler2 = Scheduler(restore=name)
             self.assertTrue(np.all(scheduler.snr2frac == scheduler2.snr2frac))
             self.assertTrue(np.all(scheduler.completed == scheduler2.completed))
             self.assertTrue(np.all(scheduler.completed_by_pass == scheduler2.completed_by_pass))
@@ -51,6 +54,113 @@ class TestScheduler(Tester):
                     scheduler.update_snr(tileid, 1.)
                     scheduler2.update_snr(tileid, 1.)
 
+    def test_update_tiles(self):
+        tiles = desisurvey.tiles.get_tiles()
+        scheduler = Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+        gen = np.random.RandomState(123)
+        avail = np.zeros(tiles.ntiles, bool)
+        pri = np.zeros(tiles.ntiles)
+        avail[:tiles.ntiles // 2] = True
+        pri[::2] = 1.
+        new_avail, new_planned = scheduler.update_tiles(avail, pri)
+        self.assertTrue(np.array_equal(new_avail, np.where(avail)[0]))
+        self.assertTrue(np.array_equal(new_planned, np.where(pri > 0)[0]))
+        scheduler.init_night(self.start)
+        # Apply sparse priority changes during the night.
+        changed = gen.choice(tiles.ntiles, 10, replace=False)
+        pri[changed] += 1.
+        avail[changed] = True
+        scheduler.update_tiles(avail, pri, changed)
+        self.assertTrue(np.array_equal(scheduler.tile_priority, pri))
+        with np.errstate(divide='ignore'):
+            self.assertTrue(np.array_equal(scheduler.log_priority, np.log(pri)))
+        self.assertTrue(np.all(scheduler.in_night_pool[changed] | scheduler.too_close_to_planet(changed)))
+        self.assertEqual(scheduler.num_schedulable, np.count_nonzero(avail & (pri > 0)))
+        # Repeated indices are only counted once.
+        idx = np.flatnonzero(~avail & (pri == 0))[:3]
+        avail[idx] = True
+        pri[idx] = 1.
+        scheduler.update_tiles(avail, pri, np.concatenate((idx, idx[::-1], idx)))
+        self.assertEqual(scheduler.num_schedulable, np.count_nonzero(avail & (pri > 0)))
+        # Unplanning a tile is not allowed.
+        pri[changed[0]] = 0.
+        with self.assertRaises(RuntimeError):
+            scheduler.update_tiles(avail, pri)
+
+    def test_night_sky(self):
+        tiles = desisurvey.tiles.get_tiles()
+        scheduler = Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+        scheduler.update_tiles(np.ones(tiles.ntiles, bool), np.ones(tiles.ntiles))
+        gen = np.random.RandomState(123)
+        for i in range(0, (self.stop - self.start).days, 7):
+            scheduler.init_night(self.start + datetime.timedelta(i))
+            self.assertTrue(np.all(np.diff(scheduler.sky_mjd) <= scheduler.sky_interval / (24 * 60) + 1e-12))
+            ephem = scheduler.night_ephem
+            for mjd in gen.uniform(ephem['brightdusk'], ephem['brightdawn'], 10):
+                # Cached sky exposure factors agree with the exact calculation.
+                scheduler.airmass[:] = gen.uniform(1, 2, tiles.ntiles)
+                moonDEC, moonRA = scheduler.moon_DECRA(mjd)
+                moonALT, _ = scheduler.moon_ALTAZ(mjd)
+                sunDEC, sunRA = scheduler.sun_DECRA(mjd)
+                sunALT, _ = scheduler.sun_ALTAZ(mjd)
+                moonSEP = desisurvey.utils.separation_matrix(
+                    [moonRA], [moonDEC], tiles.tileRA, tiles.tileDEC)
+                sunSEP = desisurvey.utils.separation_matrix(
+                    [sunRA], [sunDEC], tiles.tileRA, tiles.tileDEC)
+                expected = scheduler.exposure_model.exposure_factor(
+                    scheduler.airmass, ephem['moon_illum_frac'], moonSEP, moonALT, sunSEP, sunALT)
+                fexp = scheduler.update_exposure_factor(mjd, tiles.tileID)
+                self.assertTrue(np.allclose(fexp, expected, rtol=1e-4, atol=0))
+
+    def test_night_cube(self):
+        tiles = desisurvey.tiles.get_tiles()
+        scheduler = Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+        scheduler.update_tiles(np.ones(tiles.ntiles, bool), np.ones(tiles.ntiles))
+        ETC = desisurvey.etc.ExposureTimeCalculator()
+        # Find a night with the moon up.
+        for i in range((self.stop - self.start).days):
+            night = self.start + datetime.timedelta(i)
+            scheduler.init_night(night, cube_interval=5.)
+            if scheduler.night_ephem['moon_illum_frac'] > 0.5:
+                break
+        ntimes, ntiles = len(scheduler.cube_mjd), len(scheduler.cube_tiles)
+        self.assertEqual(ntiles, np.count_nonzero(scheduler.in_night_pool))
+        self.assertTrue(np.all(np.diff(scheduler.cube_mjd) <= 5. / (24 * 60) + 1e-12))
+        for cube in (scheduler.cube_airmass_factor, scheduler.cube_sky_factor,
+                     scheduler.cube_observable):
+            self.assertEqual(cube.shape, (ntimes, ntiles))
+        # Precomputed values agree with next_tile at grid times.
+        for k in range(1, ntimes - 1, 10):
+            mjd = scheduler.cube_mjd[k]
+            for program in tiles.PROGRAMS:
+                # Temporarily disable the cube for the exact calculation.
+                cube_mjd, scheduler.cube_mjd = scheduler.cube_mjd, None
+                exact = scheduler.next_tile(mjd, ETC, 1.1, 1.0, 1., program=program,
+                                            use_brightsky=True, greediness=1.)
+                sel = scheduler.tile_sel.copy()
+                fexp = scheduler.exposure_factor.copy()
+                scheduler.cube_mjd = cube_mjd
+                cubed = scheduler.next_tile(mjd, ETC, 1.1, 1.0, 1., program=program,
+                                            use_brightsky=True, greediness=1.)
+                self.assertEqual(exact[0], cubed[0])
+                self.assertTrue(np.allclose(scheduler.exposure_factor[sel], fexp[sel]))
+                in_program = tiles.program_mask[program][scheduler.cube_tiles]
+                self.assertTrue(np.array_equal(
+                    scheduler.cube_observable[k][in_program],
+                    sel[scheduler.cube_tiles][in_program]))
+        # Forecasts cover the rest of the night.
+        mjd_now = scheduler.cube_mjd[ntimes // 2]
+        mjd, tileID, factor = scheduler.forecast_exposure_factor(mjd_now)
+        self.assertTrue(np.all(mjd > mjd_now))
+        self.assertEqual(factor.shape, (len(mjd), len(tileID)))
+        self.assertTrue(np.all(factor >= 0))
+        # Tiles removed from the pool are not forecast.
+        scheduler.update_snr(tileID[0], 1.)
+        self.assertNotIn(tileID[0], scheduler.forecast_exposure_factor(mjd_now)[1])
+        scheduler.init_night(night)
+        with self.assertRaises(RuntimeError):
+            scheduler.forecast_exposure_factor(mjd_now)
+
 
 def test_suite():
     """Allows testing of only this module with the command::
@@ -0,0 +1,120 @@
+import unittest
+import os
+import datetime
+
+import numpy as np
+
+import desisurvey.tiles
+import desisurvey.config
+import desisurvey.snapshot
+import desisurvey.NTS
+from desisurvey.test.base import Tester
+from desisurvey.plan import Planner
+from desisurvey.scheduler import Scheduler
+from desisurvey.scripts import surveyinit
+
+
+class TestSnapshot(Tester):
+
+    def test_snapshot(self):
+        tiles = desisurvey.tiles.get_tiles()
+        config = desisurvey.config.Configuration()
+        planner = Planner()
+        scheduler = Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+        planner.afternoon_plan(self.start, scheduler.completed)
+        gen = np.random.RandomState(123)
+        scheduler.snr2frac[:] = gen.uniform(size=tiles.ntiles)
+        # Save both objects in a single snapshot.
+        fullname = config.get_path('snapshot.npz')
+        desisurvey.snapshot.write_snapshot(fullname, planner=planner, scheduler=scheduler)
+        arrays, meta = desisurvey.snapshot.read_snapshot(fullname, tiles.tileID)
+        self.assertEqual(meta['FIRST'], self.start.isoformat())
+        # Restore each object from the same snapshot.
+        planner2 = Planner(restore='snapshot.npz')
+        scheduler2 = Scheduler(restore='snapshot.npz', design_hourangle=np.zeros(tiles.ntiles))
+        self.assertEqual(planner.first_night, planner2.first_night)
+        self.assertEqual(planner.last_night, planner2.last_night)
+        self.assertTrue(np.array_equal(planner.tile_covered, planner2.tile_covered))
+        self.assertTrue(np.array_equal(planner.tile_countdown, planner2.tile_countdown))
+        self.assertTrue(np.array_equal(planner.tile_available, planner2.tile_available))
+        self.assertTrue(np.array_equal(planner.tile_priority, planner2.tile_priority))
+        self.assertTrue(np.array_equal(scheduler.snr2frac, scheduler2.snr2frac))
+        # A scheduler-only snapshot cannot restore a planner.
+        scheduler.save('scheduler.npz')
+        with self.assertRaises(RuntimeError):
+            Planner(restore='scheduler.npz')
+
+    def test_history(self):
+        tiles = desisurvey.tiles.get_tiles()
+        planner = Planner()
+        scheduler = Scheduler(design_hourangle=np.zeros(tiles.ntiles))
+        history = desisurvey.snapshot.SnapshotHistory(keyframe_interval=3)
+        gen = np.random.RandomState(123)
+        saved = []
+        for i in range(8):
+            night = self.start + datetime.timedelta(days=i)
+            planner.afternoon_plan(night, scheduler.completed)
+            if i % 2:
+                # Observe some tiles on odd nights only.
+                idx = gen.choice(tiles.ntiles, size=10, replace=False)
+                scheduler.snr2frac[idx] += gen.uniform(size=10)
+            history.save(night, planner, scheduler)
+            saved.append(scheduler.snr2frac.copy())
+        self.assertEqual(len(history.nights), 8)
+        entries = [history.index[n] for n in history.nights]
+        self.assertEqual(entries[0]['delta'], None)
+        self.assertEqual(entries[3]['delta'], None)
+        self.assertEqual(entries[1]['keyframe'], entries[0]['keyframe'])
+        # Saving identical content does not create any new files.
+        nobjects = len(os.listdir(history.objects_path))
+        history.save(night, planner, scheduler)
+        self.assertEqual(len(os.listdir(history.objects_path)), nobjects)
+        # Re-saving a night during observing replaces its delta.
+        for i in range(5):
+            scheduler.snr2frac[i] += 0.1
+            history.save(night, planner, scheduler)
+            self.assertEqual(len(os.listdir(history.objects_path)), nobjects)
+        scheduler.snr2frac[:] = saved[-1]
+        history.save(night, planner, scheduler)
+        self.assertEqual(len(os.listdir(history.objects_path)), nobjects)
+        # Restore nights in random order from a new history instance.
+        history = desisurvey.snapshot.SnapshotHistory()
+        for i in gen.permutation(8):
+            night = self.start + datetime.timedelta(days=int(i))
+            scheduler2 = Scheduler(restore=history.read(night),
+                                   design_hourangle=np.zeros(tiles.ntiles))
+            self.assertTrue(np.array_equal(scheduler2.snr2frac, saved[i]))
+        planner2 = Planner(restore=history.read(night))
+        self.assertEqual(planner2.last_night, night)
+        with self.assertRaises(ValueError):
+            history.read(self.start - datetime.timedelta(days=1))
+
+    def test_afternoon_plan(self):
+        # The scheduler needs design hour angles from surveyinit.
+        args = surveyinit.parse(['--max-cycles', '2', '--init', 'zero'])
+        surveyinit.main(args)
+        config = desisurvey.config.Configuration()
+        night = self.start.isoformat()
+        nextnight = (self.start + datetime.timedelta(days=1)).isoformat()
+        desisurvey.NTS.afternoon_plan(night)
+        desisurvey.NTS.afternoon_plan(nextnight, lastnight=night)
+        history = desisurvey.snapshot.SnapshotHistory()
+        self.assertEqual(history.nights, [night, nextnight])
+        planner = Planner(restore=history.read(nextnight))
+        self.assertEqual(planner.last_night, self.start + datetime.timedelta(days=1))
+        # The NTS restores its state from the history.
+        nts = desisurvey.NTS.NTS(None, '.', night=self.start + datetime.timedelta(days=1))
+        self.assertTrue(np.array_equal(nts.planner.tile_priority, planner.tile_priority))
+        # Legacy FITS files are only written on request.
+        fitsname = config.get_path('scheduler_{}.fits'.format(nextnight))
+        self.assertFalse(os.path.exists(fitsname))
+        desisurvey.NTS.afternoon_plan(nextnight, lastnight=night, fits=True)
+        self.assertTrue(os.path.exists(fitsname))
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
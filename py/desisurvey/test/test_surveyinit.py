@@ -0,0 +1,147 @@
+import os
+import unittest
+import unittest.mock
+
+import numpy as np
+
+import astropy.io.fits
+
+import desisurvey.config
+import desisurvey.optimize
+import desisurvey.tiles
+from desisurvey.test.base import Tester
+from desisurvey.scripts import surveyinit
+
+
+class TestSurveyInit(Tester):
+
+    def run_surveyinit(self, options, headers=False):
+        cmd = 'surveyinit --max-cycles 2 --init zero ' + options
+        args = surveyinit.parse(cmd.split()[1:])
+        surveyinit.main(args)
+        config = desisurvey.config.Configuration()
+        with astropy.io.fits.open(config.get_path(args.save)) as hdus:
+            if headers:
+                return {hdu.name: hdu.header.copy() for hdu in hdus[1:]}
+            return {hdu.name: hdu.data.copy() for hdu in hdus[1:]}
+
+    def test_nproc(self):
+        serial = self.run_surveyinit('--save serial.fits')
+        parallel = self.run_surveyinit('--save parallel.fits --nproc 3')
+        self.assertEqual(list(serial), list(parallel))
+        for name in serial:
+            for column in serial[name].names:
+                self.assertTrue(np.array_equal(serial[name][column], parallel[name][column]))
+
+    def test_nstarts(self):
+        single = self.run_surveyinit('--save single.fits', headers=True)
+        multi = self.run_surveyinit('--save multi.fits --nstarts 3 --nproc 2', headers=True)
+        for program in desisurvey.tiles.get_tiles().PROGRAMS:
+            if program not in single:
+                continue
+            self.assertEqual(single[program]['NSTARTS'], 1)
+            self.assertEqual(multi[program]['NSTARTS'], 3)
+            # The first run reproduces a single run, so the best is no worse.
+            self.assertTrue(multi[program]['SCORE'] <= single[program]['SCORE'])
+            self.assertTrue(multi[program]['SEED'] in (123, 124, 125))
+
+    def test_method(self):
+        anneal = self.run_surveyinit('--save anneal.fits', headers=True)
+        lbfgs = self.run_surveyinit('--save lbfgs.fits --method lbfgs', headers=True)
+        for program in anneal:
+            if program in desisurvey.tiles.get_tiles().PROGRAMS:
+                self.assertTrue(lbfgs[program]['SCORE'] < anneal[program]['SCORE'])
+
+    def test_levels(self):
+        data = self.run_surveyinit('--save levels.fits --levels 2')
+        for program in desisurvey.tiles.get_tiles().PROGRAMS:
+            if program not in data:
+                continue
+            table = data[program]
+            self.assertEqual(len(table), 192)
+            # Planned and initial usage are both at the full resolution.
+            self.assertTrue(np.all(table['PLAN'] >= 0))
+            self.assertTrue(np.all(table['INIT'] >= 0))
+            self.assertTrue(np.allclose(table['PLAN'].sum(), table['INIT'].sum(), rtol=0.2))
+        with self.assertRaises(SystemExit):
+            surveyinit.parse(['--nbins', '100', '--levels', '3'])
+        # Coarser levels take larger HA steps, so fewer improve() calls are
+        # needed in total to reach a target that the tiles can match.
+        edges = np.linspace(0., 360., 193)
+        opt = desisurvey.optimize.Optimizer('DARK', edges, np.ones(192), init='zero')
+        hist = opt.get_plan_hist(*opt.get_plan(15 * np.sin(np.radians(opt.ra))))
+        hist += 1e-3 * hist.mean()
+        nimprove = {}
+        for levels in 0, 2:
+            args = surveyinit.parse(['--init', 'zero', '--levels', str(levels)])
+            table = surveyinit.optimize_program('DARK', edges, hist, args)[0]
+            nimprove[levels] = table.meta['NIMPROVE']
+        self.assertLess(nimprove[2], nimprove[0])
+
+    def test_resume(self):
+        edges = np.linspace(0., 360., 97)
+        centers = 0.5 * (edges[1:] + edges[:-1])
+        hist = 10 + 5 * np.cos(np.radians(centers - 45))
+
+        def run(resume, options=''):
+            cmd = 'surveyinit --init zero --levels 1 --max-cycles 2 --checkpoint 1 --save resume.fits'
+            args = surveyinit.parse((cmd + options).split()[1:] + (['--resume'] if resume else []))
+            return surveyinit.optimize_program('DARK', edges, hist, args)
+
+        def assert_same(result1, result2):
+            for column in result1[0].colnames:
+                self.assertTrue(np.array_equal(result1[0][column], result2[0][column]))
+            for value1, value2 in zip(result1[1:], result2[1:]):
+                self.assertTrue(np.array_equal(value1, value2))
+
+        expected = run(resume=False)
+        save_checkpoint = surveyinit.save_checkpoint
+        # Interrupt in the middle and at the end of the coarse level.
+        for nsaved in (2, 3):
+
+            def interrupt(*args, **kwargs):
+                save_checkpoint(*args, **kwargs)
+                interrupt.nsaved += 1
+                if interrupt.nsaved == nsaved:
+                    raise KeyboardInterrupt()
+
+            interrupt.nsaved = 0
+            with unittest.mock.patch.object(surveyinit, 'save_checkpoint', interrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    run(resume=False)
+            # Results after resuming are identical to an uninterrupted run.
+            assert_same(expected, run(resume=True))
+        # A checkpoint saved with different settings is ignored.
+        with unittest.mock.patch.object(surveyinit, 'save_checkpoint', interrupt):
+            interrupt.nsaved = 0
+            with self.assertRaises(KeyboardInterrupt):
+                run(resume=False)
+        resumed = run(resume=True, options=' --adjust 0.5')
+        assert_same(run(resume=False, options=' --adjust 0.5'), resumed)
+
+    def test_incremental(self):
+        config = desisurvey.config.Configuration()
+        first = self.run_surveyinit('--save incremental.fits')
+        fullname = config.get_path('incremental.fits')
+        mtime = os.path.getmtime(fullname)
+        # Nothing is recalculated or rewritten when the inputs are unchanged.
+        self.run_surveyinit('--save incremental.fits')
+        self.assertEqual(os.path.getmtime(fullname), mtime)
+        # Only the BRIGHT program is recalculated after changing its stretch.
+        second = self.run_surveyinit('--save incremental.fits --bright-stretch 1.6')
+        tiles = desisurvey.tiles.get_tiles()
+        for program in tiles.PROGRAMS:
+            if program not in first:
+                continue
+            sel = tiles.program_mask[program]
+            same = program != 'BRIGHT'
+            self.assertEqual(np.array_equal(first['DESIGN']['HA'][sel], second['DESIGN']['HA'][sel]), same)
+            self.assertEqual(np.array_equal(first[program]['PLAN'], second[program]['PLAN']), same)
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
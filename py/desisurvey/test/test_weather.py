@@ -0,0 +1,69 @@
+import unittest
+
+import numpy as np
+
+import desisurvey.utils
+from desisurvey.test.base import Tester
+from desisurvey.weather import Weather, ar1_process, correlation_coefficient
+
+
+class TestWeather(Tester):
+
+    def test_ar1(self):
+        gen = np.random.RandomState(123)
+        rho = correlation_coefficient(5., 60.)
+        x = ar1_process(20000, rho, (3, 4), gen)
+        self.assertEqual(x.shape, (3, 4, 20000))
+        # Samples have zero mean, unit variance and the requested correlation.
+        self.assertTrue(np.allclose(x.mean(axis=-1), 0, atol=0.2))
+        self.assertTrue(np.allclose(x.std(axis=-1), 1, atol=0.1))
+        lag1 = np.mean(x[..., 1:] * x[..., :-1], axis=-1) / np.var(x, axis=-1)
+        self.assertTrue(np.allclose(lag1, rho, atol=0.02))
+        # Results are reproducible.
+        y = ar1_process(100, rho, 2, np.random.RandomState(1))
+        self.assertTrue(np.array_equal(y, ar1_process(100, rho, 2, np.random.RandomState(1))))
+        with self.assertRaises(ValueError):
+            ar1_process(100, 1.)
+
+    def test_weather(self):
+        w = Weather(nrealizations=3, time_step=10., seed=1, dome_closed_fraction=0.3)
+        shape = (3, (self.stop - self.start).days, 144)
+        self.assertEqual(w.seeing.shape, shape)
+        self.assertEqual(w.transparency.shape, shape)
+        self.assertEqual(w.dome_open.shape, shape)
+        self.assertTrue(np.all(w.seeing > 0))
+        self.assertTrue(np.all((w.transparency > 0) & (w.transparency <= 1)))
+        self.assertTrue(abs(np.median(w.seeing) - 1.1) < 0.1)
+        self.assertTrue(abs(np.mean(w.dome_open) - 0.7) < 0.15)
+        # Realizations are different but reproducible.
+        self.assertFalse(np.array_equal(w.seeing[0], w.seeing[1]))
+        w2 = Weather(nrealizations=3, time_step=10., seed=1, dome_closed_fraction=0.3)
+        self.assertTrue(np.array_equal(w.seeing, w2.seeing))
+        self.assertTrue(np.array_equal(w.dome_open, w2.dome_open))
+        # Lookup samples by MJD.
+        noon = desisurvey.utils.local_noon_on_date(self.start).mjd
+        mjd = noon + 2 + np.array([0., 10.5, 20.5]) / (24 * 60)
+        seeing, transp, dome_open = w.get(mjd, realization=2)
+        self.assertTrue(np.array_equal(seeing, w.seeing[2, 2, [0, 1, 2]]))
+        self.assertTrue(np.array_equal(transp, w.transparency[2, 2, [0, 1, 2]]))
+        self.assertTrue(np.array_equal(dome_open, w.dome_open[2, 2, [0, 1, 2]]))
+        seeing, _, _ = w.get(mjd[0], realization=np.arange(3))
+        self.assertTrue(np.array_equal(seeing, w.seeing[:, 2, 0]))
+        with self.assertRaises(ValueError):
+            w.get(noon - 1)
+        # Dome is always open or closed for fractions of 0 or 1.
+        self.assertTrue(np.all(Weather(time_step=60.).dome_open))
+        self.assertFalse(np.any(Weather(time_step=60., dome_closed_fraction=1.).dome_open))
+        # Samples must line up with the start of each night.
+        self.assertEqual(Weather(time_step=7.5).nsteps, 192)
+        for bad in 0., 7., 25 * 60.:
+            with self.assertRaises(ValueError):
+                Weather(time_step=bad)
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -107,7 +107,7 @@ class Tiles(object):
                 mask |= (self.passnum == pnum)
             self.program_mask[p] = mask
         # Calculate and save dust exposure factors.
-        self.dust_factor = desisurvey.etc.dust_exposure_factor(tiles['EBV_MED'])
+        self.dust_factor = desisurvey.etc.get_exposure_model().dust_exposure_factor(tiles['EBV_MED'])
         # Precompute coefficients to calculate tile observing airmass.
         latitude = np.radians(config.location.latitude())
         tile_dec_rad = np.radians(self.tileDEC)
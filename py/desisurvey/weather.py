@@ -0,0 +1,230 @@
+"""Generate random observing conditions for survey simulations.
+
+Use :class:`Weather` to generate time series of atmospheric seeing,
+transparency and dome-open status, for many nights and independent
+realizations at once.
+
+Each time series is generated as a whitened (zero mean, unit variance)
+Gaussian AR(1) process with a specified correlation time, using
+:func:`ar1_process`, which evaluates the recursion for all realizations
+with a single compiled filter.  Whitened seeing and transparency samples
+are then mapped to the historical MzLS distributions provided by
+:func:`desimodel.weather.get_seeing_pdf` and
+:func:`desimodel.weather.get_transp_pdf`.  The dome is closed when its
+whitened process falls below a threshold that reproduces the expected
+fraction of closed time for each night, which can be replayed from the
+historical Mayall weather using :func:`desimodel.weather.dome_closed_fractions`.
+"""
+from __future__ import print_function, division
+
+import numpy as np
+
+import scipy.signal
+import scipy.special
+
+import desiutil.log
+
+import desimodel.weather
+
+import desisurvey.config
+import desisurvey.utils
+
+
+def ar1_process(nsteps, rho, size=(), gen=None):
+    """Generate stationary Gaussian AR(1) time series.
+
+    Each series follows ``x[i] = rho * x[i-1] + sqrt(1 - rho ** 2) * eps[i]``
+    with independent unit Gaussian ``eps``, and starts from a unit Gaussian
+    value, so all samples have zero mean and unit variance.
+
+    Parameters
+    ----------
+    nsteps : int
+        Number of samples in each series.
+    rho : float
+        Correlation coefficient of consecutive samples, in the range [0,1).
+    size : int or tuple
+        Shape of independent series to generate.
+    gen : np.random.RandomState or None
+        Random number generator to use, or None for non-reproducible
+        random numbers.
+
+    Returns
+    -------
+    array
+        Array of shape size + (nsteps,).
+    """
+    if rho < 0 or rho >= 1:
+        raise ValueError('Expected 0 <= rho < 1.')
+    if gen is None:
+        gen = np.random.RandomState()
+    size = (size,) if np.isscalar(size) else tuple(size)
+    eps = gen.normal(size=size + (nsteps,))
+    # Initial state y[-1] that starts the process in its stationary distribution.
+    zi = rho * gen.normal(size=size + (1,))
+    return scipy.signal.lfilter(
+        [np.sqrt(1 - rho ** 2)], [1., -rho], eps, axis=-1, zi=zi)[0]
+
+
+def correlation_coefficient(time_step, correlation_time):
+    """Calculate the AR(1) correlation coefficient for a correlation time.
+
+    Parameters
+    ----------
+    time_step : float
+        Time between samples.
+    correlation_time : float
+        Exponential correlation time, in the same units as ``time_step``.
+
+    Returns
+    -------
+    float
+        Correlation coefficient of consecutive samples.
+    """
+    if correlation_time <= 0:
+        raise ValueError('Expected correlation_time > 0.')
+    return np.exp(-time_step / correlation_time)
+
+
+class Weather(object):
+    """Random observing conditions for many nights and realizations.
+
+    Conditions are sampled every ``time_step`` minutes, giving ``nsteps``
+    samples per night starting from local noon, and are stored in arrays
+    of shape (nrealizations, num_nights, nsteps).  Use :meth:`get` to look up
+    the conditions at arbitrary times.  Note that the memory required scales
+    with nrealizations * num_nights * nsteps.
+
+    Parameters
+    ----------
+    start_date : date or None
+        First night to generate.  Uses the ``first_day`` config
+        parameter when None.
+    stop_date : date or None
+        Generate nights before this date.  Uses the ``last_day`` config
+        parameter when None.
+    nrealizations : int
+        Number of independent realizations to generate.
+    time_step : float
+        Time between samples in minutes, which must divide 1 day evenly
+        so that each night starts on a sample.
+    seed : int or None
+        Random number seed to use, or None for non-reproducible conditions.
+    replay : str or None
+        Comma-separated list of years to replay for the nightly fraction
+        of dome-closed time, using
+        :func:`desimodel.weather.dome_closed_fractions`, or use the constant
+        ``dome_closed_fraction`` when None.
+    dome_closed_fraction : float
+        Fraction of time that the dome is closed when ``replay`` is None.
+    median_seeing : float
+        Median FWHM seeing in arcseconds.  See
+        :func:`desimodel.weather.get_seeing_pdf`.
+    seeing_time : float
+        Correlation time of seeing fluctuations in hours.
+    transparency_time : float
+        Correlation time of transparency fluctuations in hours.
+    dome_time : float
+        Correlation time of dome open/closed status in hours.
+    """
+    def __init__(self, start_date=None, stop_date=None, nrealizations=1, time_step=5.,
+                 seed=1, replay=None, dome_closed_fraction=0., median_seeing=1.1,
+                 seeing_time=1., transparency_time=3., dome_time=24.):
+        self.log = desiutil.log.get_logger()
+        config = desisurvey.config.Configuration()
+        if start_date is None:
+            start_date = config.first_day()
+        else:
+            start_date = desisurvey.utils.get_date(start_date)
+        if stop_date is None:
+            stop_date = config.last_day()
+        else:
+            stop_date = desisurvey.utils.get_date(stop_date)
+        self.num_nights = (stop_date - start_date).days
+        if self.num_nights <= 0:
+            raise ValueError('Expected start_date < stop_date.')
+        if time_step <= 0 or time_step > 24 * 60:
+            raise ValueError('Expected 0 < time_step <= 1 day.')
+        if (24 * 60) % time_step != 0:
+            raise ValueError(
+                'Expected time_step to divide 1 day (1440 minutes) evenly.')
+        self.start_date = start_date
+        self.stop_date = stop_date
+        self.nrealizations = nrealizations
+        self.nsteps = int(round(24 * 60 / time_step))
+        self.time_step = time_step
+        self.mjd0 = desisurvey.utils.local_noon_on_date(start_date).mjd
+        gen = np.random.RandomState(seed)
+        size = (nrealizations,)
+        nsamples = self.num_nights * self.nsteps
+        shape = (nrealizations, self.num_nights, self.nsteps)
+        dt = time_step / 60.
+        # Generate seeing with the historical distribution.
+        x, pdf = desimodel.weather.get_seeing_pdf(median_seeing)
+        white = ar1_process(nsamples, correlation_coefficient(dt, seeing_time), size, gen)
+        self.seeing = self._unwhiten(white, x, pdf).reshape(shape)
+        # Generate transparency with the historical distribution.
+        x, pdf = desimodel.weather.get_transp_pdf()
+        white = ar1_process(nsamples, correlation_coefficient(dt, transparency_time), size, gen)
+        self.transparency = self._unwhiten(white, x, pdf).reshape(shape)
+        # Generate the dome status with the expected closed fraction for each night.
+        if replay is not None:
+            closed = desimodel.weather.dome_closed_fractions(
+                start_date, stop_date, replay=replay)
+        else:
+            if dome_closed_fraction < 0 or dome_closed_fraction > 1:
+                raise ValueError('Expected 0 <= dome_closed_fraction <= 1.')
+            closed = np.full(self.num_nights, dome_closed_fraction)
+        threshold = scipy.special.ndtri(closed)[:, np.newaxis]
+        white = ar1_process(nsamples, correlation_coefficient(dt, dome_time), size, gen)
+        self.dome_open = white.reshape(shape) >= threshold
+        self.log.info(
+            'Generated {} realizations of {} nights with {} samples per night.'
+            .format(nrealizations, self.num_nights, self.nsteps))
+
+    @staticmethod
+    def _unwhiten(white, x, pdf, nsigma=6., ngrid=4097):
+        """Map whitened samples to a tabulated distribution.
+
+        The monotonic mapping is tabulated on a uniform grid of whitened
+        values, so it can be interpolated without searching.
+        """
+        cdf = np.cumsum(pdf)
+        cdf /= cdf[-1]
+        grid = np.linspace(-nsigma, nsigma, ngrid)
+        table = np.interp(scipy.special.ndtr(grid), cdf, x)
+        t = (np.clip(white, -nsigma, nsigma) + nsigma) * ((ngrid - 1) / (2 * nsigma))
+        i = np.minimum(t.astype(int), ngrid - 2)
+        t -= i
+        # Unwhiten in single precision to save memory.
+        lo = table[i].astype(np.float32)
+        return lo + t.astype(np.float32) * (table[i + 1].astype(np.float32) - lo)
+
+    def get(self, mjd, realization=0):
+        """Look up the conditions at specified times.
+
+        Uses the most recent sample at or before each time.  All inputs
+        are broadcast against each other.
+
+        Parameters
+        ----------
+        mjd : float or array
+            MJD value(s) to look up, which must be covered by our nights.
+        realization : int or array
+            Realization index(es) to look up.
+
+        Returns
+        -------
+        tuple
+            Tuple (seeing, transparency, dome_open) of values or arrays.
+        """
+        elapsed = np.asarray(mjd) - self.mjd0
+        night = np.floor(elapsed).astype(int)
+        if np.any((night < 0) | (night >= self.num_nights)):
+            raise ValueError('Some MJD values are not covered.')
+        step = np.minimum(
+            np.floor((elapsed - night) * 24 * 60 / self.time_step).astype(int),
+            self.nsteps - 1)
+        return (self.seeing[realization, night, step],
+                self.transparency[realization, night, step],
+                self.dome_open[realization, night, step])